@@ -4,19 +4,9 @@ Utils file for the FlagSearcher & backend.
 
 import json
 from pathlib import Path
-from shutil import copyfile
 from typing import List
 
-import requests
-from pydantic import BaseModel, validator
-
-# Only import cairosvg when needed for data preparation
-try:
-    import cairosvg
-
-    CAIROSVG_AVAILABLE = True
-except ImportError:
-    CAIROSVG_AVAILABLE = False
+from pydantic import BaseModel, field_validator
 
 
 class Flag(BaseModel):
@@ -34,14 +24,15 @@ class Flag(BaseModel):
     verification_method: str = ""
     score: float = 0.0
 
-    @validator("verification_method")
+    @field_validator("verification_method")
+    @classmethod
     def validate_my_field(cls, v):
         allowed_values = {"check_options", "commons", "table"}
         if v not in allowed_values:
             raise ValueError(f"Invalid 'verification_method'. Allowed values are: {allowed_values}")
         return v
 
-    def save_image(self, out_dir: Path) -> None:
+    def save_image(self, out_dir: Path) -> bool:
         """
         Save the wikipedia_image_url to a local path, and update the local_image_link
 
@@ -49,47 +40,10 @@ class Flag(BaseModel):
             had_to_download(bool) whether or not the file already existed. If it did not,
                 then we had to bother wikipedia so we should pause for a sec.
         """
-        if not CAIROSVG_AVAILABLE:
-            raise ImportError(
-                "cairosvg is required for save_image() but not available in production"
-            )
-
-        out_name = out_dir / f"{self.name}.png"
-        had_to_download = False
-        if not out_name.is_file():
-            suffix = self.wikipedia_image_url.split(".")[-1]
-            if self.local_image_link:
-                # TODO(bjafek) assert suffix in allowed_suffices
-                # TODO(bjafek) also feels like we could streamline this logic
-                if suffix in ("svg", "SVG"):
-                    # TODO(bjafek) just work through this a little more, svgs are tricky
-                    # with open(self.local_image_link, "r") as f:
-                    # svg = f.read()
-                    # out_name = out_dir / f"{self.name}.png"
-                    # cairosvg.svg2png(svg, write_to=str(out_name))
-                    raise NotImplementedError("I don't want to handle svgs yet!")
-                copyfile(self.local_image_link, out_dir / out_name)
-                return False
-
-            if suffix in ("svg", "SVG"):
-                out_name = out_dir / f"{self.name}.png"
-                svg = download_svg(self.wikipedia_image_url)
-                cairosvg.svg2png(svg, write_to=str(out_name))
-            elif suffix in ("png", "PNG"):
-                out_name = out_dir / f"{self.name}.png"
-                download_image(self.wikipedia_image_url, out_name)
-            elif suffix in ("gif", "GIF"):
-                out_name = out_dir / f"{self.name}.gif"
-                download_image(self.wikipedia_image_url, out_name)
-            elif suffix in ("jpg", "jpeg", "JPG", "JPEG"):
-                out_name = out_dir / f"{self.name}.jpg"
-                download_image(self.wikipedia_image_url, out_name)
-            else:
-                raise NotImplementedError(f"We can't yet handle the suffix '{suffix}' you gave us!")
-            had_to_download = True
-        self.local_image_link = str(out_name)
-
-        return had_to_download
+        # Imported here so serving, which never downloads, doesn't pay for requests/cairosvg
+        from .flag_download import save_image
+
+        return save_image(self, out_dir)
 
     def to_json(self, out_dir: Path) -> None:
         """
@@ -156,36 +110,3 @@ class Image(BaseModel):
     """
 
     data: str
-
-
-def download_image(image_url: str, out_name: Path) -> None:
-    """
-    Download a jpg/png file from the internet, save it to 'out_name'
-    """
-    img_data = requests.get(image_url).content
-    with out_name.open("wb") as f:
-        f.write(img_data)
-
-
-def download_svg(url: str) -> None:
-    """
-    Downloads an SVG file from the given URL and saves it with the specified filename.
-    https://foundation.wikimedia.org/wiki/Policy:Wikimedia_Foundation_User-Agent_Policy
-
-    Args:
-    url: The URL of the SVG file.
-    filename: The filename to save the downloaded SVG file.
-    """
-    try:
-        response = requests.get(
-            url,
-            stream=True,
-            headers={
-                "User-Agent": "DrawFlags/0.0 (https://github.com/jafekb/draw_flags/"
-                "; jafek91@gmail.com)"
-            },
-        )
-        response.raise_for_status()
-        return response.text
-    except requests.exceptions.RequestException as e:
-        print(f"Error downloading SVG: {e}")
@@ -0,0 +1,100 @@
+"""
+Downloading flag images, for preparing the data (see data_mining/). The
+server never needs this, so requests and cairosvg stay out of its imports:
+Flag.save_image imports this module when it's first called.
+"""
+
+from pathlib import Path
+from shutil import copyfile
+
+import requests
+
+# Only import cairosvg when needed for data preparation
+try:
+    import cairosvg
+
+    CAIROSVG_AVAILABLE = True
+except ImportError:
+    CAIROSVG_AVAILABLE = False
+
+
+def save_image(flag, out_dir: Path) -> bool:
+    """
+    Save the flag's wikipedia_image_url to a local path, and update its local_image_link
+
+    Returns:
+        had_to_download(bool) whether or not the file already existed. If it did not,
+            then we had to bother wikipedia so we should pause for a sec.
+    """
+    if not CAIROSVG_AVAILABLE:
+        raise ImportError("cairosvg is required for save_image() but not available in production")
+
+    out_name = out_dir / f"{flag.name}.png"
+    had_to_download = False
+    if not out_name.is_file():
+        suffix = flag.wikipedia_image_url.split(".")[-1]
+        if flag.local_image_link:
+            # TODO(bjafek) assert suffix in allowed_suffices
+            # TODO(bjafek) also feels like we could streamline this logic
+            if suffix in ("svg", "SVG"):
+                # TODO(bjafek) just work through this a little more, svgs are tricky
+                # with open(flag.local_image_link, "r") as f:
+                # svg = f.read()
+                # out_name = out_dir / f"{flag.name}.png"
+                # cairosvg.svg2png(svg, write_to=str(out_name))
+                raise NotImplementedError("I don't want to handle svgs yet!")
+            copyfile(flag.local_image_link, out_dir / out_name)
+            return False
+
+        if suffix in ("svg", "SVG"):
+            out_name = out_dir / f"{flag.name}.png"
+            svg = download_svg(flag.wikipedia_image_url)
+            cairosvg.svg2png(svg, write_to=str(out_name))
+        elif suffix in ("png", "PNG"):
+            out_name = out_dir / f"{flag.name}.png"
+            download_image(flag.wikipedia_image_url, out_name)
+        elif suffix in ("gif", "GIF"):
+            out_name = out_dir / f"{flag.name}.gif"
+            download_image(flag.wikipedia_image_url, out_name)
+        elif suffix in ("jpg", "jpeg", "JPG", "JPEG"):
+            out_name = out_dir / f"{flag.name}.jpg"
+            download_image(flag.wikipedia_image_url, out_name)
+        else:
+            raise NotImplementedError(f"We can't yet handle the suffix '{suffix}' you gave us!")
+        had_to_download = True
+    flag.local_image_link = str(out_name)
+
+    return had_to_download
+
+
+def download_image(image_url: str, out_name: Path) -> None:
+    """
+    Download a jpg/png file from the internet, save it to 'out_name'
+    """
+    img_data = requests.get(image_url).content
+    with out_name.open("wb") as f:
+        f.write(img_data)
+
+
+def download_svg(url: str) -> None:
+    """
+    Downloads an SVG file from the given URL and saves it with the specified filename.
+    https://foundation.wikimedia.org/wiki/Policy:Wikimedia_Foundation_User-Agent_Policy
+
+    Args:
+    url: The URL of the SVG file.
+    filename: The filename to save the downloaded SVG file.
+    """
+    try:
+        response = requests.get(
+            url,
+            stream=True,
+            headers={
+                "User-Agent": "DrawFlags/0.0 (https://github.com/jafekb/draw_flags/"
+                "; jafek91@gmail.com)"
+            },
+        )
+        response.raise_for_status()
+        return response.text
+    except requests.exceptions.RequestException as e:
+        print(f"Error downloading SVG: {e}")
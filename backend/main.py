@@ -1,13 +1,213 @@
-import uvicorn
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import List
+
+from backend.src.cpu_budget import configure_blas_threads, cpu_budget, worker_cpu_budget
+
+# Run as a script, the server forks this many workers after loading the flags once, see
+# backend/src/prefork.py
+WORKERS = int(os.environ.get("WORKERS", "1"))
+
+# Size every thread pool from the CPUs this container actually gets (cgroup quota and
+# affinity mask), not the host's core count. The BLAS variables are read when numpy is
+# first imported, so this has to come before the imports below. CPU_BUDGET overrides the
+# detected count, and BLAS variables that are already set are left alone. Workers split
+# the budget between them.
+CPU_BUDGET = cpu_budget()
+if WORKERS > 1:
+    CPU_BUDGET = worker_cpu_budget(CPU_BUDGET, WORKERS)
+# The parallel scan runs its own threads, each BLAS call in them should stay on one
+PARALLEL_SCAN = os.environ.get("SEARCH_INDEX") == "parallel"
+BLAS_THREADS = configure_blas_threads(1 if PARALLEL_SCAN else CPU_BUDGET.cpus)
+
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, HTTPException, Request, Response  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from backend.common.flag_data import FlagList  # noqa: E402
+from backend.src.admission import AdmissionControl, ClientDisconnectedError, OverloadedError  # noqa: E402
+from backend.src.embedding_cache import normalize_query  # noqa: E402
+from backend.src.flag_index import IndexConfig  # noqa: E402
+from backend.src.flag_searcher import FlagSearcher  # noqa: E402
+from backend.src.micro_batcher import MicroBatcher  # noqa: E402
+from backend.src.onnx_session import SessionConfig  # noqa: E402
+from backend.src.prefork import serve  # noqa: E402
+from backend.src.readiness import Readiness  # noqa: E402
+from backend.src.response_cache import ResponseCache  # noqa: E402
+from backend.src.single_flight import SingleFlight  # noqa: E402
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load in the background, so the server is up and /health can report progress meanwhile
+    threading.Thread(target=ensure_loaded, name="flag-startup", daemon=True).start()
+    yield
+    if query_executor is not None:
+        query_executor.shutdown(wait=False)
 
-from backend.common.flag_data import FlagList
-from backend.src.flag_searcher import FlagSearcher
 
 # TODO(bjafek) remove the debug eventually
-app = FastAPI(debug=True)
-flag_searcher = FlagSearcher(top_k=8)
+app = FastAPI(debug=True, lifespan=lifespan)
+# Query embeddings are cached on disk, shared by all workers and kept across restarts.
+# Set QUERY_CACHE_PATH to an empty string to turn that off.
+QUERY_CACHE_PATH = os.environ.get("QUERY_CACHE_PATH", "backend/cache/query_embeddings.sqlite")
+# ONNX Runtime settings. Thread counts of 0 mean one per CPU in CPU_BUDGET (a pooled
+# session gets 1 intra-op thread instead, see below). Inter-op threads default to 1, in
+# the parallel execution mode each runs its own intra-op threads. The optimized graph is saved to
+# ORT_OPTIMIZED_MODEL_DIR on the first start, later starts load it directly (empty string
+# turns that off).
+session_config = SessionConfig(
+    graph_optimization_level=os.environ.get("ORT_OPTIMIZATION_LEVEL", "all"),
+    intra_op_threads=int(os.environ.get("ORT_INTRA_OP_THREADS", "0")),
+    inter_op_threads=int(os.environ.get("ORT_INTER_OP_THREADS", "1")),
+    enable_cpu_mem_arena=os.environ.get("ORT_CPU_MEM_ARENA", "1") == "1",
+    execution_mode=os.environ.get("ORT_EXECUTION_MODE", "sequential"),
+    optimized_model_dir=os.environ.get("ORT_OPTIMIZED_MODEL_DIR", "backend/cache/ort") or None,
+)
+# Which text encoder to run, "fp32" or the quantized "int8" (see backend/scripts/).
+MODEL_VARIANT = os.environ.get("MODEL_VARIANT", "fp32")
+# Unset, every request shares one ONNX session. A number makes a pool of that many sessions
+# (ORT_INTRA_OP_THREADS each, 1 if unset) that requests lease, 0 sizes it from the CPU count.
+SESSION_POOL_SIZE = os.environ.get("ORT_SESSION_POOL_SIZE", "")
+# "exact" scores every flag. "int8" / "float16" scan a compact copy of the embeddings for
+# SEARCH_CANDIDATES candidates per query and re-rank those exactly. "ivf" searches the
+# SEARCH_N_PROBE closest clusters of the index built by backend/scripts/build_ivf_index.py.
+# "pca" scans SEARCH_PCA_DIMS principal components (backend/scripts/build_pca_index.py).
+# "parallel" is exact, scanned in blocks on SEARCH_SCAN_THREADS threads (0 is the CPU budget).
+index_config = IndexConfig(
+    kind=os.environ.get("SEARCH_INDEX", "exact"),
+    candidates=int(os.environ.get("SEARCH_CANDIDATES", "64")),
+    n_probe=int(os.environ.get("SEARCH_N_PROBE", "8")),
+    pca_dims=int(os.environ.get("SEARCH_PCA_DIMS", "0")),
+    scan_threads=int(os.environ.get("SEARCH_SCAN_THREADS", "0")),
+)
+# A flag bundle made by backend/scripts/build_flag_bundle.py, memory-mapped instead of
+# parsing flags.json. Empty (the default) reads flags.json.
+FLAG_BUNDLE = os.environ.get("FLAG_BUNDLE", "")
+
+# Queries arriving within BATCH_WINDOW_MS of each other share one ONNX run.
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "1.0"))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "16"))
+# Warmup runs every length bucket at these batch sizes, the shapes traffic will bring
+WARMUP_BATCH_SIZES = sorted({1, MAX_BATCH_SIZE})
+# At most MAX_CONCURRENT_BATCHES batches run ONNX at once (0 is one per query thread).
+# At most MAX_QUEUED_REQUESTS requests wait for or run inference, the next gets a 503.
+MAX_CONCURRENT_BATCHES = int(os.environ.get("MAX_CONCURRENT_BATCHES", "0"))
+MAX_QUEUED_REQUESTS = int(os.environ.get("MAX_QUEUED_REQUESTS", "256"))
+
+# Everything below is made by load(), which the lifespan hook starts in the background.
+# Until it's done, /ready says so and queries get a 503.
+readiness = Readiness()
+_load_lock = threading.Lock()
+flag_searcher = None
+query_executor = None
+THREAD_CONFIG = None
+batcher = None
+response_cache = None
+
+
+def load_shared():
+    """
+    The read-only part of load(): the flags, their embeddings and the index,
+    without any ONNX sessions. With WORKERS, this runs once before the fork
+    and the workers share it.
+    """
+    global flag_searcher
+    flag_searcher = FlagSearcher(
+        top_k=8,
+        disk_cache_path=QUERY_CACHE_PATH or None,
+        session_config=session_config,
+        model_variant=MODEL_VARIANT,
+        session_pool_size=int(SESSION_POOL_SIZE) if SESSION_POOL_SIZE else None,
+        index_config=index_config,
+        bundle_dir=FLAG_BUNDLE or None,
+        start_sessions=False,
+    )
+
+
+def load():
+    """Load the model and the flags (unless load_shared() already did), then warm them up"""
+    global query_executor, THREAD_CONFIG, batcher, response_cache
+    if flag_searcher is None:
+        load_shared()
+    flag_searcher.start_sessions()
+
+    # ONNX inference blocks, so it runs on a bounded pool instead of the event loop.
+    # There's a thread for every pooled session, so none of them sit idle.
+    query_workers = min(4, CPU_BUDGET.cpus)
+    if flag_searcher.session_pool is not None:
+        query_workers = max(query_workers, flag_searcher.session_pool.size)
+    query_executor = ThreadPoolExecutor(max_workers=query_workers, thread_name_prefix="flag-query")
+
+    THREAD_CONFIG = {
+        **flag_searcher.thread_config,
+        "query_threads": query_workers,
+        "blas_threads": BLAS_THREADS["OMP_NUM_THREADS"],
+    }
+    print(f"CPU budget: {CPU_BUDGET.model_dump()}, threads: {THREAD_CONFIG}")
+
+    # Responses come back already serialized, spliced from each flag's pre-serialized JSON.
+    batcher = MicroBatcher(
+        flag_searcher,
+        query_executor,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait_ms=BATCH_WINDOW_MS,
+        json_responses=True,
+        max_concurrent_batches=MAX_CONCURRENT_BATCHES or query_workers,
+    )
+
+    # Whole responses to POST / are cached, keyed by query, top_k and dataset version.
+    # The cache drops itself when flags.json or the embeddings file changes.
+    response_cache = ResponseCache(
+        flag_searcher.dataset_files,
+        max_entries=int(os.environ.get("RESPONSE_CACHE_ENTRIES", "10000")),
+        ttl_s=float(os.environ.get("RESPONSE_CACHE_TTL_S", "3600")),
+    )
+
+    readiness.advance("warming")
+    # On every query thread, where the requests will run
+    warmup_s = flag_searcher.warmup_threads(
+        query_executor, query_workers, batch_sizes=WARMUP_BATCH_SIZES
+    )
+    readiness.advance("ready", warmup_s=warmup_s)
+    print(f"Ready: {readiness.to_dict()}")
+
+
+def ensure_loaded():
+    """Run load() if it hasn't run yet, or wait for it. Raises if startup failed."""
+    with _load_lock:
+        if readiness.phase == "loading":
+            try:
+                load()
+            except Exception as e:
+                readiness.fail(e)
+                raise
+    if readiness.phase == "failed":
+        raise RuntimeError(f"Startup failed: {readiness.error}")
+
+
+def _require_ready():
+    """Queries get a 503 until startup is done, instead of waiting on it"""
+    if not readiness.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Not ready yet, {readiness.phase}",
+            headers={"Retry-After": "1"},
+        )
+
+
+# Identical queries that arrive while one is already running wait for that one.
+single_flight = SingleFlight()
+# Bounds the requests waiting on inference, and cancels the ones whose client left.
+admission = AdmissionControl(MAX_QUEUED_REQUESTS)
+
+# Cap on how many descriptions one POST /batch can send, they all go through one ONNX run.
+MAX_BATCH_QUERIES = int(os.environ.get("MAX_BATCH_QUERIES", "512"))
 
 origins = [
     "http://localhost:5173",
@@ -28,9 +228,87 @@ app.add_middleware(
 # TODO(bjafek) this isn't 'adding a flag', it's querying based on text
 @app.post("/", response_model=FlagList)
 async def add_flag(text_query: Request):
+    _require_ready()
     data = await text_query.json()  # Get the JSON data
-    flags = flag_searcher.query(data["text_query"], is_image=False)
-    return flags
+    query = normalize_query(data["text_query"])
+
+    body = response_cache.get(query, flag_searcher.top_k)
+    if body is None:
+        body = await _admitted(
+            text_query,
+            partial(
+                single_flight.run,
+                (query, flag_searcher.top_k),
+                partial(_search, data["text_query"], query),
+            ),
+        )
+    return Response(content=body, media_type="application/json")
+
+
+async def _admitted(request, make_coroutine):
+    """
+    Await `make_coroutine()` if there's room in the queue, a 503 right away
+    if there isn't. Cancelled if the client disconnects meanwhile.
+    """
+    try:
+        with admission.admit():
+            return await admission.until_disconnect(request.receive, make_coroutine())
+    except OverloadedError as e:
+        raise HTTPException(
+            status_code=503, detail=f"Overloaded, {e}", headers={"Retry-After": "1"}
+        ) from e
+
+
+@app.exception_handler(ClientDisconnectedError)
+async def client_disconnected(request, exc):
+    # Nobody's there to read it, this is for the access log (nginx's "client closed request")
+    return Response(status_code=499)
+
+
+async def _search(text_query, query):
+    """Run the query through the batcher, cache and return the serialized response"""
+    body = await batcher.query(text_query)
+    response_cache.put(query, flag_searcher.top_k, body)
+    return body
+
+
+@app.post("/batch", response_model=List[FlagList])
+async def query_batch(text_queries: Request):
+    _require_ready()
+    data = await text_queries.json()
+    texts = data.get("text_queries") if isinstance(data, dict) else None
+    # A bare string would otherwise be taken as one query per character
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise HTTPException(
+            status_code=422, detail='Expected {"text_queries": [...]}, a list of strings'
+        )
+    if len(texts) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BATCH_QUERIES} text_queries per request, got {len(texts)}",
+        )
+    top_k = data.get("top_k")
+    # bool is an int too, but not a count
+    if top_k is not None and (
+        not isinstance(top_k, int)
+        or isinstance(top_k, bool)
+        or not 1 <= top_k <= flag_searcher.n_flags
+    ):
+        raise HTTPException(
+            status_code=422,
+            detail=f"top_k must be a whole number from 1 to {flag_searcher.n_flags}, not {top_k!r}",
+        )
+
+    loop = asyncio.get_running_loop()
+    bodies = await _admitted(
+        text_queries,
+        partial(
+            loop.run_in_executor,
+            query_executor,
+            partial(flag_searcher.query_batch_json, texts, top_k=top_k),
+        ),
+    )
+    return Response(content=b"[" + b",".join(bodies) + b"]", media_type="application/json")
 
 
 @app.get("/flags")
@@ -42,5 +320,42 @@ async def flags_info():
     }
 
 
+@app.get("/health")
+async def health():
+    """Liveness: 200 while loading, warming or ready, 503 only if startup failed"""
+    status_code = 503 if readiness.phase == "failed" else 200
+    return JSONResponse(readiness.to_dict(), status_code=status_code)
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the model is loaded and warm, 503 until then"""
+    return JSONResponse(readiness.to_dict(), status_code=200 if readiness.ready else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    if not readiness.ready:
+        return {"cpu_budget": CPU_BUDGET.model_dump(), "readiness": readiness.to_dict()}
+    return {
+        "cpu_budget": CPU_BUDGET.model_dump(),
+        "readiness": readiness.to_dict(),
+        "threads": THREAD_CONFIG,
+        "index": flag_searcher.index_config.model_dump(),
+        "batcher": batcher.stats.to_dict(),
+        "embedding_cache": flag_searcher.embedding_cache.to_dict(),
+        "disk_cache": flag_searcher.disk_cache.to_dict() if flag_searcher.disk_cache else None,
+        "response_cache": response_cache.to_dict(),
+        "single_flight": single_flight.to_dict(),
+        "admission": admission.to_dict(),
+        "session_pool": (
+            flag_searcher.session_pool.to_dict() if flag_searcher.session_pool else None
+        ),
+    }
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if WORKERS > 1:
+        serve(app, WORKERS, host="0.0.0.0", port=8000, preload=load_shared)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
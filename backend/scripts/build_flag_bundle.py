@@ -0,0 +1,68 @@
+"""
+Pack a flag catalog (FlagList JSON plus its .npy embeddings) into a
+memory-mapped bundle (see backend/src/flag_bundle.py), saved next to
+flags.json, which the server loads when FLAG_BUNDLE points at it.
+
+Run from the repo root, and again whenever flags.json or the embeddings change:
+    python backend/scripts/build_flag_bundle.py
+    python backend/scripts/build_flag_bundle.py \\
+        --flags-file backend/data/commons_plus_national/flags.json --embeddings embeddings.npy
+
+--embeddings is for catalogs whose flags.json points at a file that isn't
+there (commons_plus_national has an absolute .pt path from the machine it
+was made on). .pt files have to be converted to .npy first, see
+backend/tests/convert_torch_to_numpy.py.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import flaglist_from_json
+from backend.src.flag_bundle import BUNDLE_DIRNAME, write_bundle
+from backend.src.flag_searcher import FLAGS_FILE
+
+
+def main(flags_file, embeddings_filename, out_dir):
+    flag_list = flaglist_from_json(flags_file)
+    embeddings_filename = Path(embeddings_filename or flag_list.embeddings_filename)
+    if embeddings_filename.suffix != ".npy":
+        raise ValueError(
+            f"{embeddings_filename} isn't a .npy file. Convert it first "
+            "(backend/tests/convert_torch_to_numpy.py) and pass it with --embeddings."
+        )
+    if not embeddings_filename.is_file():
+        raise FileNotFoundError(
+            f"No embeddings at {embeddings_filename}, pass the right file with --embeddings"
+        )
+    embeddings = np.load(embeddings_filename, mmap_mode="r")
+    out_dir = out_dir or Path(flags_file).parent / BUNDLE_DIRNAME
+
+    start = time.time()
+    write_bundle(
+        flag_list,
+        embeddings,
+        out_dir,
+        sources={"flags": flags_file, "embeddings": embeddings_filename},
+    )
+    print(f"Packed {len(embeddings)} flags in {time.time() - start:.1f}s, saved to {out_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--flags-file", type=Path, default=FLAGS_FILE)
+    parser.add_argument(
+        "--embeddings", type=Path, default=None, help="default: the file flags.json names"
+    )
+    parser.add_argument(
+        "--out-dir", type=Path, default=None, help=f"default: {BUNDLE_DIRNAME}/ next to flags.json"
+    )
+    args = parser.parse_args()
+    main(args.flags_file, args.embeddings, args.out_dir)
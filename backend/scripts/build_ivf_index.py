@@ -0,0 +1,61 @@
+"""
+Build the IVF index for a flag catalog (see backend/src/ivf_index.py) and
+save it next to its flags.json, where FlagSearcher looks for it when
+SEARCH_INDEX=ivf.
+
+Run from the repo root, and again whenever the embeddings change:
+    python backend/scripts/build_ivf_index.py
+    python backend/scripts/build_ivf_index.py --pq-subvectors 64
+"""
+
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import flaglist_from_json
+from backend.src.flag_searcher import FLAGS_FILE
+from backend.src.ivf_index import IVF_INDEX_DIRNAME, build_ivf_index, save_ivf_index
+
+
+def default_n_lists(n_rows):
+    """The usual rule of thumb, about 4 * sqrt(rows) clusters"""
+    return max(1, int(4 * math.sqrt(n_rows)))
+
+
+def main(flags_file, n_lists, pq_subvectors, seed):
+    embeddings_filename = flaglist_from_json(flags_file).embeddings_filename
+    embeddings = np.load(embeddings_filename, mmap_mode="r")
+    n_lists = n_lists or default_n_lists(len(embeddings))
+
+    start = time.time()
+    arrays = build_ivf_index(embeddings, n_lists, pq_subvectors=pq_subvectors, seed=seed)
+    out_dir = Path(flags_file).parent / IVF_INDEX_DIRNAME
+    save_ivf_index(arrays, out_dir, embeddings_filename)
+    print(
+        f"Built a {n_lists}-list index"
+        f"{f' with {pq_subvectors} PQ subvectors' if pq_subvectors else ''}"
+        f" for {len(embeddings)} flags in {time.time() - start:.1f}s, saved to {out_dir}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--flags-file", type=Path, default=FLAGS_FILE)
+    parser.add_argument(
+        "--n-lists", type=int, default=0, help="k-means clusters, default 4 * sqrt(flags)"
+    )
+    parser.add_argument(
+        "--pq-subvectors",
+        type=int,
+        default=0,
+        help="store each flag as this many one-byte PQ codes, 0 (default) keeps full vectors",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.flags_file, args.n_lists, args.pq_subvectors, args.seed)
@@ -0,0 +1,48 @@
+"""
+Fit the PCA projection for a flag catalog's embeddings (see
+backend/src/pca_index.py), and save it with the projected flags next to
+embeddings.npy, where FlagSearcher looks for it when SEARCH_INDEX=pca.
+
+Run from the repo root, and again whenever the embeddings change:
+    python backend/scripts/build_pca_index.py --dims 64
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import flaglist_from_json
+from backend.src.flag_searcher import FLAGS_FILE
+from backend.src.pca_index import PCA_INDEX_DIRNAME, fit_pca, save_pca_index
+
+
+def main(flags_file, dims):
+    embeddings_filename = flaglist_from_json(flags_file).embeddings_filename
+    embeddings = np.load(embeddings_filename, mmap_mode="r")
+
+    start = time.time()
+    arrays = fit_pca(embeddings, dims)
+    out_dir = Path(embeddings_filename).parent / PCA_INDEX_DIRNAME
+    save_pca_index(arrays, out_dir, embeddings_filename)
+    print(
+        f"Fitted {dims} components ({100 * float(arrays['explained_variance']):.1f}% of the"
+        f" variance) for {len(embeddings)} flags in {time.time() - start:.1f}s, saved to {out_dir}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--flags-file", type=Path, default=FLAGS_FILE)
+    parser.add_argument(
+        "--dims",
+        type=int,
+        default=64,
+        help="components to keep; the server can use fewer (SEARCH_PCA_DIMS), not more",
+    )
+    args = parser.parse_args()
+    main(args.flags_file, args.dims)
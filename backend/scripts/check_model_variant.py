@@ -0,0 +1,65 @@
+"""
+Check a text encoder variant (e.g. the int8 model) against the fp32 one before
+it gets used: cosine similarity of the embeddings, and top-k overlap on the
+flags, for a fixed set of queries. Writes the report next to the variant.
+
+Run from the repo root:
+    python backend/scripts/check_model_variant.py int8
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import flaglist_from_json
+from backend.src.embedding_cache import file_fingerprint
+from backend.src.flag_searcher import FLAGS_FILE, MODEL_VARIANTS, normalize_rows
+from backend.src.minimal_tokenizer import create_minimal_tokenizer
+from backend.src.model_quality import CHECK_QUERIES, evaluate, save_report
+from backend.src.onnx_session import create_session
+
+
+def encode(session, tokenizer, texts):
+    inputs = tokenizer(texts)
+    outputs = session.run(
+        None, {"input_ids": inputs["input_ids"], "attention_mask": inputs["attention_mask"]}
+    )
+    return normalize_rows(outputs[0])
+
+
+def check_model_variant(variant, top_k):
+    reference_path = MODEL_VARIANTS["fp32"]
+    model_path = MODEL_VARIANTS[variant]
+    tokenizer = create_minimal_tokenizer()
+
+    reference = encode(create_session(reference_path), tokenizer, CHECK_QUERIES)
+    candidate = encode(create_session(model_path), tokenizer, CHECK_QUERIES)
+    flag_embeddings = normalize_rows(np.load(flaglist_from_json(FLAGS_FILE).embeddings_filename))
+
+    report = evaluate(
+        reference,
+        candidate,
+        flag_embeddings,
+        top_k,
+        model_sha256=file_fingerprint(model_path),
+        reference_sha256=file_fingerprint(reference_path),
+    )
+    out_name = save_report(report, model_path)
+
+    print(f"Mean cosine similarity to fp32: {report.mean_cosine:.4f}")
+    print(f"Min cosine similarity to fp32: {report.min_cosine:.4f}")
+    print(f"Mean top-{top_k} overlap with fp32: {report.mean_top_k_overlap:.2f}")
+    print(f"{'PASSED' if report.passed else 'FAILED'}, report saved to {out_name}")
+    return report.passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("variant", choices=[v for v in MODEL_VARIANTS if v != "fp32"])
+    parser.add_argument("--top-k", type=int, default=8)
+    args = parser.parse_args()
+    sys.exit(0 if check_model_variant(args.variant, args.top_k) else 1)
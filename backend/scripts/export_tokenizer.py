@@ -0,0 +1,33 @@
+"""
+Save the CLIP tokenizer to backend/models/ so the backend can load it from
+disk, instead of downloading it from the Hugging Face hub at every start.
+
+Only needs re-running if we change CLIP models.
+"""
+
+from pathlib import Path
+
+from tokenizers import Tokenizer
+
+HUB_NAME = "openai/clip-vit-base-patch32"
+TOKENIZER_PATH = Path("backend/models/clip-tokenizer.json")
+
+
+def export_tokenizer():
+    tokenizer = Tokenizer.from_pretrained(HUB_NAME)
+    # Padding and truncation get set up at load time, keep the saved file plain
+    tokenizer.no_padding()
+    tokenizer.no_truncation()
+    tokenizer.save(str(TOKENIZER_PATH))
+
+    # Make sure it round-trips
+    reloaded = Tokenizer.from_file(str(TOKENIZER_PATH))
+    test_text = "red and white stripes"
+    assert reloaded.encode(test_text).ids == tokenizer.encode(test_text).ids
+
+    print(f"Tokenizer saved to {TOKENIZER_PATH}")
+    print(f"Size: {TOKENIZER_PATH.stat().st_size / (1024 * 1024):.2f} MB")
+
+
+if __name__ == "__main__":
+    export_tokenizer()
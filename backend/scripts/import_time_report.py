@@ -0,0 +1,42 @@
+"""
+Report how long the server's imports take (the modules backend/main.py
+imports, in a fresh interpreter under `python -X importtime`), and whether
+any data-preparation packages got pulled in with them.
+
+Run from the repo root:
+    python backend/scripts/import_time_report.py
+    python backend/scripts/import_time_report.py --module backend.src.flag_bundle
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.import_time import (
+    DATA_PREP_MODULES,
+    format_report,
+    measure_imports,
+    serving_imports,
+)
+
+
+def main(extra_modules, top):
+    timings = measure_imports(serving_imports() + extra_modules)
+    print(format_report(timings, top=top))
+    data_prep = [
+        timing.name for timing in timings if timing.name.split(".")[0] in DATA_PREP_MODULES
+    ]
+    if data_prep:
+        print(f"\nWarning: serving imports data preparation modules: {', '.join(data_prep)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--module", action="append", default=[], help="also import this module, can be repeated"
+    )
+    parser.add_argument("--top", type=int, default=25, help="how many modules to list")
+    args = parser.parse_args()
+    main(args.module, args.top)
@@ -0,0 +1,91 @@
+"""
+Admission control in front of inference.
+
+Past capacity, queueing more requests only makes every one of them slower,
+and a client that has given up still gets its query computed. So at most
+`max_queue` requests wait for (or run) inference at once, and the next one
+is turned away immediately, with a 503 and Retry-After so the client or the
+load balancer tries again later or elsewhere. A request whose client
+disconnects is cancelled, which drops its query before it reaches ONNX.
+"""
+
+import asyncio
+from contextlib import contextmanager
+
+
+class OverloadedError(Exception):
+    """The queue is full"""
+
+
+class ClientDisconnectedError(Exception):
+    """The client went away before its response was ready"""
+
+
+async def _wait_for_disconnect(receive):
+    """Return once the ASGI `receive` reports the client disconnected"""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+class AdmissionControl:
+    """
+    Counts the requests between admit() and their response, rejecting
+    any past `max_queue`, and cancels the ones whose client leaves. All of
+    it runs on the event loop, so there's no locking.
+    """
+
+    def __init__(self, max_queue):
+        if max_queue < 1:
+            raise ValueError(f"max_queue must be at least 1, got {max_queue}")
+        self.max_queue = max_queue
+        self.depth = 0
+        self.max_depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.disconnected = 0
+
+    @contextmanager
+    def admit(self):
+        """Hold a place in the queue for the with block, raises OverloadedError if there's none"""
+        if self.depth >= self.max_queue:
+            self.rejected += 1
+            raise OverloadedError(f"{self.depth} requests are already queued")
+        self.depth += 1
+        self.admitted += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        try:
+            yield
+        finally:
+            self.depth -= 1
+
+    async def until_disconnect(self, receive, coroutine):
+        """
+        Await `coroutine`, or cancel it and raise ClientDisconnectedError if the
+        client disconnects first. `receive` is the request's ASGI receive,
+        called once the request body has been read.
+        """
+        work = asyncio.ensure_future(coroutine)
+        watcher = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            work.cancel()
+            raise
+        finally:
+            watcher.cancel()
+
+        if not work.done():
+            work.cancel()
+            self.disconnected += 1
+            raise ClientDisconnectedError()
+        return work.result()
+
+    def to_dict(self):
+        return {
+            "max_queue": self.max_queue,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "disconnected": self.disconnected,
+        }
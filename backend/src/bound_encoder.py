@@ -0,0 +1,130 @@
+"""
+Allocation-free text encoding through ONNX Runtime IOBinding.
+
+Every length bucket gets its own preallocated input and output buffers. The
+tokenizer writes ids straight into them, ONNX Runtime writes the embeddings
+straight into the output buffer, and the normalization happens in place. In
+steady state a query doesn't allocate any new arrays.
+"""
+
+import threading
+
+import numpy as np
+
+from backend.src.minimal_tokenizer import PAD_TOKEN_ID, bucket_length
+
+# Used to find out the embedding size when the model doesn't say
+_PROBE_TEXT = "a flag"
+
+
+class _BucketBuffers:
+    """Input/output buffers and an IOBinding for one length bucket"""
+
+    def __init__(self, session, max_batch_size, length, embedding_dim):
+        self.input_ids = np.full((max_batch_size, length), PAD_TOKEN_ID, dtype=np.int64)
+        self.attention_mask = np.zeros((max_batch_size, length), dtype=np.int64)
+        self.output = np.zeros((max_batch_size, embedding_dim), dtype=np.float32)
+        self.binding = session.io_binding()
+
+
+class BoundTextEncoder:
+    """
+    Runs the text encoder with preallocated, IOBinding-bound buffers.
+
+    Buffers are per thread (queries run on a thread pool) and per length
+    bucket, and get created the first time a thread needs them.
+
+    The array `encode` returns is a view into this thread's buffers: it's
+    only good until the same thread calls `encode` again, so copy anything
+    that needs to stick around.
+    """
+
+    def __init__(self, session, tokenizer, max_batch_size=64):
+        self._session = session
+        self._tokenizer = tokenizer
+        self._max_batch_size = max_batch_size
+        self._output_name = session.get_outputs()[0].name
+        self._local = threading.local()
+
+        embedding_dim = session.get_outputs()[0].shape[-1]
+        if not isinstance(embedding_dim, int):
+            inputs = tokenizer(_PROBE_TEXT)
+            embedding_dim = session.run(None, inputs)[0].shape[-1]
+        self.embedding_dim = embedding_dim
+
+    def _thread_buffers(self):
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+            self._local.result = np.zeros(
+                (self._max_batch_size, self.embedding_dim), dtype=np.float32
+            )
+            self._local.norms = np.zeros((self._max_batch_size, 1), dtype=np.float32)
+        return buffers
+
+    def _bucket_buffers(self, length):
+        buffers = self._thread_buffers()
+        if length not in buffers:
+            buffers[length] = _BucketBuffers(
+                self._session, self._max_batch_size, length, self.embedding_dim
+            )
+        return buffers[length]
+
+    def _run_bucket(self, length, encodings):
+        """Write `encodings` into the bucket's buffers and run the model on them"""
+        buffers = self._bucket_buffers(length)
+        n_rows = len(encodings)
+        self._tokenizer.write_into(encodings, buffers.input_ids, buffers.attention_mask)
+
+        binding = buffers.binding
+        for name, array in (
+            ("input_ids", buffers.input_ids),
+            ("attention_mask", buffers.attention_mask),
+        ):
+            binding.bind_input(name, "cpu", 0, np.int64, [n_rows, length], array.ctypes.data)
+        binding.bind_output(
+            self._output_name,
+            "cpu",
+            0,
+            np.float32,
+            [n_rows, self.embedding_dim],
+            buffers.output.ctypes.data,
+        )
+        self._session.run_with_iobinding(binding)
+        return buffers.output[:n_rows]
+
+    def encode(self, texts):
+        """
+        Unit-length embeddings for `texts`, one row each.
+
+        Returns a view into this thread's buffers, see the class docstring.
+        """
+        encodings = self._tokenizer.tokenizer.encode_batch(texts)
+        if len(encodings) > self._max_batch_size:
+            # Bigger than the buffers: go through them a chunk at a time into a new array
+            result = np.empty((len(encodings), self.embedding_dim), dtype=np.float32)
+            for start in range(0, len(encodings), self._max_batch_size):
+                chunk = texts[start : start + self._max_batch_size]
+                result[start : start + len(chunk)] = self.encode(chunk)
+            return result
+
+        self._thread_buffers()
+        result = self._local.result[: len(encodings)]
+        norms = self._local.norms[: len(encodings)]
+
+        groups = {}
+        for row, encoding in enumerate(encodings):
+            length = bucket_length(len(encoding.ids), self._tokenizer.length_buckets)
+            groups.setdefault(length, []).append(row)
+        for length, rows in groups.items():
+            output = self._run_bucket(length, [encodings[row] for row in rows])
+            if len(groups) == 1:
+                result[:] = output
+            else:
+                result[rows] = output
+
+        # Normalize in place
+        np.einsum("ij,ij->i", result, result, out=norms[:, 0])
+        np.sqrt(norms, out=norms)
+        np.divide(result, norms, out=result)
+        return result
@@ -0,0 +1,177 @@
+"""
+How many CPUs this process actually gets, and thread settings to match.
+
+os.cpu_count() is the host's core count, but in a container the cgroup CPU
+quota (and the affinity mask) can be far smaller. ONNX Runtime and numpy's
+BLAS both size their thread pools from the host, which oversubscribes the
+cores we really have and hurts tail latency.
+
+Nothing in here imports numpy: BLAS reads its thread count when numpy is
+first imported, so `configure_blas_threads` has to run before that.
+"""
+
+import math
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+# Set this to use a fixed budget instead of detecting one
+CPU_BUDGET_ENV = "CPU_BUDGET"
+# Thread count variables for the BLAS builds numpy can come with
+BLAS_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+class CpuBudget(BaseModel):
+    """The CPUs this process can use, and where that number came from"""
+
+    cpus: int
+    source: str  # "env", "cgroup" or "affinity"
+    cgroup_limit: Optional[float] = None
+    affinity_cpus: int
+
+
+def _read_quota(path, period_path=None):
+    """
+    cgroup v2 cpu.max ("quota period", quota can be "max"), or with
+    period_path the cgroup v1 cfs_quota_us/cfs_period_us pair (quota -1 is
+    no limit). Returns the limit in CPUs, or None.
+    """
+    try:
+        if period_path is None:
+            quota, period = path.read_text().split()[:2]
+        else:
+            quota, period = path.read_text().strip(), period_path.read_text().strip()
+    except (OSError, ValueError):
+        return None
+    if quota in ("max", "-1") or int(period) <= 0:
+        return None
+    return int(quota) / int(period)
+
+
+def _own_cgroup_paths(proc_cgroup):
+    """Map of controller -> this process's cgroup path, from /proc/self/cgroup"""
+    paths = {}
+    try:
+        lines = Path(proc_cgroup).read_text().splitlines()
+    except OSError:
+        return paths
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        for controller in controllers.split(",") if controllers else [""]:
+            paths[controller] = path.lstrip("/")
+    return paths
+
+
+def _ancestors(base, relative_path):
+    """`base/relative_path` and every directory above it, up to `base`"""
+    directory = base / relative_path
+    yield directory
+    while directory != base and base in directory.parents:
+        directory = directory.parent
+        yield directory
+
+
+def cgroup_cpu_limit(root=CGROUP_ROOT, proc_cgroup="/proc/self/cgroup"):
+    """
+    The CPU quota from cgroups, in CPUs (can be fractional), or None if
+    there isn't one. A limit anywhere up the hierarchy applies, so the
+    smallest one wins. Handles both cgroup v2 and v1.
+    """
+    root = Path(root)
+    own_paths = _own_cgroup_paths(proc_cgroup)
+    # cgroup v2: one unified hierarchy, cpu.max
+    limits = [
+        _read_quota(directory / "cpu.max") for directory in _ancestors(root, own_paths.get("", ""))
+    ]
+
+    # cgroup v1: the cpu controller has its own mount
+    for mount in ("cpu", "cpu,cpuacct"):
+        base = root / mount
+        if not base.is_dir():
+            continue
+        limits.extend(
+            _read_quota(directory / "cpu.cfs_quota_us", directory / "cpu.cfs_period_us")
+            for directory in _ancestors(base, own_paths.get("cpu", ""))
+        )
+
+    limits = [limit for limit in limits if limit is not None]
+    return min(limits) if limits else None
+
+
+def affinity_cpu_count():
+    """How many CPUs the affinity mask lets this process run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def cpu_budget(root=CGROUP_ROOT, proc_cgroup="/proc/self/cgroup") -> CpuBudget:
+    """
+    The number of CPUs to size thread pools for: the smaller of the cgroup
+    quota (rounded up) and the affinity mask, at least 1. The CPU_BUDGET
+    environment variable overrides it.
+    """
+    affinity_cpus = affinity_cpu_count()
+    cgroup_limit = cgroup_cpu_limit(root, proc_cgroup)
+
+    if os.environ.get(CPU_BUDGET_ENV):
+        cpus, source = int(os.environ[CPU_BUDGET_ENV]), "env"
+    elif cgroup_limit is not None and math.ceil(cgroup_limit) < affinity_cpus:
+        cpus, source = math.ceil(cgroup_limit), "cgroup"
+    else:
+        cpus, source = affinity_cpus, "affinity"
+
+    return CpuBudget(
+        cpus=max(1, cpus),
+        source=source,
+        cgroup_limit=cgroup_limit,
+        affinity_cpus=affinity_cpus,
+    )
+
+
+def blas_thread_count():
+    """
+    The thread count numpy's BLAS was configured with (the first of the
+    BLAS_THREAD_ENV_VARS that's set), or the affinity CPU count it uses
+    when none is.
+    """
+    for name in BLAS_THREAD_ENV_VARS:
+        if os.environ.get(name):
+            return max(1, int(os.environ[name]))
+    return affinity_cpu_count()
+
+
+def worker_cpu_budget(budget: CpuBudget, workers) -> CpuBudget:
+    """
+    One of `workers` processes' share of `budget`, at least 1 CPU. It's
+    exported as CPU_BUDGET too, so cpu_budget() gives the share from then
+    on, in this process and any it forks.
+    """
+    cpus = max(1, budget.cpus // workers)
+    os.environ[CPU_BUDGET_ENV] = str(cpus)
+    return budget.model_copy(update={"cpus": cpus, "source": f"{budget.source}/{workers}"})
+
+
+def configure_blas_threads(threads):
+    """
+    Set the BLAS/OpenMP thread count variables to `threads`, leaving any
+    that are already set alone (those are explicit overrides).
+
+    Returns the thread count per variable. Only has an effect if numpy
+    hasn't been imported yet.
+    """
+    if "numpy" in sys.modules:
+        print("Warning: numpy is already imported, BLAS thread settings won't take effect.")
+    for name in BLAS_THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+    return {name: os.environ[name] for name in BLAS_THREAD_ENV_VARS}
@@ -0,0 +1,254 @@
+"""
+Caches for text-query embeddings: an in-process LRU cache, and an on-disk
+one that's shared between worker processes and survives restarts.
+
+People keep asking for the same few hundred descriptions, and a CLIP text
+encoder pass is the expensive part of a query. A hit here skips tokenization
+and ONNX entirely.
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+def normalize_query(text):
+    """
+    Cache key for a text query: whitespace collapsed and lowercased.
+
+    The CLIP tokenizer does the same lowercasing and whitespace cleanup, so
+    two queries with the same key always encode to the same embedding.
+    """
+    return " ".join(text.split()).lower()
+
+
+class CacheStats:
+    """Hit, miss and eviction counters"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class EmbeddingCache:
+    """
+    Least-recently-used cache from normalized query text to its embedding,
+    bounded by the memory the entries take up. Safe to share between threads.
+
+    A max_bytes of 0 turns the cache off.
+    """
+
+    def __init__(self, max_bytes):
+        if max_bytes < 0:
+            raise ValueError(f"max_bytes can't be negative, got {max_bytes}")
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _entry_bytes(key, embedding):
+        return sys.getsizeof(key) + embedding.nbytes
+
+    def get(self, key):
+        """The cached embedding for `key` (already normalized), or None"""
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        """Store an embedding, evicting the least recently used ones to make room"""
+        # Entries are shared between callers, so nobody gets to write to them
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        size = self._entry_bytes(key, embedding)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= self._entry_bytes(key, old)
+
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                old_key, old_embedding = self._entries.popitem(last=False)
+                self.current_bytes -= self._entry_bytes(old_key, old_embedding)
+                self.stats.evictions += 1
+
+            self._entries[key] = embedding
+            self.current_bytes += size
+
+    def to_dict(self):
+        return {
+            **self.stats.to_dict(),
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """sha256 of a file's contents, read in chunks so big models don't need the RAM"""
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskEmbeddingCache:
+    """
+    Query-embedding cache in an SQLite file, shared by every worker process
+    on the host and kept across restarts.
+
+    Entries are keyed by normalized query text plus a fingerprint of the
+    model that produced them, so swapping the ONNX model invalidates the
+    old entries. Processes running different models (MODEL_VARIANT) can
+    share the file, each only sees its own model's entries. Once there are
+    more than `max_entries` in the file, the least recently used ones are
+    deleted, whichever model they're for, so a retired model's entries age
+    out.
+
+    Errors from SQLite (a locked or broken file, say) only ever turn into
+    cache misses, a query never fails because of this cache.
+    """
+
+    # Check the entry count every so many writes, instead of on every single one
+    TRIM_EVERY = 100
+
+    def __init__(self, path, model_fingerprint, max_entries=200_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.model_fingerprint = model_fingerprint
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " embedding BLOB NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (model, query)"
+                ")"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS query_embeddings_last_used"
+                " ON query_embeddings (last_used)"
+            )
+
+    def _connection(self):
+        """
+        One connection per thread, sqlite3 connections can't be shared between
+        them. Nor between processes, so a forked worker opens its own.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            # WAL lets the other workers keep reading while one of them writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get_many(self, keys):
+        """Embeddings for the given (normalized) keys, None where there isn't one"""
+        if not keys:
+            return []
+        placeholders = ",".join("?" * len(keys))
+        try:
+            with self._connection() as connection:
+                rows = connection.execute(
+                    f"SELECT query, embedding FROM query_embeddings"
+                    f" WHERE model = ? AND query IN ({placeholders})",
+                    (self.model_fingerprint, *keys),
+                ).fetchall()
+                if rows:
+                    connection.execute(
+                        f"UPDATE query_embeddings SET last_used = ?"
+                        f" WHERE model = ? AND query IN ({','.join('?' * len(rows))})",
+                        (time.time(), self.model_fingerprint, *(query for query, _ in rows)),
+                    )
+        except sqlite3.Error as e:
+            print(f"Warning: query embedding cache read failed: {e}")
+            rows = []
+
+        found = {query: np.frombuffer(blob, dtype=np.float32) for query, blob in rows}
+        results = [found.get(key) for key in keys]
+        with self._lock:
+            self.stats.hits += len(found)
+            self.stats.misses += len(keys) - len(found)
+        return results
+
+    def put_many(self, keys, embeddings):
+        """Store embeddings for the given keys, trimming the oldest entries now and then"""
+        now = time.time()
+        rows = [
+            (self.model_fingerprint, key, np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for key, embedding in zip(keys, embeddings)
+        ]
+        with self._lock:
+            self._writes_since_trim += len(rows)
+            should_trim = self._writes_since_trim >= self.TRIM_EVERY
+            if should_trim:
+                self._writes_since_trim = 0
+
+        try:
+            with self._connection() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)", rows
+                )
+                if should_trim:
+                    self._trim(connection)
+        except sqlite3.Error as e:
+            print(f"Warning: query embedding cache write failed: {e}")
+
+    def _trim(self, connection):
+        (count,) = connection.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+        extra = count - self.max_entries
+        if extra > 0:
+            connection.execute(
+                "DELETE FROM query_embeddings WHERE rowid IN"
+                " (SELECT rowid FROM query_embeddings ORDER BY last_used LIMIT ?)",
+                (extra,),
+            )
+            with self._lock:
+                self.stats.evictions += extra
+
+    def __len__(self):
+        with self._connection() as connection:
+            return connection.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+
+    def to_dict(self):
+        return {**self.stats.to_dict(), "path": str(self.path), "max_entries": self.max_entries}
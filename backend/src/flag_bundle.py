@@ -0,0 +1,125 @@
+"""
+Packed, memory-mapped flag catalog: the embedding matrix and the flag
+metadata as columns (backend/src/flag_metadata.py), in one versioned
+directory.
+
+Starting from flags.json means parsing the whole file into pydantic Flag
+objects and normalizing a copy of the embeddings, which gets slow for big
+catalogs and costs every worker process its own copy. A bundle is opened by
+memory-mapping its .npy files instead: nothing is read until a query needs
+it, and worker processes share the OS page cache.
+
+Made from a FlagList JSON and its .npy embeddings by
+backend/scripts/build_flag_bundle.py.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from backend.src.embedding_cache import file_fingerprint
+from backend.src.flag_index import CHUNK_ROWS, inverse_row_norms
+from backend.src.flag_metadata import FlagMetadata
+
+# Bump this whenever the layout (or the Flag schema the fragments are serialized
+# from) changes, old bundles then have to be rebuilt
+BUNDLE_VERSION = 2
+BUNDLE_DIRNAME = "flag_bundle"
+MANIFEST_NAME = "manifest.json"
+EMBEDDINGS_NAME = "embeddings.npy"
+
+
+def write_bundle(flag_list, embeddings, directory, sources=None):
+    """
+    Write `flag_list` (a FlagList) and its `embeddings` (one raw row per
+    flag, can be memory-mapped) as a bundle in `directory`.
+
+    The embeddings are stored normalized, ready to be scanned. The manifest
+    is written last, so a directory without one is an unfinished bundle.
+
+    Arguments:
+        sources (dict): name -> file the bundle was made from, their
+            fingerprints go in the manifest and FlagBundle refuses to open
+            the bundle once one of them has changed.
+    """
+    n_flags = len(flag_list.flags)
+    if len(embeddings) != n_flags:
+        raise ValueError(f"{n_flags} flags but {len(embeddings)} embedding rows")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / MANIFEST_NAME).unlink(missing_ok=True)
+
+    inverse_norms = inverse_row_norms(embeddings)
+    normalized = np.lib.format.open_memmap(
+        directory / EMBEDDINGS_NAME, mode="w+", dtype=np.float32, shape=embeddings.shape
+    )
+    for start in range(0, n_flags, CHUNK_ROWS):
+        rows = slice(start, start + CHUNK_ROWS)
+        chunk = np.asarray(embeddings[rows], dtype=np.float32)
+        normalized[rows] = chunk * inverse_norms[rows, None]
+    normalized.flush()
+    del normalized
+
+    metadata = FlagMetadata.from_flags(flag_list.flags)
+    metadata.save(directory)
+
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "count": n_flags,
+        "dim": int(embeddings.shape[1]),
+        "columns": list(metadata.columns),
+        "sources": {
+            name: {"path": str(path), "sha256": file_fingerprint(path)}
+            for name, path in (sources or {}).items()
+        },
+    }
+    with (directory / MANIFEST_NAME).open("w") as f:
+        json.dump(manifest, f, indent=1)
+
+
+class FlagBundle:
+    """
+    An opened bundle: `embeddings` are the normalized rows and `metadata`
+    the FlagMetadata, all memory-mapped.
+
+    Raises ValueError if a source file it was built from has changed since.
+    Sources that aren't there (a deployment that only ships the bundle)
+    aren't checked.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        manifest_path = self.directory / MANIFEST_NAME
+        build_script = "backend/scripts/build_flag_bundle.py"
+        if not manifest_path.is_file():
+            raise FileNotFoundError(f"No flag bundle at {directory}. Please run {build_script}.")
+        with manifest_path.open() as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != BUNDLE_VERSION:
+            raise ValueError(
+                f"The flag bundle at {directory} is version {self.manifest.get('version')}, "
+                f"this code reads version {BUNDLE_VERSION}. Please re-run {build_script}."
+            )
+        for source in self.manifest["sources"].values():
+            path = Path(source["path"])
+            if path.is_file() and file_fingerprint(path) != source["sha256"]:
+                raise ValueError(
+                    f"The flag bundle at {directory} was built from a different {path}. "
+                    f"Please re-run {build_script}."
+                )
+
+        self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        self.metadata = FlagMetadata.load(self.directory, self.manifest["columns"])
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    @property
+    def embeddings_path(self):
+        return self.directory / EMBEDDINGS_NAME
+
+    @property
+    def files(self):
+        """The files that make up the bundle, for cache invalidation"""
+        return [self.directory / MANIFEST_NAME, self.embeddings_path]
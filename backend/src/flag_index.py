@@ -0,0 +1,373 @@
+"""
+Ways of finding the flags whose embeddings best match a query embedding.
+
+The exact search (a matrix product over every flag, then top-k) lives in
+FlagSearcher. The indexes in here trade a little accuracy for memory and
+speed on big catalogs: a cheap first pass over a compact copy of the
+embeddings picks candidates, and only those get re-scored with the exact
+float vectors.
+"""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Literal, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from backend.src.cpu_budget import blas_thread_count, cpu_budget
+from backend.src.embedding_cache import file_fingerprint
+
+# Embedding rows are normalized / quantized / scanned this many at a time. 256 rows
+# of float32 at 512 dims is 512 KB, small enough to stay in cache while it's used.
+CHUNK_ROWS = 256
+# Rows per block in the parallel exact scan. Below a few thousand rows the per-block
+# overhead made the scan measurably slower than one product over the whole matrix.
+SCAN_BLOCK_ROWS = 16 * CHUNK_ROWS
+
+
+def normalize_rows(matrix):
+    """L2-normalize every row, returned as a C-contiguous float32 array"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    normalized = matrix / np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.ascontiguousarray(normalized, dtype=np.float32)
+
+
+def top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, best first.
+
+    Uses a partial selection so only the k winners get sorted, instead
+    of argsort-ing the whole score vector.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    candidates = np.argpartition(scores, -k)[-k:]
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+def inverse_row_norms(embeddings):
+    """1 / L2 norm of every row, read through in chunks (works on memory-mapped arrays)"""
+    inverse_norms = np.empty(len(embeddings), dtype=np.float32)
+    for start in range(0, len(embeddings), CHUNK_ROWS):
+        chunk = np.asarray(embeddings[start : start + CHUNK_ROWS], dtype=np.float32)
+        inverse_norms[start : start + len(chunk)] = 1.0 / np.linalg.norm(chunk, axis=-1)
+    return inverse_norms
+
+
+def rerank(embeddings, inverse_norms, query, candidates, k):
+    """
+    Exact cosine similarity of `query` to the candidate rows of the raw
+    `embeddings`, returned as the best k (indices, scores).
+    """
+    candidates = np.sort(candidates)  # in file order, nicer on a memory-mapped file
+    vectors = np.asarray(embeddings[candidates], dtype=np.float32)
+    exact_scores = (vectors @ query) * inverse_norms[candidates]
+    best = top_k_indices(exact_scores, k)
+    return candidates[best], exact_scores[best]
+
+
+def save_index_arrays(arrays, directory, embeddings_filename, **meta):
+    """
+    Write a prebuilt index as a directory of .npy files, plus a meta.json
+    with `meta` and the fingerprint of the embeddings file it was built from.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(directory / f"{name}.npy", array)
+    meta = {"embeddings_sha256": file_fingerprint(embeddings_filename), **meta}
+    with (directory / "meta.json").open("w") as f:
+        json.dump(meta, f, indent=1)
+
+
+def load_index_arrays(directory, embeddings_filename, build_script):
+    """
+    Load the arrays saved by save_index_arrays, memory-mapped, and the meta
+    dict. Raises ValueError if they were built from a different embeddings
+    file, the error messages point at `build_script`.
+    """
+    directory = Path(directory)
+    meta_path = directory / "meta.json"
+    if not meta_path.is_file():
+        raise FileNotFoundError(f"No index at {directory}. Please run {build_script}.")
+    with meta_path.open() as f:
+        meta = json.load(f)
+    if meta["embeddings_sha256"] != file_fingerprint(embeddings_filename):
+        raise ValueError(
+            f"The index at {directory} was built from a different {embeddings_filename}. "
+            f"Please re-run {build_script}."
+        )
+    arrays = {path.stem: np.load(path, mmap_mode="r") for path in directory.glob("*.npy")}
+    return arrays, meta
+
+
+class IndexConfig(BaseModel):
+    """
+    Which search FlagSearcher runs.
+
+    "exact" scores every flag in float32. "int8" and "float16" scan a
+    compact copy of the embeddings (per-row scaled int8 is 4x smaller,
+    float16 2x) for `candidates` candidates per query, then re-rank those
+    with the exact vectors.
+
+    int8 also scans faster than exact on big catalogs. float16 only saves
+    memory: numpy widens float16 to float32 slowly, so its scan is slower.
+
+    "ivf" only scans the `n_probe` k-means clusters closest to the query
+    (backend/src/ivf_index.py). It's built offline, and loaded from
+    `index_dir` (by default next to flags.json).
+
+    "parallel" is still exact, but splits the flags into row blocks that
+    are scored on `scan_threads` threads, each keeping only its running
+    top-k, so memory doesn't grow with the catalog. 0 fits the threads to the
+    CPU budget, given the BLAS threads each of their products uses.
+
+    "pca" scans the flags projected down to `pca_dims` principal components
+    (0 is all the prebuilt index has) for candidates to re-rank
+    (backend/src/pca_index.py). Also built offline, and loaded from
+    `index_dir` (by default next to embeddings.npy).
+    """
+
+    kind: Literal["exact", "parallel", "int8", "float16", "ivf", "pca"] = "exact"
+    candidates: int = 64
+    n_probe: int = 8
+    pca_dims: int = 0
+    scan_threads: int = 0
+    index_dir: Optional[Path] = None
+
+
+class CompactIndex:
+    """
+    Embeddings stored as per-row scaled int8 (or float16), scanned for
+    candidates, which are then re-ranked against the exact float vectors.
+
+    The exact vectors are only read for the candidate rows, so `embeddings`
+    can be a memory-mapped array: it's only read through once here, and
+    doesn't have to stay in RAM.
+    """
+
+    def __init__(self, embeddings, dtype="int8", candidates=64):
+        if dtype not in ("int8", "float16"):
+            raise ValueError(f"Unknown compact dtype '{dtype}', options are int8 and float16")
+        self.dtype = dtype
+        self.candidates = candidates
+        self._embeddings = embeddings
+        n_rows, dim = embeddings.shape
+
+        self._inverse_norms = inverse_row_norms(embeddings)
+        self._codes = np.empty((n_rows, dim), dtype=np.int8 if dtype == "int8" else np.float16)
+        self._scales = np.ones(n_rows, dtype=np.float32) if dtype == "int8" else None
+        for start in range(0, n_rows, CHUNK_ROWS):
+            rows = slice(start, start + CHUNK_ROWS)
+            chunk = np.asarray(embeddings[rows], dtype=np.float32)
+            chunk = chunk * self._inverse_norms[rows, None]
+            if dtype == "int8":
+                # Each row gets its own scale, so its largest value maps to +-127
+                scales = np.abs(chunk).max(axis=-1) / 127.0
+                scales[scales == 0] = 1.0
+                self._scales[rows] = scales
+                chunk = np.rint(chunk / scales[:, None])
+            self._codes[rows] = chunk
+
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self._codes)
+
+    @property
+    def nbytes(self):
+        """Memory the compact copy takes up (the exact vectors not included)"""
+        scales_bytes = 0 if self._scales is None else self._scales.nbytes
+        return self._codes.nbytes + scales_bytes + self._inverse_norms.nbytes
+
+    def _chunk_buffer(self):
+        """This thread's float32 buffer that compact chunks get converted into"""
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = np.empty(
+                (CHUNK_ROWS, self._codes.shape[1]), dtype=np.float32
+            )
+        return buffer
+
+    def approximate_scores(self, queries):
+        """
+        Approximate cosine similarity of every flag to every query, shaped
+        (queries, flags). `queries` are unit-length float32 rows.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        scores = np.empty((len(self._codes), len(queries)), dtype=np.float32)
+        buffer = self._chunk_buffer()
+        # numpy has no fast int8 or float16 matrix product, so each chunk is widened
+        # into a float32 buffer that stays in cache, and BLAS takes it from there.
+        for start in range(0, len(self._codes), CHUNK_ROWS):
+            codes = self._codes[start : start + CHUNK_ROWS]
+            widened = buffer[: len(codes)]
+            np.copyto(widened, codes)
+            np.dot(widened, queries.T, out=scores[start : start + len(codes)])
+        if self._scales is not None:
+            scores *= self._scales[:, None]
+        return scores.T
+
+    def search(self, queries, k):
+        """
+        The best k flags for each of the unit-length `queries`.
+
+        Returns:
+            list of (indices, scores), one per query, best first
+        """
+        n_candidates = max(k, self.candidates)
+        return [
+            rerank(
+                self._embeddings, self._inverse_norms, query, top_k_indices(scores, n_candidates), k
+            )
+            for query, scores in zip(queries, self.approximate_scores(queries))
+        ]
+
+
+def _merge_top_k(indices, scores, k):
+    """Keep the best k rows (per column) of (candidates, queries) index/score arrays"""
+    if len(scores) <= k:
+        return indices, scores
+    best = np.argpartition(scores, -k, axis=0)[-k:]
+    return np.take_along_axis(indices, best, axis=0), np.take_along_axis(scores, best, axis=0)
+
+
+class ParallelExactIndex:
+    """
+    Exact search, scanning the flags a block of rows at a time on a thread
+    pool. Every thread keeps just the running top-k for its share of the
+    blocks, and the shares are merged at the end, so the memory a query
+    needs stays the same for any catalog size. numpy releases the GIL for
+    the matrix products and partitions, so the threads really do run side
+    by side.
+
+    Every block's product is a BLAS call, which runs on BLAS's own threads,
+    so scan threads x BLAS threads is what's really running. `threads=0`
+    keeps that within the CPU budget; main.py gives BLAS 1 thread for this
+    index so the scan threads get the whole budget.
+
+    `embeddings` are the raw rows and can be memory-mapped.
+    """
+
+    def __init__(self, embeddings, threads=0, block_rows=SCAN_BLOCK_ROWS):
+        self._embeddings = embeddings
+        self._inverse_norms = inverse_row_norms(embeddings)
+        self.block_rows = block_rows
+        budget = cpu_budget().cpus
+        self.threads = threads or max(1, budget // blas_thread_count())
+        if self.threads > 1 and self.threads * blas_thread_count() > budget:
+            print(
+                f"Warning: {self.threads} scan threads x {blas_thread_count()} BLAS threads is"
+                f" more than the CPU budget of {budget}."
+            )
+        self._executor = None
+        if self.threads > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="flag-scan"
+            )
+
+    def __len__(self):
+        return len(self._embeddings)
+
+    @property
+    def nbytes(self):
+        """Memory the index adds on top of the (possibly memory-mapped) embeddings"""
+        return self._inverse_norms.nbytes
+
+    def _scan(self, queries, start, stop, k):
+        """Running top-k over rows [start, stop), as (k, queries) index and score arrays"""
+        best_indices = np.empty((0, len(queries)), dtype=np.intp)
+        best_scores = np.empty((0, len(queries)), dtype=np.float32)
+        # The k-th best score so far per query, a block that can't beat it is skipped
+        threshold = np.full(len(queries), -np.inf, dtype=np.float32)
+        for block_start in range(start, stop, self.block_rows):
+            block_stop = min(block_start + self.block_rows, stop)
+            block = np.asarray(self._embeddings[block_start:block_stop], dtype=np.float32)
+            scores = block @ queries.T
+            scores *= self._inverse_norms[block_start:block_stop, None]
+            if not np.any(scores.max(axis=0) > threshold):
+                continue
+            if len(scores) > k:
+                rows = np.argpartition(scores, -k, axis=0)[-k:]
+                scores = np.take_along_axis(scores, rows, axis=0)
+            else:
+                rows = np.broadcast_to(np.arange(len(scores))[:, None], scores.shape)
+            best_indices, best_scores = _merge_top_k(
+                np.concatenate([best_indices, rows + block_start]),
+                np.concatenate([best_scores, scores]),
+                k,
+            )
+            if len(best_scores) == k:
+                threshold = best_scores.min(axis=0)
+        return best_indices, best_scores
+
+    def search(self, queries, k):
+        """
+        The best k flags for each of the unit-length `queries`.
+
+        Returns:
+            list of (indices, scores), one per query, best first
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        n_rows = len(self._embeddings)
+        if self._executor is None:
+            best_indices, best_scores = self._scan(queries, 0, n_rows, k)
+        else:
+            # One contiguous share of whole blocks per thread
+            n_blocks = -(-n_rows // self.block_rows)
+            bounds = [
+                min(n_rows, self.block_rows * (n_blocks * i // self.threads))
+                for i in range(self.threads + 1)
+            ]
+            shares = list(
+                self._executor.map(
+                    lambda share: self._scan(queries, *share, k), zip(bounds[:-1], bounds[1:])
+                )
+            )
+            best_indices, best_scores = _merge_top_k(
+                np.concatenate([indices for indices, _ in shares]),
+                np.concatenate([scores for _, scores in shares]),
+                k,
+            )
+
+        results = []
+        for indices, scores in zip(best_indices.T, best_scores.T):
+            order = np.argsort(scores)[::-1]
+            results.append((indices[order], scores[order]))
+        return results
+
+
+def load_index(embeddings_filename, config: IndexConfig, flags_file=None):
+    """
+    The index `config` asks for over the embeddings in `embeddings_filename`,
+    or None for the exact search. Unless config.index_dir says otherwise,
+    prebuilt indexes are looked for next to `flags_file` (IVF) or next to
+    the embeddings file (PCA).
+    """
+    if config.kind == "exact":
+        return None
+    if config.kind == "parallel":
+        embeddings = np.load(embeddings_filename, mmap_mode="r")
+        return ParallelExactIndex(embeddings, threads=config.scan_threads)
+    if config.kind == "ivf":
+        # Imported here, ivf_index and pca_index build on the helpers in this module
+        from backend.src.ivf_index import IVF_INDEX_DIRNAME, load_ivf_index
+
+        index_dir = config.index_dir or Path(flags_file).parent / IVF_INDEX_DIRNAME
+        return load_ivf_index(
+            index_dir, embeddings_filename, n_probe=config.n_probe, candidates=config.candidates
+        )
+    if config.kind == "pca":
+        from backend.src.pca_index import PCA_INDEX_DIRNAME, load_pca_index
+
+        index_dir = config.index_dir or Path(embeddings_filename).parent / PCA_INDEX_DIRNAME
+        return load_pca_index(
+            index_dir, embeddings_filename, dims=config.pca_dims, candidates=config.candidates
+        )
+    # Memory-mapped: re-ranking only reads the candidate rows of the exact vectors
+    embeddings = np.load(embeddings_filename, mmap_mode="r")
+    return CompactIndex(embeddings, dtype=config.kind, candidates=config.candidates)
@@ -0,0 +1,151 @@
+"""
+Flag metadata as columns indexed by row id, plus each flag's response JSON
+serialized ahead of time.
+
+Building a FlagList of pydantic Flags and serializing it for every response
+shows up in profiles at high request rates. Every field of a Flag except the
+score is the same for every query, so each flag's JSON is serialized once,
+up to the score, and a response is just those fragments spliced together
+with the scores. The bytes are the same as FlagList.model_dump_json().
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pydantic_core
+
+from backend.common.flag_data import Flag, FlagList
+
+# The Flag fields stored per flag. The score belongs to a query, so it isn't one.
+METADATA_COLUMNS = (
+    "name",
+    "wikipedia_page",
+    "wikipedia_url",
+    "wikipedia_image_url",
+    "local_image_link",
+    "verification_method",
+)
+# score is Flag's last field, so its serialized JSON ends with this
+_SCORE_TAIL = b'"score":0.0}'
+# What a FlagList's JSON looks like around its flags
+_LIST_HEAD, _LIST_TAIL = FlagList(flags=[]).model_dump_json().encode().split(b"[]")
+_LIST_HEAD += b"["
+_LIST_TAIL = b"]" + _LIST_TAIL
+
+
+class StringColumn:
+    """
+    Strings stored back to back as UTF-8 in one uint8 array, with the
+    offset where each row starts (and one past the end). Either array can
+    be memory-mapped.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_values(cls, values):
+        """From a list of bytes"""
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in values], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(values), dtype=np.uint8), offsets)
+
+    @classmethod
+    def load(cls, directory, name):
+        bytes_path, offsets_path = cls._paths(directory, name)
+        return cls(np.load(bytes_path, mmap_mode="r"), np.load(offsets_path, mmap_mode="r"))
+
+    @staticmethod
+    def _paths(directory, name):
+        return Path(directory) / f"{name}.bytes.npy", Path(directory) / f"{name}.offsets.npy"
+
+    def save(self, directory, name):
+        bytes_path, offsets_path = self._paths(directory, name)
+        np.save(bytes_path, self.data)
+        np.save(offsets_path, self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index] : self.offsets[index + 1]].tobytes()
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes
+
+
+def _fragment(flag):
+    """The flag's JSON up to and including `"score":`"""
+    serialized = flag.model_copy(update={"score": 0.0}).model_dump_json().encode()
+    if not serialized.endswith(_SCORE_TAIL):
+        raise ValueError(f"score has to be Flag's last field, got {serialized!r}")
+    return serialized[: -len(b"0.0}")]
+
+
+class FlagMetadata:
+    """
+    The metadata columns (METADATA_COLUMNS) and the pre-serialized
+    fragments, all row-aligned with the embeddings.
+    """
+
+    def __init__(self, columns, fragments):
+        self.columns = columns
+        self.fragments = fragments
+
+    @classmethod
+    def from_flags(cls, flags):
+        columns = {
+            column: StringColumn.from_values([getattr(flag, column).encode() for flag in flags])
+            for column in METADATA_COLUMNS
+        }
+        return cls(columns, StringColumn.from_values([_fragment(flag) for flag in flags]))
+
+    @classmethod
+    def load(cls, directory, column_names):
+        """Memory-map the columns saved to `directory`"""
+        columns = {column: StringColumn.load(directory, column) for column in column_names}
+        return cls(columns, StringColumn.load(directory, "fragments"))
+
+    def save(self, directory):
+        for column, values in self.columns.items():
+            values.save(directory, column)
+        self.fragments.save(directory, "fragments")
+
+    def __len__(self):
+        return len(self.fragments)
+
+    @property
+    def nbytes(self):
+        return self.fragments.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    def value(self, column, index):
+        """One flag's value of a metadata column"""
+        return self.columns[column][index].decode()
+
+    def flag(self, index, score=0.0) -> Flag:
+        """The flag at `index`, with `score` filled in"""
+        # The values were validated when they were stored, so skip that here
+        return Flag.model_construct(
+            **{column: self.value(column, index) for column in self.columns}, score=score
+        )
+
+    def response_json(self, indices, scores) -> bytes:
+        """
+        The FlagList JSON for the flags at `indices` with their `scores`,
+        byte for byte what FlagList.model_dump_json() would give.
+        """
+        # Serialized the way pydantic serializes the score field (NaN and inf become null)
+        serialized_scores = pydantic_core.to_json(
+            np.asarray(scores, dtype=np.float64).tolist(), inf_nan_mode="null"
+        )
+        # Slicing a memoryview doesn't copy, b"".join copies each fragment just once
+        data = memoryview(self.fragments.data)
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.fragments.offsets[indices].tolist()
+        ends = self.fragments.offsets[indices + 1].tolist()
+        parts = []
+        for start, end, score in zip(starts, ends, serialized_scores[1:-1].split(b",")):
+            parts += (b",", data[start:end], score, b"}")
+        return _LIST_HEAD + b"".join(parts[1:]) + _LIST_TAIL
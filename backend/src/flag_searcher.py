@@ -3,17 +3,44 @@ Class that can take in an image and output a bunch of
 other images of flags that look like it.
 """
 
+import threading
+import time
+from functools import partial
 from pathlib import Path
+from typing import List
 
 import numpy as np
-import onnxruntime as ort
 
 from backend.common.flag_data import FlagList, flaglist_from_json
-from backend.src.minimal_tokenizer import create_minimal_tokenizer
+from backend.src.bound_encoder import BoundTextEncoder
+from backend.src.embedding_cache import (
+    DiskEmbeddingCache,
+    EmbeddingCache,
+    file_fingerprint,
+    normalize_query,
+)
+from backend.src.flag_bundle import FlagBundle
+from backend.src.flag_index import IndexConfig, load_index, normalize_rows, top_k_indices
+from backend.src.flag_metadata import FlagMetadata
+from backend.src.minimal_tokenizer import MAX_LENGTH, create_minimal_tokenizer
+from backend.src.model_quality import require_passing_report
+from backend.src.onnx_session import SessionConfig, create_session
+from backend.src.session_pool import SessionPool, default_pool_size, pool_session_config
 
 FLAGS_FILE = Path("backend/data/national_flags/flags.json")
 # FLAGS_FILE = Path("backend/data/commons_plus_national/flags.json")
 MODEL_PATH = Path("backend/models/clip-text-encoder.onnx")
+# Both made by backend/scripts/convert_to_onnx.py. Anything other than fp32 needs a
+# passing report from backend/scripts/check_model_variant.py before it gets used.
+MODEL_VARIANTS = {
+    "fp32": MODEL_PATH,
+    "int8": Path("backend/models/clip-text-encoder-int8.onnx"),
+}
+# Batched scoring is done this many queries at a time, so the score matrix
+# never holds more than SCORE_TILE_ROWS x (number of flags) floats.
+SCORE_TILE_ROWS = 64
+# Memory bound for the query-embedding LRU cache, about 2 KB per cached query.
+EMBEDDING_CACHE_BYTES = 16 * 1024 * 1024
 
 
 def cosine_similarity(a, b):
@@ -27,39 +54,226 @@ def cosine_similarity(a, b):
 
 
 class FlagSearcher:
-    def __init__(self, top_k):
+    def __init__(
+        self,
+        top_k,
+        embedding_cache_bytes=EMBEDDING_CACHE_BYTES,
+        disk_cache_path=None,
+        session_config=None,
+        model_variant="fp32",
+        io_binding=True,
+        session_pool_size=None,
+        index_config=None,
+        bundle_dir=None,
+        start_sessions=True,
+    ):
+        """
+        Arguments:
+            top_k (int): how many flags a query returns by default
+            embedding_cache_bytes (int): memory bound for the in-process
+                query-embedding cache, 0 turns it off.
+            disk_cache_path (Path): SQLite file for the query-embedding cache
+                that's shared between processes and kept across restarts.
+                None (the default) leaves it off.
+            session_config (SessionConfig): ONNX Runtime session options,
+                see backend/src/onnx_session.py. Defaults to SessionConfig().
+            model_variant (str): which text encoder to use, a key of MODEL_VARIANTS.
+            io_binding (bool): run the text encoder through IOBinding with
+                preallocated buffers (backend/src/bound_encoder.py), instead of
+                plain session.run.
+            session_pool_size (int): None (the default) runs every request on
+                one shared session. A number makes a pool of that many
+                sessions (backend/src/session_pool.py) that requests lease
+                one at a time, 0 sizes the pool from the CPU count.
+            index_config (IndexConfig): exact search (the default), or a
+                compact index that picks candidates to re-rank, see
+                backend/src/flag_index.py.
+            bundle_dir (Path): load the flags from this memory-mapped bundle
+                (backend/src/flag_bundle.py) instead of FLAGS_FILE. None
+                (the default) reads FLAGS_FILE.
+            start_sessions (bool): create the ONNX sessions now. False
+                loads only the read-only data, so a pre-fork parent can
+                share it with its workers (backend/src/prefork.py), and
+                each worker calls start_sessions() after the fork.
+        """
         self._top_k = top_k
+        self.embedding_cache = EmbeddingCache(embedding_cache_bytes)
 
         # Load ONNX model and tokenizer
-        if not MODEL_PATH.exists():
+        if model_variant not in MODEL_VARIANTS:
+            raise ValueError(
+                f"Unknown model_variant '{model_variant}', options are {list(MODEL_VARIANTS)}"
+            )
+        model_path = MODEL_VARIANTS[model_variant]
+        if not model_path.exists():
             raise FileNotFoundError(
-                f"ONNX model not found at {MODEL_PATH}. Please run the model conversion script."
+                f"ONNX model not found at {model_path}. Please run the model conversion script."
             )
 
-        self._session = ort.InferenceSession(str(MODEL_PATH), providers=["CPUExecutionProvider"])
+        model_fingerprint = None
+        if model_variant != "fp32":
+            model_fingerprint = file_fingerprint(model_path)
+            require_passing_report(model_path, model_fingerprint)
+
+        self.model_variant = model_variant
+        self._model_path = model_path
+        self._session_config = session_config
+        self._session_pool_size = session_pool_size
         self._tokenizer = create_minimal_tokenizer()
+        self._io_binding = io_binding
+        self._encoder = None
+        self.session_pool = None
+        self.thread_config = None
+
+        self.disk_cache = None
+        if disk_cache_path is not None:
+            model_fingerprint = model_fingerprint or file_fingerprint(model_path)
+            self.disk_cache = DiskEmbeddingCache(disk_cache_path, model_fingerprint)
+
+        self.index_config = index_config or IndexConfig()
+        bundle = None
+        if bundle_dir is not None:
+            if self.index_config.kind in ("ivf", "pca"):
+                raise ValueError(
+                    f"The {self.index_config.kind} index is built from FLAGS_FILE's embeddings, "
+                    "it can't be used with a flag bundle yet"
+                )
+            bundle = FlagBundle(bundle_dir)
+            embeddings_filename = bundle.embeddings_path
+            self._dataset_files = bundle.files
+            self._metadata = bundle.metadata
+        else:
+            flag_list = flaglist_from_json(FLAGS_FILE)
+            embeddings_filename = flag_list.embeddings_filename
+            self._dataset_files = [FLAGS_FILE, Path(embeddings_filename)]
+            # Columns plus each flag's JSON, serialized once here instead of per response
+            self._metadata = FlagMetadata.from_flags(flag_list.flags)
+
+        self._index = load_index(embeddings_filename, self.index_config, flags_file=FLAGS_FILE)
+        self._encoded_images = None
+        if self._index is None and bundle is not None:
+            # Already normalized, and left memory-mapped
+            self._encoded_images = bundle.embeddings
+        elif self._index is None:
+            # Normalize once at load time, so each query is just a matrix-vector product.
+            self._encoded_images = normalize_rows(np.load(embeddings_filename))
+
+        if start_sessions:
+            self.start_sessions()
+
+    def start_sessions(self):
+        """Create the ONNX session (or the pool of them) that encodes queries"""
+        if self.thread_config is not None:
+            raise RuntimeError("The ONNX sessions have already been started")
+        if self._session_pool_size is None:
+            sessions = [create_session(self._model_path, self._session_config)]
+            self._encoder = self._make_encoder(sessions[0])
+        else:
+            pool_config = pool_session_config(self._session_config or SessionConfig())
+            size = self._session_pool_size or default_pool_size(pool_config.intra_op_threads)
+            sessions = [create_session(self._model_path, pool_config) for _ in range(size)]
+            self.session_pool = SessionPool(self._make_encoder(session) for session in sessions)
+
+        # What the thread counts came out as, after the CPU budget filled in any 0s
+        session_options = sessions[0].get_session_options()
+        self.thread_config = {
+            "sessions": len(sessions),
+            "intra_op_threads": session_options.intra_op_num_threads,
+            "inter_op_threads": session_options.inter_op_num_threads,
+        }
+
+    @property
+    def top_k(self):
+        """How many flags a query returns by default"""
+        return self._top_k
+
+    @property
+    def n_flags(self):
+        """How many flags there are to search"""
+        return len(self._metadata)
 
-        self._flags = flaglist_from_json(FLAGS_FILE)
-        self._encoded_images = np.load(self._flags.embeddings_filename)
+    @property
+    def dataset_files(self):
+        """The files the searchable flags were loaded from"""
+        return self._dataset_files
+
+    def _make_encoder(self, session):
+        """The function that encodes a list of texts with `session`"""
+        if self._io_binding:
+            return BoundTextEncoder(session, self._tokenizer).encode
+        return partial(self._run_session, session)
 
     def _encode_text(self, text):
-        """Encode text using CLIP text encoder via ONNX"""
-        inputs = self._tokenizer(text, return_tensors="np", padding=True, truncation=True)
+        """
+        Encode text using CLIP text encoder via ONNX.
 
-        # Run inference
-        outputs = self._session.run(
-            None, {"input_ids": inputs["input_ids"], "attention_mask": inputs["attention_mask"]}
-        )
+        `text` can be a single string or a list of them. A list is grouped by
+        token-length bucket, and each bucket is encoded with one ONNX run.
 
-        # The ONNX model now outputs the final embeddings directly
-        # (including EOS token selection and text projection)
-        text_embeddings = outputs[0]
+        With io_binding, the result lives in this thread's preallocated buffers
+        and gets overwritten by the thread's next call.
+        """
+        texts = [text] if isinstance(text, str) else list(text)
+        if self.session_pool is None:
+            return self._encoder(texts)
+        with self.session_pool.lease() as encoder:
+            return encoder(texts)
+
+    def _run_session(self, session, texts):
+        """Encode `texts` with plain session.run, one run per length bucket"""
+        text_embeddings = None
+        for rows, inputs in self._tokenizer.tokenize_by_bucket(texts):
+            # Run inference
+            outputs = session.run(
+                None, {"input_ids": inputs["input_ids"], "attention_mask": inputs["attention_mask"]}
+            )
+
+            # The ONNX model now outputs the final embeddings directly
+            # (including EOS token selection and text projection)
+            if text_embeddings is None:
+                text_embeddings = np.empty((len(texts), outputs[0].shape[-1]), dtype=np.float32)
+            text_embeddings[rows] = outputs[0]
 
         # Normalize embeddings
         text_embeddings = text_embeddings / np.linalg.norm(text_embeddings, axis=-1, keepdims=True)
 
         return text_embeddings
 
+    def _embed_queries(self, text_queries):
+        """
+        Unit-length float32 embeddings for a list of text queries, one row each.
+
+        Queries are looked up in the in-process cache, then the disk cache;
+        whatever's left is encoded in one ONNX run and added to both.
+        """
+        keys = [normalize_query(text) for text in text_queries]
+        embeddings = [self.embedding_cache.get(key) for key in keys]
+
+        # dict keeps the order and drops repeats within the batch
+        missing = {key: None for key, embedding in zip(keys, embeddings) if embedding is None}
+        if missing and self.disk_cache is not None:
+            for key, embedding in zip(list(missing), self.disk_cache.get_many(list(missing))):
+                if embedding is not None:
+                    self.embedding_cache.put(key, embedding)
+                    missing[key] = embedding
+
+        to_encode = [key for key, embedding in missing.items() if embedding is None]
+        if to_encode:
+            encoded = np.asarray(self._encode_text(to_encode), dtype=np.float32)
+            if self.disk_cache is not None:
+                self.disk_cache.put_many(to_encode, encoded)
+            for key, embedding in zip(to_encode, encoded):
+                self.embedding_cache.put(key, embedding)
+                missing[key] = embedding
+
+        if missing:
+            embeddings = [
+                missing[key] if embedding is None else embedding
+                for key, embedding in zip(keys, embeddings)
+            ]
+
+        return np.stack(embeddings)
+
     def query(self, text_query, is_image) -> FlagList:
         """
         Run the recognizer, comparing to all the existing stuff.
@@ -79,19 +293,120 @@ class FlagSearcher:
             # fn = "/home/bjafek/personal/draw_flags/examples/" + img.data
             # img = Image.open(fn)
 
-        # Encode the text query using ONNX
-        new_embedding = self._encode_text(text_query)
+        # Encode the text query using ONNX (or the cache)
+        new_embedding = self._embed_queries([text_query])[0]
+
+        if self._index is not None:
+            best_indices, best_scores = self._index.search(new_embedding[None], self._top_k)[0]
+            return self._to_flag_list(best_indices, best_scores)
+
+        # Both sides are already unit length, so the dot product is the cosine similarity
+        similarity_scores = self._encoded_images @ new_embedding
+        best_indices = top_k_indices(similarity_scores, self._top_k)
+        return self._to_flag_list(best_indices, similarity_scores[best_indices])
+
+    def query_batch(self, text_queries, top_k=None) -> List[FlagList]:
+        """
+        Run several text queries at once: the tokenizer encodes the whole
+        batch, there's one padded ONNX run, and the scoring is a tiled
+        matrix-matrix product so memory stays bounded for big batches.
+
+        Arguments:
+            text_queries (list[str]): the text descriptions
+            top_k (int): how many flags to return per query, defaults to
+                the top_k this searcher was built with.
+
+        Returns:
+            list[FlagList], one per query, in the same order
+        """
+        return [self._to_flag_list(*best) for best in self._search_batch(text_queries, top_k)]
+
+    def query_batch_json(self, text_queries, top_k=None) -> List[bytes]:
+        """
+        Same as query_batch, but each result is the FlagList already
+        serialized to JSON, spliced together from the pre-serialized flags
+        without building any pydantic models.
+        """
+        return [
+            self._metadata.response_json(*best) for best in self._search_batch(text_queries, top_k)
+        ]
+
+    def _search_batch(self, text_queries, top_k):
+        """The best (indices, scores) for each text query, best first"""
+        top_k = self._top_k if top_k is None else top_k
+        text_queries = list(text_queries)
+        if not text_queries:
+            return []
+        return self._best_flags(self._embed_queries(text_queries), top_k)
+
+    def _best_flags(self, new_embeddings, top_k):
+        """The best (indices, scores) for each row of `new_embeddings`, best first"""
+        results = []
+        for start in range(0, len(new_embeddings), SCORE_TILE_ROWS):
+            tile = new_embeddings[start : start + SCORE_TILE_ROWS]
+            if self._index is not None:
+                results.extend(self._index.search(tile, top_k))
+                continue
+            similarity_scores = tile @ self._encoded_images.T
+            for scores in similarity_scores:
+                best_indices = top_k_indices(scores, top_k)
+                results.append((best_indices, scores[best_indices]))
+        return results
+
+    def warmup(self, batch_sizes=(1,)):
+        """
+        Run synthetic texts of every length bucket and each of `batch_sizes`
+        through every session, then score them, so the first real queries
+        don't pay for ONNX Runtime's first-run setup (memory arena, kernels
+        for a new input shape) or for reading in memory-mapped embeddings.
+        Skips the query caches, nothing gets stored.
+
+        With io_binding, every thread has its own buffers, and this only
+        allocates the calling thread's; warmup_threads() covers a pool.
+
+        Returns:
+            dict of "<bucket>x<batch size>" -> seconds the first session took
+        """
+        encoders = [self._encoder] if self.session_pool is None else self.session_pool.items
+        # BOS + (bucket - 2) one-token words + EOS is exactly `bucket` tokens
+        lengths = self._tokenizer.length_buckets or (MAX_LENGTH,)
+        timings = {}
+        for length in lengths:
+            text = " ".join(["flag"] * (length - 2))
+            for batch_size in batch_sizes:
+                for i, encoder in enumerate(encoders):
+                    start = time.perf_counter()
+                    embeddings = np.array(encoder([text] * batch_size), dtype=np.float32)
+                    if i == 0:
+                        timings[f"{length}x{batch_size}"] = time.perf_counter() - start
+                self._best_flags(embeddings, self._top_k)
+        return timings
+
+    def warmup_threads(self, executor, threads, batch_sizes=(1,)):
+        """
+        warmup() on each of `executor`'s `threads` threads, so every one of
+        them has its buffers before the first real query. `threads` has to
+        be the executor's max_workers: each call waits until all of them are
+        running, which is what puts them on different threads.
+
+        Returns:
+            dict of "<bucket>x<batch size>" -> seconds the slowest thread took
+        """
+        barrier = threading.Barrier(threads)
 
-        # Calculate similarity with pre-computed embeddings
-        similarity_scores = cosine_similarity(new_embedding, self._encoded_images)
-        top_k_indices = similarity_scores.argsort()[0][::-1][: self._top_k]
-        sorted_scores = similarity_scores.ravel()[top_k_indices].tolist()
+        def warm(_):
+            barrier.wait()
+            return self.warmup(batch_sizes)
 
-        flags = []
-        for ind, score in zip(top_k_indices, sorted_scores):
-            # Use the stored Flag, just update the score with the similarity score.
-            flag = self._flags.flags[ind]
-            flag.score = score
-            flags.append(flag)
+        timings = {}
+        for thread_timings in executor.map(warm, range(threads)):
+            for shape, seconds in thread_timings.items():
+                timings[shape] = max(seconds, timings.get(shape, 0.0))
+        return timings
 
+    def _to_flag_list(self, best_indices, best_scores) -> FlagList:
+        """Turn the best flag indices and their scores, best first, into a FlagList"""
+        sorted_scores = np.asarray(best_scores).tolist()
+        # Fresh Flags built from the columns, so concurrent queries never share one
+        flags = [self._metadata.flag(ind, score) for ind, score in zip(best_indices, sorted_scores)]
         return FlagList(flags=flags)
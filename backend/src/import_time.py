@@ -0,0 +1,94 @@
+"""
+How long the server's imports take, from `python -X importtime`.
+
+Scale-to-zero hosting starts a fresh process for the first request, so the
+import time of the serving path is latency users see. Imports are measured
+in a fresh interpreter (anything already imported here would look free),
+and anything the bare interpreter imports on its own is left out.
+"""
+
+import ast
+import subprocess
+import sys
+from pathlib import Path
+from typing import NamedTuple
+
+MAIN_FILE = Path(__file__).parent.parent / "main.py"
+# Data preparation needs these, serving never should
+DATA_PREP_MODULES = ("requests", "cairosvg", "PIL", "torch", "transformers", "wikipedia")
+
+
+class ImportTiming(NamedTuple):
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int  # 0 for the imports the measured code made itself
+
+
+def serving_imports(main_file=MAIN_FILE):
+    """The modules backend/main.py imports, read from its source so the list can't go stale"""
+    modules = []
+    for node in ast.walk(ast.parse(Path(main_file).read_text())):
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def _run_importtime(code, cwd):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package", the package name is
+        # indented two more spaces per level of nesting
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        timings.append(ImportTiming(name.strip(), int(self_us), int(cumulative_us), depth))
+    return timings
+
+
+def measure_imports(modules, cwd=None):
+    """
+    Import `modules` in a fresh interpreter under -X importtime.
+
+    Returns:
+        list of ImportTiming, every module that got imported, minus the
+        ones the interpreter imports on startup anyway
+    """
+    cwd = cwd or MAIN_FILE.parent.parent
+    startup = {timing.name for timing in _run_importtime("pass", cwd)}
+    code = "\n".join(f"import {module}" for module in modules)
+    return [timing for timing in _run_importtime(code, cwd) if timing.name not in startup]
+
+
+def total_ms(timings):
+    """Wall time of everything imported, the sum over the top-level imports"""
+    return sum(timing.cumulative_us for timing in timings if timing.depth == 0) / 1000
+
+
+def format_report(timings, top=25):
+    """The total, the slowest top-level imports, and the slowest modules by their own time"""
+    lines = [f"Total import time: {total_ms(timings):.0f} ms for {len(timings)} modules", ""]
+    lines.append("Top-level imports (cumulative):")
+    top_level = sorted(
+        (timing for timing in timings if timing.depth == 0),
+        key=lambda timing: timing.cumulative_us,
+        reverse=True,
+    )
+    lines.extend(
+        f"  {timing.cumulative_us / 1000:8.1f} ms  {timing.name}" for timing in top_level[:top]
+    )
+    lines.append("")
+    lines.append("Slowest modules (self):")
+    slowest = sorted(timings, key=lambda timing: timing.self_us, reverse=True)
+    lines.extend(f"  {timing.self_us / 1000:8.1f} ms  {timing.name}" for timing in slowest[:top])
+    return "\n".join(lines)
@@ -0,0 +1,278 @@
+"""
+Inverted-file (IVF) index for big flag catalogs, optionally with
+product-quantized (PQ) residuals. Pure numpy.
+
+The flags are split into clusters by k-means over their embeddings. A query
+only scans the `n_probe` clusters whose centers are closest to it, instead
+of every flag. With PQ, each flag is stored as a few bytes (its offset from
+the cluster center, quantized piece by piece), and the best candidates from
+that approximate scan get re-ranked with the exact vectors.
+
+The index is built offline by backend/scripts/build_ivf_index.py, and saved
+as a directory of .npy files next to flags.json.
+"""
+
+import numpy as np
+
+from backend.src.flag_index import (
+    CHUNK_ROWS,
+    inverse_row_norms,
+    load_index_arrays,
+    rerank,
+    save_index_arrays,
+    top_k_indices,
+)
+
+IVF_INDEX_DIRNAME = "ivf_index"
+KMEANS_ITERATIONS = 20
+# k-means trains on a random sample of at most this many points per cluster
+TRAINING_POINTS_PER_CLUSTER = 256
+# Each PQ sub-quantizer has 256 centers, so a code is one byte
+PQ_CENTERS = 256
+# Rows assigned to clusters / encoded at a time while building, to bound memory
+BUILD_CHUNK_ROWS = 16 * CHUNK_ROWS
+
+
+def _normalized(embeddings, rows):
+    """Unit-length float32 copies of `embeddings[rows]` (a slice or index array)"""
+    chunk = np.asarray(embeddings[rows], dtype=np.float32)
+    return chunk / np.linalg.norm(chunk, axis=-1, keepdims=True)
+
+
+def _assign(data, centers, spherical):
+    """Index of the closest center for every row of `data`"""
+    labels = np.empty(len(data), dtype=np.int64)
+    # Nearest by euclidean distance is the biggest x.c - |c|^2 / 2
+    offsets = 0.0 if spherical else 0.5 * np.sum(centers * centers, axis=-1)
+    for start in range(0, len(data), BUILD_CHUNK_ROWS):
+        scores = data[start : start + BUILD_CHUNK_ROWS] @ centers.T - offsets
+        labels[start : start + len(scores)] = np.argmax(scores, axis=-1)
+    return labels
+
+
+def kmeans(
+    data,
+    n_clusters,
+    n_iterations=KMEANS_ITERATIONS,
+    spherical=False,
+    seed=0,
+    points_per_cluster=TRAINING_POINTS_PER_CLUSTER,
+):
+    """
+    Lloyd's k-means on (a sample of) `data`, returning the centers.
+
+    With `spherical`, rows are compared by cosine similarity and the
+    centers are kept unit length, which suits normalized embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    n_clusters = min(n_clusters, len(data))
+    if len(data) > n_clusters * points_per_cluster:
+        data = data[np.sort(rng.choice(len(data), n_clusters * points_per_cluster, replace=False))]
+
+    centers = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(n_iterations):
+        labels = _assign(data, centers, spherical)
+        # Sum the points of each cluster in one pass: sort by label, then reduceat
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_clusters)
+        non_empty = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[non_empty]
+        centers[non_empty] = np.add.reduceat(data[order], starts, axis=0) / counts[non_empty, None]
+        # Restart empty clusters from random points
+        n_empty = int(np.sum(~non_empty))
+        if n_empty:
+            centers[~non_empty] = data[rng.choice(len(data), n_empty, replace=False)]
+        if spherical:
+            centers /= np.linalg.norm(centers, axis=-1, keepdims=True)
+    return centers
+
+
+def build_ivf_index(
+    embeddings,
+    n_lists,
+    pq_subvectors=0,
+    seed=0,
+    points_per_cluster=TRAINING_POINTS_PER_CLUSTER,
+):
+    """
+    Build the index arrays for the (raw, not necessarily normalized)
+    `embeddings`. `embeddings` can be memory-mapped, it's read in chunks.
+
+    Arguments:
+        n_lists (int): how many k-means clusters to split the flags into
+        pq_subvectors (int): 0 stores the normalized vectors as they are.
+            Otherwise each one is stored as this many one-byte PQ codes,
+            so it has to divide the embedding size.
+        points_per_cluster (int): k-means training sample size per cluster,
+            lower builds faster.
+
+    Returns:
+        dict of arrays, for save_ivf_index
+    """
+    n_rows, dim = embeddings.shape
+    if pq_subvectors and dim % pq_subvectors:
+        raise ValueError(f"pq_subvectors ({pq_subvectors}) has to divide the embedding size {dim}")
+    rng = np.random.default_rng(seed)
+    n_training = min(n_rows, n_lists * points_per_cluster)
+    training = _normalized(embeddings, np.sort(rng.choice(n_rows, n_training, replace=False)))
+    centroids = kmeans(
+        training, n_lists, spherical=True, seed=seed, points_per_cluster=points_per_cluster
+    )
+
+    labels = np.concatenate(
+        [
+            _assign(
+                _normalized(embeddings, slice(start, start + BUILD_CHUNK_ROWS)),
+                centroids,
+                spherical=True,
+            )
+            for start in range(0, n_rows, BUILD_CHUNK_ROWS)
+        ]
+    )
+    # Rows are stored grouped by cluster, so every cluster is one contiguous slice
+    ids = np.argsort(labels, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))])
+
+    arrays = {
+        "centroids": centroids,
+        "offsets": offsets,
+        "ids": ids,
+        "inverse_norms": inverse_row_norms(embeddings),
+    }
+    if not pq_subvectors:
+        arrays["vectors"] = np.concatenate(
+            [
+                _normalized(embeddings, ids[start : start + BUILD_CHUNK_ROWS])
+                for start in range(0, n_rows, BUILD_CHUNK_ROWS)
+            ]
+        )
+        return arrays
+
+    # PQ on the residuals (offset of each flag from its cluster center)
+    sub_dim = dim // pq_subvectors
+    training_residuals = training - centroids[_assign(training, centroids, spherical=True)]
+    codebooks = np.stack(
+        [
+            kmeans(
+                training_residuals[:, j * sub_dim : (j + 1) * sub_dim],
+                PQ_CENTERS,
+                seed=seed,
+                points_per_cluster=points_per_cluster,
+            )
+            for j in range(pq_subvectors)
+        ]
+    )
+    codes = np.empty((n_rows, pq_subvectors), dtype=np.uint8)
+    for start in range(0, n_rows, BUILD_CHUNK_ROWS):
+        rows = ids[start : start + BUILD_CHUNK_ROWS]
+        residuals = _normalized(embeddings, rows) - centroids[labels[rows]]
+        for j in range(pq_subvectors):
+            sub = residuals[:, j * sub_dim : (j + 1) * sub_dim]
+            codes[start : start + len(rows), j] = _assign(sub, codebooks[j], spherical=False)
+    arrays["codebooks"] = codebooks
+    arrays["codes"] = codes
+    return arrays
+
+
+def save_ivf_index(arrays, directory, embeddings_filename):
+    """Write the arrays as .npy files, plus the fingerprint of the embeddings they came from"""
+    save_index_arrays(
+        arrays,
+        directory,
+        embeddings_filename,
+        n_lists=len(arrays["centroids"]),
+        pq_subvectors=arrays["codes"].shape[1] if "codes" in arrays else 0,
+    )
+
+
+class IVFIndex:
+    """
+    Searches the `n_probe` closest clusters. Without PQ the scores in there
+    are exact; with PQ the `candidates` best approximate ones get re-ranked
+    against the exact vectors from `embeddings`.
+    """
+
+    def __init__(self, arrays, embeddings, n_probe=8, candidates=64):
+        self.n_probe = n_probe
+        self.candidates = candidates
+        self._embeddings = embeddings
+        self._centroids = arrays["centroids"]
+        self._offsets = arrays["offsets"]
+        self._ids = arrays["ids"]
+        self._inverse_norms = arrays["inverse_norms"]
+        self._vectors = arrays.get("vectors")
+        self._codes = arrays.get("codes")
+        self._codebooks = arrays.get("codebooks")
+        if self._codes is not None:
+            n_subvectors = self._codes.shape[1]
+            # Where sub-quantizer j's table starts in the flattened (subvectors x 256) table
+            self._table_offsets = np.arange(n_subvectors) * self._codebooks.shape[1]
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def nbytes(self):
+        """Memory the index takes up (the exact vectors for re-ranking not included)"""
+        arrays = (self._centroids, self._offsets, self._ids, self._inverse_norms)
+        extra = (self._vectors,) if self._codes is None else (self._codes, self._codebooks)
+        return sum(array.nbytes for array in arrays + extra)
+
+    def _probe(self, query, lists, centroid_scores):
+        """Scores of every flag in `lists`, as (positions in the stored order, scores)"""
+        positions = np.concatenate(
+            [np.arange(self._offsets[i], self._offsets[i + 1]) for i in lists]
+        )
+        if self._codes is None:
+            scores = np.concatenate(
+                [self._vectors[self._offsets[i] : self._offsets[i + 1]] @ query for i in lists]
+            )
+            return positions, scores
+
+        # q.x = q.center + q.residual, and q.residual is a sum of table lookups
+        n_subvectors, _, sub_dim = self._codebooks.shape
+        table = np.einsum("jd,jcd->jc", query.reshape(n_subvectors, sub_dim), self._codebooks)
+        table = table.ravel()
+        scores = np.concatenate(
+            [
+                centroid_scores[i]
+                + table[
+                    self._codes[self._offsets[i] : self._offsets[i + 1]] + self._table_offsets
+                ].sum(axis=-1)
+                for i in lists
+            ]
+        )
+        return positions, scores
+
+    def search(self, queries, k):
+        """
+        The best k flags for each of the unit-length `queries`.
+
+        Returns:
+            list of (indices, scores), one per query, best first
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        results = []
+        for query, centroid_scores in zip(queries, queries @ self._centroids.T):
+            lists = top_k_indices(centroid_scores, self.n_probe)
+            positions, scores = self._probe(query, lists, centroid_scores)
+            if self._codes is None:
+                best = top_k_indices(scores, k)
+                results.append((self._ids[positions[best]], scores[best]))
+            else:
+                candidates = self._ids[positions[top_k_indices(scores, max(k, self.candidates))]]
+                results.append(rerank(self._embeddings, self._inverse_norms, query, candidates, k))
+        return results
+
+
+def load_ivf_index(directory, embeddings_filename, n_probe=8, candidates=64):
+    """
+    Load an index saved by save_ivf_index, memory-mapped. Raises ValueError
+    if it was built from a different embeddings file.
+    """
+    arrays, _ = load_index_arrays(
+        directory, embeddings_filename, "backend/scripts/build_ivf_index.py"
+    )
+    embeddings = np.load(embeddings_filename, mmap_mode="r")
+    return IVFIndex(arrays, embeddings, n_probe=n_probe, candidates=candidates)
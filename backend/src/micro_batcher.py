@@ -0,0 +1,194 @@
+"""
+Dynamic micro-batching for text queries.
+
+Requests that arrive within a short window get grouped together, so a burst
+of N queries costs one padded ONNX run and one similarity matmul instead of N
+of each. Every caller still gets back its own FlagList (or its JSON).
+"""
+
+import asyncio
+import contextlib
+import time
+from collections import deque
+from typing import NamedTuple, Union
+
+from backend.common.flag_data import FlagList
+
+
+class _PendingQuery(NamedTuple):
+    text: str
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class BatcherStats:
+    """
+    Counters for the batcher: how big the batches were and how long
+    requests sat waiting for their batch to be sent off.
+    """
+
+    def __init__(self):
+        self.batches = 0
+        self.requests = 0
+        self.batch_sizes = {}
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        # Queries whose caller left before their batch ran, they never reach ONNX
+        self.dropped = 0
+        self.waiting_batches = 0
+
+    def record_batch(self, wait_times):
+        size = len(wait_times)
+        self.batches += 1
+        self.requests += size
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+        self.total_wait_s += sum(wait_times)
+        self.max_wait_s = max(self.max_wait_s, *wait_times)
+
+    def to_dict(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "mean_wait_ms": 1000 * self.total_wait_s / self.requests if self.requests else 0.0,
+            "max_wait_ms": 1000 * self.max_wait_s,
+            "dropped": self.dropped,
+            "waiting_batches": self.waiting_batches,
+        }
+
+
+class MicroBatcher:
+    """
+    Collects queries for up to `max_wait_ms` (or until `max_batch_size` of
+    them are waiting) and runs them through `FlagSearcher.query_batch` on
+    the given executor. With `json_responses`, it's
+    `FlagSearcher.query_batch_json` instead, and callers get bytes.
+
+    At most `max_concurrent_batches` batches run at once (None, the
+    default, is no limit). The rest wait their turn here rather than in the
+    executor's queue, so queries whose callers left in the meantime are
+    dropped right before their batch would run.
+
+    The collecting loop starts itself on the first query, on whatever event
+    loop that query runs in.
+    """
+
+    def __init__(
+        self,
+        flag_searcher,
+        executor,
+        max_batch_size=16,
+        max_wait_ms=1.0,
+        json_responses=False,
+        max_concurrent_batches=None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        if max_wait_ms < 0:
+            raise ValueError(f"max_wait_ms can't be negative, got {max_wait_ms}")
+        if max_concurrent_batches is not None and max_concurrent_batches < 1:
+            raise ValueError(
+                f"max_concurrent_batches must be at least 1, got {max_concurrent_batches}"
+            )
+
+        self._query_batch = (
+            flag_searcher.query_batch_json if json_responses else flag_searcher.query_batch
+        )
+        self._executor = executor
+        self._max_batch_size = max_batch_size
+        self._max_wait_s = max_wait_ms / 1000
+        self._max_concurrent_batches = max_concurrent_batches
+
+        self._pending = deque()
+        self._has_pending = None
+        self._is_full = None
+        self._slots = None
+        self._collector = None
+        # Keep references to the dispatched batches so they don't get garbage collected
+        self._in_flight = set()
+        self.stats = BatcherStats()
+
+    async def query(self, text_query) -> Union[FlagList, bytes]:
+        """Queue a text query and wait for its batch to come back"""
+        self._ensure_running()
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_PendingQuery(text_query, future, time.perf_counter()))
+        self._has_pending.set()
+        if len(self._pending) >= self._max_batch_size:
+            self._is_full.set()
+
+        return await future
+
+    def _ensure_running(self):
+        if self._collector is None or self._collector.done():
+            # Events bind to the loop they're first used on, so start fresh with the collector
+            self._has_pending = asyncio.Event()
+            self._is_full = asyncio.Event()
+            if self._max_concurrent_batches is not None:
+                self._slots = asyncio.Semaphore(self._max_concurrent_batches)
+            self._collector = asyncio.get_running_loop().create_task(self._collect())
+
+    async def _collect(self):
+        while True:
+            await self._has_pending.wait()
+
+            # Hold the batch open until it's full or the oldest query has waited long enough
+            delay = self._max_wait_s - (time.perf_counter() - self._pending[0].enqueued_at)
+            if len(self._pending) < self._max_batch_size and delay > 0:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._is_full.wait(), delay)
+
+            batch = [
+                self._pending.popleft()
+                for _ in range(min(self._max_batch_size, len(self._pending)))
+            ]
+            if len(self._pending) < self._max_batch_size:
+                self._is_full.clear()
+            if not self._pending:
+                self._has_pending.clear()
+
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch):
+        dispatched_at = time.perf_counter()
+        self.stats.record_batch([dispatched_at - query.enqueued_at for query in batch])
+        if self._slots is None:
+            await self._run(batch)
+            return
+
+        self.stats.waiting_batches += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.stats.waiting_batches -= 1
+        try:
+            await self._run(batch)
+        finally:
+            self._slots.release()
+
+    async def _run(self, batch):
+        # Callers that gave up while waiting don't need to be computed
+        n_queries = len(batch)
+        batch = [query for query in batch if not query.future.done()]
+        self.stats.dropped += n_queries - len(batch)
+        if not batch:
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self._executor, self._query_batch, [query.text for query in batch]
+            )
+        except Exception as e:
+            for query in batch:
+                if not query.future.done():
+                    query.future.set_exception(e)
+            return
+
+        for query, result in zip(batch, results):
+            if not query.future.done():
+                query.future.set_result(result)
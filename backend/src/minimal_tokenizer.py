@@ -3,38 +3,126 @@ Minimal tokenizer implementation using just the tokenizers library
 to replace the heavy transformers dependency.
 """
 
+from pathlib import Path
+
 import numpy as np
 from tokenizers import Tokenizer
 
+# Saved from "openai/clip-vit-base-patch32" by backend/scripts/export_tokenizer.py,
+# so starting up never needs the Hugging Face hub.
+TOKENIZER_PATH = Path("backend/models/clip-tokenizer.json")
+PAD_TOKEN = "<|endoftext|>"
+PAD_TOKEN_ID = 49407
+# CLIP's text encoder only has position embeddings for this many tokens
+MAX_LENGTH = 77
+# Inputs get padded up to one of these lengths, so ONNX Runtime only ever sees a
+# handful of shapes instead of a new one for every query length.
+LENGTH_BUCKETS = (16, 32, MAX_LENGTH)
+
+
+def bucket_length(length, length_buckets=LENGTH_BUCKETS):
+    """The smallest bucket that fits `length` tokens (or `length` itself with no buckets)"""
+    if not length_buckets:
+        return length
+    for bucket in length_buckets:
+        if length <= bucket:
+            return bucket
+    raise ValueError(f"{length} tokens doesn't fit in any of the buckets {length_buckets}")
+
 
 class MinimalCLIPTokenizer:
     """Minimal CLIP tokenizer implementation"""
 
-    def __init__(self):
-        # Load the CLIP tokenizer from the tokenizers library
-        # We'll need to download the tokenizer files
-        self.tokenizer = Tokenizer.from_pretrained("openai/clip-vit-base-patch32")
+    def __init__(self, tokenizer_path=TOKENIZER_PATH, length_buckets=LENGTH_BUCKETS):
+        """
+        Arguments:
+            tokenizer_path (Path): the tokenizer JSON
+            length_buckets (tuple[int]): lengths to pad up to, the last one has
+                to be MAX_LENGTH. None (or empty) pads to the longest text instead.
+        """
+        # Load the CLIP tokenizer from the file next to the ONNX model
+        if not Path(tokenizer_path).is_file():
+            raise FileNotFoundError(
+                f"Tokenizer not found at {tokenizer_path}. "
+                "Please run backend/scripts/export_tokenizer.py."
+            )
+        if length_buckets and max(length_buckets) != MAX_LENGTH:
+            raise ValueError(f"The biggest length bucket has to be {MAX_LENGTH}")
+        self.length_buckets = tuple(sorted(length_buckets)) if length_buckets else ()
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        # Long descriptions get cut off, keeping the end-of-text token
+        self.tokenizer.enable_truncation(max_length=MAX_LENGTH)
+
+    @staticmethod
+    def write_into(encodings, input_ids, attention_mask):
+        """
+        Write the encodings, padded, into the first rows of existing
+        (rows, length) int64 arrays, so no new arrays get made.
+        """
+        n_rows = len(encodings)
+        # CLIP pads with its end-of-text token
+        input_ids[:n_rows].fill(PAD_TOKEN_ID)
+        attention_mask[:n_rows].fill(0)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, : len(encoding.ids)] = encoding.ids
+            attention_mask[row, : len(encoding.ids)] = 1
+
+    def _pad(self, encodings):
+        """Pad the encodings into (input_ids, attention_mask) arrays of the right bucket"""
+        length = bucket_length(max(len(e.ids) for e in encodings), self.length_buckets)
+        input_ids = np.empty((len(encodings), length), dtype=np.int64)
+        attention_mask = np.empty((len(encodings), length), dtype=np.int64)
+        self.write_into(encodings, input_ids, attention_mask)
+        return input_ids, attention_mask
 
     def __call__(self, text, return_tensors="np", padding=True, truncation=True):
-        """Tokenize text similar to transformers CLIPTokenizer"""
+        """
+        Tokenize text similar to transformers CLIPTokenizer.
+
+        `text` can be a single string or a list of strings. Everything is
+        truncated to MAX_LENGTH tokens and padded to one length bucket.
+        """
 
         # Tokenize the text
-        encoding = self.tokenizer.encode(text)
+        texts = [text] if isinstance(text, str) else list(text)
+        encodings = self.tokenizer.encode_batch(texts)
 
         # Get input_ids and attention_mask
-        input_ids = np.array([encoding.ids])
-        attention_mask = np.array([encoding.attention_mask])
+        input_ids, attention_mask = self._pad(encodings)
 
         return {"input_ids": input_ids, "attention_mask": attention_mask}
 
+    def tokenize_by_bucket(self, texts):
+        """
+        Tokenize a batch and group it by length bucket, so short texts
+        don't get padded all the way out to the longest one.
+
+        Returns:
+            list of (row indices into `texts`, {"input_ids", "attention_mask"}),
+            one per bucket that's used.
+        """
+        encodings = self.tokenizer.encode_batch(list(texts))
+        if not self.length_buckets:
+            input_ids, attention_mask = self._pad(encodings)
+            return [
+                (
+                    list(range(len(encodings))),
+                    {"input_ids": input_ids, "attention_mask": attention_mask},
+                )
+            ]
+
+        groups = {}
+        for row, encoding in enumerate(encodings):
+            groups.setdefault(bucket_length(len(encoding.ids), self.length_buckets), []).append(row)
+
+        batches = []
+        for rows in groups.values():
+            input_ids, attention_mask = self._pad([encodings[row] for row in rows])
+            batches.append((rows, {"input_ids": input_ids, "attention_mask": attention_mask}))
+        return batches
+
 
-def create_minimal_tokenizer():
+def create_minimal_tokenizer(length_buckets=LENGTH_BUCKETS):
     """Create a minimal tokenizer that mimics CLIPTokenizer behavior"""
-    try:
-        return MinimalCLIPTokenizer()
-    except Exception as e:
-        print(f"Warning: Could not create minimal tokenizer: {e}")
-        print("Falling back to transformers CLIPTokenizer")
-        from transformers import CLIPTokenizer
-
-        return CLIPTokenizer.from_pretrained("openai/clip-vit-base-patch32")
+    return MinimalCLIPTokenizer(length_buckets=length_buckets)
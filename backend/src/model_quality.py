@@ -0,0 +1,134 @@
+"""
+Accuracy gate for text encoder variants (like the int8 quantized model).
+
+A variant is compared against the fp32 model on a fixed set of flag
+descriptions: how close its embeddings are (cosine similarity), and how much
+of the fp32 top-k it still finds. The result is saved as a report next to the
+variant, and FlagSearcher refuses to load a variant without a passing one.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+from pydantic import BaseModel
+
+# A variant has to clear both of these to be used
+MIN_MEAN_COSINE = 0.98
+MIN_TOP_K_OVERLAP = 0.75
+
+CHECK_QUERIES = [
+    "red white and blue stripes",
+    "green with a star",
+    "a red maple leaf on white",
+    "blue and yellow nordic cross",
+    "red circle on a white background",
+    "black red and gold horizontal stripes",
+    "green white and orange vertical stripes",
+    "blue with white stars and a union jack",
+    "a crescent moon and a star",
+    "an eagle holding a snake",
+    "a dragon",
+    "red with a yellow star in the corner",
+    "white cross on red",
+    "sun with a face",
+    "green yellow and red with a black star",
+    "triangle on the left side",
+    "diagonal stripe",
+    "a tree in the middle",
+    "a shield with two animals",
+    "plain white flag",
+]
+
+
+class QualityReport(BaseModel):
+    """How a model variant did against the fp32 reference"""
+
+    model_sha256: str
+    reference_sha256: str
+    top_k: int
+    mean_cosine: float
+    min_cosine: float
+    mean_top_k_overlap: float
+    passed: bool
+
+
+def report_path(model_path) -> Path:
+    """The report lives next to the model, e.g. clip-text-encoder-int8.quality.json"""
+    return Path(model_path).with_suffix(".quality.json")
+
+
+def compare_embeddings(reference, candidate, flag_embeddings, top_k):
+    """
+    Compare text embeddings from two models for the same queries.
+
+    Arguments:
+        reference (np.ndarray): unit-length embeddings from the fp32 model, one row per query
+        candidate (np.ndarray): same, from the variant
+        flag_embeddings (np.ndarray): unit-length flag embeddings to retrieve from
+        top_k (int): how many retrieved flags to compare
+
+    Returns:
+        (mean cosine, min cosine, mean top-k overlap)
+    """
+    cosines = np.sum(reference * candidate, axis=-1)
+
+    reference_top = np.argsort(-(reference @ flag_embeddings.T), axis=-1)[:, :top_k]
+    candidate_top = np.argsort(-(candidate @ flag_embeddings.T), axis=-1)[:, :top_k]
+    overlaps = [
+        len(set(ref_row) & set(cand_row)) / top_k
+        for ref_row, cand_row in zip(reference_top.tolist(), candidate_top.tolist())
+    ]
+
+    return float(np.mean(cosines)), float(np.min(cosines)), float(np.mean(overlaps))
+
+
+def evaluate(reference, candidate, flag_embeddings, top_k, model_sha256, reference_sha256):
+    """Build the QualityReport, pass/fail included"""
+    mean_cosine, min_cosine, mean_overlap = compare_embeddings(
+        reference, candidate, flag_embeddings, top_k
+    )
+    return QualityReport(
+        model_sha256=model_sha256,
+        reference_sha256=reference_sha256,
+        top_k=top_k,
+        mean_cosine=mean_cosine,
+        min_cosine=min_cosine,
+        mean_top_k_overlap=mean_overlap,
+        passed=mean_cosine >= MIN_MEAN_COSINE and mean_overlap >= MIN_TOP_K_OVERLAP,
+    )
+
+
+def save_report(report: QualityReport, model_path) -> Path:
+    out_name = report_path(model_path)
+    with out_name.open("w") as f:
+        json.dump(report.model_dump(), f, indent=1)
+    return out_name
+
+
+def require_passing_report(model_path, model_sha256):
+    """
+    Raise ValueError unless `model_path` has a passing report, made for
+    exactly this model file.
+    """
+    path = report_path(model_path)
+    if not path.is_file():
+        raise ValueError(
+            f"No quality report for {model_path}. "
+            "Please run backend/scripts/check_model_variant.py before using it."
+        )
+    with path.open() as f:
+        report = QualityReport(**json.load(f))
+
+    if report.model_sha256 != model_sha256:
+        raise ValueError(
+            f"The quality report for {model_path} was made for a different model file. "
+            "Please re-run backend/scripts/check_model_variant.py."
+        )
+    if not report.passed:
+        raise ValueError(
+            f"{model_path} failed the quality check: mean cosine {report.mean_cosine:.4f} "
+            f"(need {MIN_MEAN_COSINE}), top-{report.top_k} overlap "
+            f"{report.mean_top_k_overlap:.2f} (need {MIN_TOP_K_OVERLAP})."
+        )
+    return report
@@ -0,0 +1,131 @@
+"""
+Building the ONNX Runtime session for the text encoder.
+
+The session options are configurable, and the graph ONNX Runtime optimizes
+on first load is written to disk, so later starts skip the optimization.
+"""
+
+import hashlib
+import os
+import platform
+import time
+from pathlib import Path
+from typing import Literal, Optional
+
+import onnxruntime as ort
+from pydantic import BaseModel
+
+from backend.src.cpu_budget import cpu_budget
+
+OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+class SessionConfig(BaseModel):
+    """
+    Knobs for the ONNX Runtime session.
+
+    Thread counts of 0 mean one thread per CPU in this process's budget
+    (cgroup quota and affinity mask, see backend/src/cpu_budget.py), not
+    per host core like ONNX Runtime would pick. Inter-op threads default to
+    1: they only run in the parallel execution mode, where each one runs
+    nodes on intra_op_threads threads, so the two multiply. If
+    optimized_model_dir is set, the optimized graph gets cached there.
+    """
+
+    graph_optimization_level: Literal["disable", "basic", "extended", "all"] = "all"
+    intra_op_threads: int = 0
+    inter_op_threads: int = 1
+    enable_cpu_mem_arena: bool = True
+    enable_mem_pattern: bool = True
+    execution_mode: Literal["sequential", "parallel"] = "sequential"
+    optimized_model_dir: Optional[Path] = None
+
+
+def build_session_options(config: SessionConfig) -> ort.SessionOptions:
+    """Turn a SessionConfig into ort.SessionOptions"""
+    options = ort.SessionOptions()
+    options.graph_optimization_level = OPTIMIZATION_LEVELS[config.graph_optimization_level]
+    if config.intra_op_threads == 0 or config.inter_op_threads == 0:
+        budget = cpu_budget().cpus
+    options.intra_op_num_threads = config.intra_op_threads or budget
+    options.inter_op_num_threads = config.inter_op_threads or budget
+    options.enable_cpu_mem_arena = config.enable_cpu_mem_arena
+    options.enable_mem_pattern = config.enable_mem_pattern
+    options.execution_mode = EXECUTION_MODES[config.execution_mode]
+    return options
+
+
+def cpu_fingerprint(cpuinfo_path="/proc/cpuinfo"):
+    """
+    The architecture plus a short hash of the CPU model and its instruction
+    set flags. At the "all" level, ONNX Runtime can pick layouts and fused
+    kernels for the CPU it optimizes on.
+    """
+    description = platform.processor()
+    try:
+        with Path(cpuinfo_path).open() as f:
+            lines = f.read().split("\n\n")[0].splitlines()
+        # The first processor's model and flags, the rest repeat them
+        description = "\n".join(
+            line for line in lines if line.split(":")[0].strip() in ("model name", "flags")
+        )
+    except OSError:
+        pass
+    return f"{platform.machine()}-{hashlib.sha256(description.encode()).hexdigest()[:12]}"
+
+
+def optimized_model_path(model_path, config: SessionConfig) -> Path:
+    """
+    Where the optimized graph for this model and config lives in the cache.
+
+    The name changes with the model file, the optimization level, the ONNX
+    Runtime version and the CPU, so a stale optimized graph never gets
+    loaded, even from a cache directory that moved to another machine.
+    """
+    model_path = Path(model_path)
+    stat = model_path.stat()
+    name = (
+        f"{model_path.stem}.{stat.st_size}-{stat.st_mtime_ns}"
+        f".{config.graph_optimization_level}.ort{ort.__version__}.{cpu_fingerprint()}.onnx"
+    )
+    return Path(config.optimized_model_dir) / name
+
+
+def create_session(model_path, config: Optional[SessionConfig] = None) -> ort.InferenceSession:
+    """
+    Build the InferenceSession for `model_path`.
+
+    With an optimized_model_dir, the first start saves the optimized graph
+    there and later starts load it with graph optimization turned off.
+    """
+    config = config or SessionConfig()
+    options = build_session_options(config)
+    providers = ["CPUExecutionProvider"]
+
+    if config.optimized_model_dir is None:
+        return ort.InferenceSession(str(model_path), options, providers=providers)
+
+    cached_path = optimized_model_path(model_path, config)
+    if cached_path.is_file():
+        # Already optimized, doing it again would just be wasted startup time
+        options.graph_optimization_level = OPTIMIZATION_LEVELS["disable"]
+        return ort.InferenceSession(str(cached_path), options, providers=providers)
+
+    # Write under a temporary name and rename it into place, so a worker starting
+    # at the same moment never loads a half-written file.
+    cached_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cached_path.with_name(f"{cached_path.name}.{os.getpid()}.{time.time_ns()}.tmp")
+    options.optimized_model_filepath = str(tmp_path)
+    session = ort.InferenceSession(str(model_path), options, providers=providers)
+    if tmp_path.is_file():
+        tmp_path.replace(cached_path)
+    return session
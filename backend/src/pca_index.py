@@ -0,0 +1,134 @@
+"""
+PCA first pass: scan the flag embeddings projected down to a few principal
+components for candidates, then re-rank those with the full vectors.
+
+CLIP embeddings are 512-dim, but most of the spread between flags sits in
+far fewer directions. The projection is fitted offline by
+backend/scripts/build_pca_index.py and saved next to embeddings.npy.
+"""
+
+import numpy as np
+
+from backend.src.flag_index import (
+    CHUNK_ROWS,
+    inverse_row_norms,
+    load_index_arrays,
+    rerank,
+    save_index_arrays,
+    top_k_indices,
+)
+
+PCA_INDEX_DIRNAME = "pca_index"
+
+
+def fit_pca(embeddings, dims):
+    """
+    Fit a PCA projection to the normalized `embeddings` (read in chunks, so
+    it can be memory-mapped) and project them.
+
+    Returns:
+        dict of arrays, for save_pca_index: the mean, the top `dims`
+        components (rows, biggest variance first), the projected flags,
+        and the inverse norms of the raw rows for re-ranking.
+    """
+    n_rows, dim = embeddings.shape
+    if not 0 < dims <= dim:
+        raise ValueError(f"dims has to be between 1 and {dim}, got {dims}")
+    inverse_norms = inverse_row_norms(embeddings)
+
+    def normalized_chunks():
+        for start in range(0, n_rows, CHUNK_ROWS):
+            chunk = np.asarray(embeddings[start : start + CHUNK_ROWS], dtype=np.float64)
+            yield start, chunk * inverse_norms[start : start + len(chunk), None]
+
+    # Covariance from running sums, so the whole matrix never has to be in memory
+    total = np.zeros(dim)
+    outer = np.zeros((dim, dim))
+    for _, chunk in normalized_chunks():
+        total += chunk.sum(axis=0)
+        outer += chunk.T @ chunk
+    mean = total / n_rows
+    covariance = outer / n_rows - np.outer(mean, mean)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1][:dims]
+    components = eigenvectors[:, order].T.astype(np.float32)
+
+    reduced = np.empty((n_rows, dims), dtype=np.float32)
+    for start, chunk in normalized_chunks():
+        reduced[start : start + len(chunk)] = (chunk - mean) @ components.T
+    explained = eigenvalues[order].sum() / eigenvalues.sum()
+    return {
+        "mean": mean.astype(np.float32),
+        "components": components,
+        "reduced": reduced,
+        "inverse_norms": inverse_norms,
+        "explained_variance": np.float32(explained),
+    }
+
+
+def save_pca_index(arrays, directory, embeddings_filename):
+    """Write the arrays as .npy files, plus the fingerprint of the embeddings they came from"""
+    save_index_arrays(
+        arrays, directory, embeddings_filename, dims=int(arrays["components"].shape[0])
+    )
+
+
+class PCAIndex:
+    """
+    Scans the projected flags with the projected query, then re-ranks the
+    `candidates` best against the exact vectors from `embeddings`.
+
+    Components are sorted by variance, so an index fitted with D dims can
+    be searched with any `dims` up to D.
+    """
+
+    def __init__(self, arrays, embeddings, dims=0, candidates=64):
+        fitted_dims = arrays["components"].shape[0]
+        dims = dims or fitted_dims
+        if dims > fitted_dims:
+            raise ValueError(f"The PCA index has {fitted_dims} dims, can't search with {dims}")
+        self.dims = dims
+        self.candidates = candidates
+        self._embeddings = embeddings
+        self._inverse_norms = arrays["inverse_norms"]
+        self._components = np.ascontiguousarray(arrays["components"][:dims])
+        self._reduced = arrays["reduced"]
+        if dims < fitted_dims:
+            # Contiguous copy of the leading columns, a strided scan would be slow
+            self._reduced = np.ascontiguousarray(self._reduced[:, :dims])
+
+    def __len__(self):
+        return len(self._reduced)
+
+    @property
+    def nbytes(self):
+        """Memory the index takes up (the exact vectors for re-ranking not included)"""
+        return self._reduced.nbytes + self._components.nbytes + self._inverse_norms.nbytes
+
+    def search(self, queries, k):
+        """
+        The best k flags for each of the unit-length `queries`.
+
+        Returns:
+            list of (indices, scores), one per query, best first
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        # x.q = mean.q + (projected x).(projected q), and mean.q is the same for every
+        # flag, so the projected product alone ranks them
+        approximate_scores = (queries @ self._components.T) @ self._reduced.T
+        n_candidates = max(k, self.candidates)
+        return [
+            rerank(
+                self._embeddings, self._inverse_norms, query, top_k_indices(scores, n_candidates), k
+            )
+            for query, scores in zip(queries, approximate_scores)
+        ]
+
+
+def load_pca_index(directory, embeddings_filename, dims=0, candidates=64):
+    """Load an index saved by save_pca_index, memory-mapped"""
+    arrays, _ = load_index_arrays(
+        directory, embeddings_filename, "backend/scripts/build_pca_index.py"
+    )
+    embeddings = np.load(embeddings_filename, mmap_mode="r")
+    return PCAIndex(arrays, embeddings, dims=dims, candidates=candidates)
@@ -0,0 +1,84 @@
+"""
+Pre-fork serving: load the read-only data once in a parent process, then
+fork the workers from it.
+
+`uvicorn --workers N` starts every worker from scratch, so each one loads
+its own copy of the flags, their embeddings and the index. Forked after
+loading, the workers share those pages with the parent copy-on-write, and
+since nothing writes to them they stay shared. What each worker adds is
+its own ONNX session (ONNX Runtime's thread pools don't survive a fork, so
+sessions are made after it), its caches, and what requests allocate.
+
+The parent mustn't start any threads before forking, a forked child only
+gets the thread that called fork().
+"""
+
+import gc
+import os
+import signal
+import time
+
+import uvicorn
+
+# Wait this long before replacing a worker that died, so one that dies on startup
+# doesn't turn into a fork loop
+RESTART_DELAY_S = 1.0
+
+
+def serve(app, workers, host="0.0.0.0", port=8000, preload=None):
+    """
+    Serve `app` from `workers` forked processes, all accepting on one socket.
+
+    `preload()` runs in the parent before the fork, the app's lifespan hook
+    runs in every worker after it. A worker that dies is replaced, SIGINT or
+    SIGTERM stops them all.
+    """
+    config = uvicorn.Config(app, host=host, port=port)
+    sock = config.bind_socket()
+    if preload is not None:
+        preload()
+    # Whatever's loaded by now is left out of garbage collection from here on, otherwise
+    # a collection in a worker writes to every object's header and copies those pages
+    gc.freeze()
+
+    children = set()
+    stopping = False
+
+    def start_worker():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            exit_code = 1
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+                exit_code = 0
+            finally:
+                os._exit(exit_code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        start_worker()
+    print(f"Started {workers} workers: {sorted(children)}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"Warning: worker {pid} exited with status {status}, starting a new one.")
+            time.sleep(RESTART_DELAY_S)
+            # A stop signal during the delay only reached the workers that were there
+            if not stopping:
+                start_worker()
+    sock.close()
@@ -0,0 +1,63 @@
+"""
+Where the server is in starting up, for the /health and /ready endpoints.
+
+Loading the model and embeddings, then warming them up, happens in the
+background after the process starts: /health answers right away, and /ready
+only says yes once warmup is done, so a load balancer sends traffic to warm
+instances only.
+"""
+
+import threading
+import time
+
+PHASES = ("loading", "warming", "ready")
+
+
+class Readiness:
+    """
+    The startup phase ("loading", then "warming", then "ready", or
+    "failed" if loading raised), and how long each phase took.
+    """
+
+    def __init__(self):
+        self.phase = PHASES[0]
+        self.error = None
+        self.timings_s = {}
+        self.details = {}
+        self._started = time.perf_counter()
+        self._phase_started = self._started
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.phase == "ready"
+
+    def advance(self, phase, **details):
+        """Finish the current phase and start `phase`. `details` go into to_dict()"""
+        if phase not in PHASES:
+            raise ValueError(f"Unknown phase '{phase}', options are {PHASES}")
+        with self._lock:
+            now = time.perf_counter()
+            self.timings_s[self.phase] = now - self._phase_started
+            self._phase_started = now
+            self.phase = phase
+            self.details.update(details)
+
+    def fail(self, error):
+        with self._lock:
+            self.timings_s[self.phase] = time.perf_counter() - self._phase_started
+            self.phase = "failed"
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        with self._lock:
+            timings_s = dict(self.timings_s)
+            if self.phase in ("loading", "warming"):
+                timings_s[self.phase] = time.perf_counter() - self._phase_started
+            return {
+                "status": self.phase,
+                "uptime_s": time.perf_counter() - self._started,
+                "timings_s": timings_s,
+                "error": self.error,
+                **self.details,
+            }
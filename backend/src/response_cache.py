@@ -0,0 +1,119 @@
+"""
+Cache of whole serialized responses, so an identical request skips the
+searcher (embedding, similarity scan, top-k and serialization) entirely.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def dataset_version(paths):
+    """
+    Short version string for a set of data files, taken from their sizes and
+    modification times. It changes whenever one of the files is rewritten.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = Path(path).stat()
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    LRU cache of response bytes keyed by (normalized query, top_k, dataset
+    version), with a size limit and a time-to-live.
+
+    `watched_files` are the dataset files (flags.json and the embeddings).
+    At most every `check_interval_s` seconds their version is looked up again,
+    and if anything changed the whole cache is dropped.
+    """
+
+    def __init__(self, watched_files, max_entries=10_000, ttl_s=3600.0, check_interval_s=1.0):
+        if max_entries < 0:
+            raise ValueError(f"max_entries can't be negative, got {max_entries}")
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._watched_files = [Path(path) for path in watched_files]
+        self._check_interval_s = check_interval_s
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.version = dataset_version(self._watched_files)
+        self._last_checked = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, now):
+        if now - self._last_checked < self._check_interval_s:
+            return
+        self._last_checked = now
+        try:
+            version = dataset_version(self._watched_files)
+        except FileNotFoundError:
+            # Mid-rewrite, most likely. Drop everything and check again next time.
+            version = None
+        if version != self.version:
+            self.version = version
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, query, top_k):
+        """The cached response bytes for this (normalized) query and top_k, or None"""
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(now)
+            key = (query, top_k, self.version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, body = entry
+            if now >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, query, top_k, body):
+        """Store the response bytes, evicting the least recently used entries if full"""
+        if self.max_entries == 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(now)
+            key = (query, top_k, self.version)
+            self._entries[key] = (now + self.ttl_s, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "dataset_version": self.version,
+        }
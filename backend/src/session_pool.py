@@ -0,0 +1,96 @@
+"""
+Pool of text encoders, each with its own ONNX Runtime session, that requests
+lease one at a time.
+
+One session with many intra-op threads is best for big batches, but lots of
+small batch-1 requests go through faster on several sessions with a thread
+or two each, running side by side. Which one wins depends on the traffic,
+so FlagSearcher can do either.
+
+Every session holds its own copy of the model weights, so memory grows with
+the pool size.
+"""
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from backend.src.cpu_budget import cpu_budget
+from backend.src.onnx_session import SessionConfig
+
+
+def default_pool_size(intra_op_threads, cpu_count=None):
+    """As many sessions as fit in the CPU budget, at `intra_op_threads` threads each"""
+    cpu_count = cpu_count or cpu_budget().cpus
+    return max(1, cpu_count // max(1, intra_op_threads))
+
+
+def pool_session_config(config: SessionConfig) -> SessionConfig:
+    """
+    The config for a pooled session. Left at 0, every session would get a
+    thread per CPU, so pooled sessions get 1 intra-op thread unless told
+    otherwise.
+    """
+    if config.intra_op_threads == 0:
+        return config.model_copy(update={"intra_op_threads": 1})
+    return config
+
+
+class SessionPool:
+    """
+    Hands out `items` (the per-session encoders) to one caller at a time.
+
+    `lease()` blocks until one is free. Counts how many leases had to wait
+    and for how long, for /metrics.
+    """
+
+    def __init__(self, items):
+        items = list(items)
+        if not items:
+            raise ValueError("A SessionPool needs at least one item")
+        self.size = len(items)
+        # Every item, leased or not, for setup work like warmup before any requests come in
+        self.items = tuple(items)
+        self._idle = queue.LifoQueue()
+        for item in items:
+            self._idle.put(item)
+        self._lock = threading.Lock()
+
+        self.leases = 0
+        self.waited = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    @contextmanager
+    def lease(self):
+        """Borrow an item for the duration of the with block"""
+        try:
+            item = self._idle.get_nowait()
+            wait_s = None
+        except queue.Empty:
+            start = time.perf_counter()
+            item = self._idle.get()
+            wait_s = time.perf_counter() - start
+
+        with self._lock:
+            self.leases += 1
+            if wait_s is not None:
+                self.waited += 1
+                self.total_wait_s += wait_s
+                self.max_wait_s = max(self.max_wait_s, wait_s)
+
+        try:
+            yield item
+        finally:
+            self._idle.put(item)
+
+    def to_dict(self):
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "leases": self.leases,
+            "waited": self.waited,
+            "mean_wait_ms": 1000 * self.total_wait_s / self.waited if self.waited else 0.0,
+            "max_wait_ms": 1000 * self.max_wait_s,
+        }
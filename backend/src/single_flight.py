@@ -0,0 +1,73 @@
+"""
+Request coalescing: when several requests for the same query are in flight
+at once, only the first one does the work and the rest wait for its result.
+"""
+
+import asyncio
+
+
+class _Flight:
+    """One running computation and how many callers are waiting on it"""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time. Callers that show up
+    while one is running just await that one instead of starting their own.
+
+    The computation runs as its own task, so the caller that started it
+    can disconnect without cancelling it for everybody else. Once every
+    caller has left, though, it's cancelled: nobody wants the result.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0
+        self.collapsed = 0
+        self.abandoned = 0
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    async def run(self, key, make_coroutine):
+        """
+        Await the result for `key`, calling `make_coroutine()` to compute it
+        only if nobody else is already doing so.
+        """
+        flight = self._in_flight.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(make_coroutine()))
+            self._in_flight[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.calls += 1
+        else:
+            self.collapsed += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # The last caller left, a new one for this key has to start over
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key, flight):
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "abandoned": self.abandoned,
+            "in_flight": len(self),
+        }
@@ -0,0 +1,41 @@
+"""
+Synthetic embeddings and the recall measure shared by the index tests and
+benchmarks.
+"""
+
+import numpy as np
+
+from backend.src.flag_index import normalize_rows, top_k_indices
+
+TOP_K = 8
+
+
+def clustered_embeddings(n_rows, dim=512, n_clusters=50, spread=1.0, seed=0):
+    """
+    Synthetic stand-in for CLIP embeddings: noisy points around cluster
+    centers, `spread` times further apart than the noise.
+    """
+    rng = np.random.default_rng(seed)
+    centers = spread * rng.standard_normal((n_clusters, dim))
+    points = centers[rng.integers(n_clusters, size=n_rows)] + rng.standard_normal((n_rows, dim))
+    return points.astype(np.float32)
+
+
+def synthetic_embeddings(n_rows, rng, dim=512, n_clusters=200, spread=0.5, chunk_rows=100_000):
+    """Like clustered_embeddings, but made in chunks to keep memory down for big catalogs"""
+    centers = spread * rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    embeddings = np.empty((n_rows, dim), dtype=np.float32)
+    for start in range(0, n_rows, chunk_rows):
+        n = min(chunk_rows, n_rows - start)
+        embeddings[start : start + n] = centers[rng.integers(n_clusters, size=n)]
+        embeddings[start : start + n] += rng.standard_normal((n, dim), dtype=np.float32)
+    return embeddings
+
+
+def recall_at_k(index, embeddings, queries, k=TOP_K):
+    """Fraction of the exact top-k that the index finds"""
+    exact_scores = queries @ normalize_rows(embeddings).T
+    found = 0
+    for (indices, _), scores in zip(index.search(queries, k), exact_scores):
+        found += len(set(indices.tolist()) & set(top_k_indices(scores, k).tolist()))
+    return found / (k * len(queries))
@@ -0,0 +1,94 @@
+"""
+Benchmark for the flag indexes against the exact scan, on synthetic
+catalogs of clustered 512-dim embeddings: memory, latency per query and
+recall@8 against the exact result.
+
+Sizes can be given on the command line, e.g.
+    python backend/tests/speed_test_flag_index.py 10000 100000 1000000
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_index import IndexConfig, load_index, normalize_rows, top_k_indices
+from backend.tests.index_helpers import synthetic_embeddings
+
+DEFAULT_SIZES = [10_000, 100_000]
+DIM = 512
+N_CLUSTERS = 200
+# Clusters overlap a fair bit and queries are noisy, like descriptions drawn by hand
+CENTER_SPREAD = 0.5
+QUERY_NOISE = 2.0
+N_QUERIES = 50
+TOP_K = 8
+CONFIGS = [
+    IndexConfig(kind="int8", candidates=64),
+    IndexConfig(kind="float16", candidates=64),
+    IndexConfig(kind="int8", candidates=16),
+    IndexConfig(kind="int8", candidates=8),
+]
+
+
+def time_per_query(search, queries):
+    search(queries[:1])
+    start = time.perf_counter()
+    results = [search(query[None])[0] for query in queries]
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    for n_rows in sizes:
+        embeddings = synthetic_embeddings(n_rows, rng, DIM, N_CLUSTERS, CENTER_SPREAD)
+        queries = normalize_rows(
+            embeddings[rng.integers(n_rows, size=N_QUERIES)]
+            + QUERY_NOISE * rng.standard_normal((N_QUERIES, DIM)).astype(np.float32)
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            embeddings_file = Path(tmp_dir) / "embeddings.npy"
+            np.save(embeddings_file, embeddings)
+            del embeddings
+
+            exact_matrix = normalize_rows(np.load(embeddings_file))
+
+            def exact_search(query_rows):
+                scores = query_rows @ exact_matrix.T
+                return [(top_k_indices(row, TOP_K), None) for row in scores]
+
+            exact_time, exact_results = time_per_query(exact_search, queries)
+            print(
+                f"{n_rows:>9} flags | {'exact':>22} | {exact_matrix.nbytes / 2**20:8.1f} MB"
+                f" | {1000 * exact_time:7.2f} ms/query | recall@{TOP_K} 1.000"
+            )
+            expected = [set(indices.tolist()) for indices, _ in exact_results]
+
+            for config in CONFIGS:
+                start = time.perf_counter()
+                index = load_index(embeddings_file, config)
+                build_time = time.perf_counter() - start
+
+                elapsed, results = time_per_query(
+                    lambda query_rows, index=index: index.search(query_rows, TOP_K), queries
+                )
+                found = sum(
+                    len(set(indices.tolist()) & exact)
+                    for (indices, _), exact in zip(results, expected)
+                )
+                name = f"{config.kind}, {config.candidates} candidates"
+                print(
+                    f"{n_rows:>9} flags | {name:>22} | {index.nbytes / 2**20:8.1f} MB"
+                    f" | {1000 * elapsed:7.2f} ms/query | recall@{TOP_K}"
+                    f" {found / (TOP_K * N_QUERIES):.3f} | built in {build_time:.1f}s"
+                )
+                del index
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,64 @@
+"""
+Benchmark for the IOBinding text encoder against plain session.run: time
+per call, and how much extra memory (by tracemalloc) a call has live at its
+peak. What's left on the IOBinding side is small Python objects (token id
+lists, ONNX Runtime's wrappers), not arrays.
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_searcher import FlagSearcher
+
+N_WARMUP = 20
+N_QUERIES = 500
+TEXTS = {
+    "1 short query": ["red white and blue stripes"],
+    "8 mixed queries": ["maple leaf", "green with a star", "a red dragon on white"] * 2
+    + ["blue " * 20, "stripes " * 40],
+}
+
+
+def peak_bytes_per_query(encode, texts):
+    """Biggest amount of extra memory a single call has live at once"""
+    for _ in range(N_WARMUP):
+        encode(texts)
+    tracemalloc.start()
+    peaks = []
+    for _ in range(N_QUERIES):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        encode(texts)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return float(np.mean(peaks))
+
+
+def seconds_per_query(encode, texts):
+    for _ in range(N_WARMUP):
+        encode(texts)
+    start = time.perf_counter()
+    for _ in range(N_QUERIES):
+        encode(texts)
+    return (time.perf_counter() - start) / N_QUERIES
+
+
+searchers = {
+    "IOBinding": FlagSearcher(top_k=8, embedding_cache_bytes=0, io_binding=True),
+    "session.run": FlagSearcher(top_k=8, embedding_cache_bytes=0, io_binding=False),
+}
+for texts_name, texts in TEXTS.items():
+    for searcher_name, searcher in searchers.items():
+        encode = searcher._encode_text
+        elapsed = seconds_per_query(encode, texts)
+        peak = peak_bytes_per_query(encode, texts)
+        print(
+            f"{texts_name:>16} | {searcher_name:>11} | {elapsed:.2e}s per call"
+            f" | peak {peak:8.0f} B extra per call"
+        )
@@ -0,0 +1,104 @@
+"""
+Benchmark for the IVF index (with and without PQ) against the exact scan,
+on synthetic catalogs of clustered 512-dim embeddings: build time, memory,
+and latency per query versus recall@8 for a few probe counts.
+
+Sizes can be given on the command line; the 1M build takes a while:
+    python backend/tests/speed_test_ivf_index.py 10000 100000 1000000
+"""
+
+import math
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_index import normalize_rows, top_k_indices
+from backend.src.ivf_index import build_ivf_index, load_ivf_index, save_ivf_index
+from backend.tests.index_helpers import synthetic_embeddings
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DIM = 512
+N_CLUSTERS = 200
+# Clusters overlap a fair bit and queries are noisy, like descriptions drawn by hand
+CENTER_SPREAD = 0.5
+QUERY_NOISE = 2.0
+N_QUERIES = 50
+TOP_K = 8
+N_PROBES = (1, 4, 16, 64)
+# (PQ subvectors, candidates to re-rank), 0 subvectors keeps the full vectors
+VARIANTS = ((0, 0), (64, 256))
+# Smaller k-means training sample than the build script's default, so 1M builds in minutes
+POINTS_PER_CLUSTER = 64
+
+
+def exact_top_k(embeddings_file, queries):
+    """Exact top-k per query and the time per query, scanning in chunks"""
+    embeddings = np.load(embeddings_file, mmap_mode="r")
+    matrix = normalize_rows(embeddings)
+    start = time.perf_counter()
+    results = [set(top_k_indices(matrix @ query, TOP_K).tolist()) for query in queries]
+    return results, (time.perf_counter() - start) / len(queries), matrix.nbytes
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    for n_rows in sizes:
+        embeddings = synthetic_embeddings(n_rows, rng, DIM, N_CLUSTERS, CENTER_SPREAD)
+        queries = normalize_rows(
+            embeddings[rng.integers(n_rows, size=N_QUERIES)]
+            + QUERY_NOISE * rng.standard_normal((N_QUERIES, DIM)).astype(np.float32)
+        )
+        n_lists = max(1, int(math.sqrt(n_rows)))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            embeddings_file = Path(tmp_dir) / "embeddings.npy"
+            np.save(embeddings_file, embeddings)
+            del embeddings
+
+            expected, exact_time, exact_bytes = exact_top_k(embeddings_file, queries)
+            print(
+                f"{n_rows:>9} flags | {'exact':>28} | {exact_bytes / 2**20:8.1f} MB"
+                f" | {1000 * exact_time:7.2f} ms/query | recall@{TOP_K} 1.000"
+            )
+
+            for pq_subvectors, candidates in VARIANTS:
+                embeddings = np.load(embeddings_file, mmap_mode="r")
+                start = time.perf_counter()
+                arrays = build_ivf_index(
+                    embeddings,
+                    n_lists,
+                    pq_subvectors=pq_subvectors,
+                    points_per_cluster=POINTS_PER_CLUSTER,
+                )
+                build_time = time.perf_counter() - start
+                index_dir = Path(tmp_dir) / f"ivf_{pq_subvectors}"
+                save_ivf_index(arrays, index_dir, embeddings_file)
+                del arrays
+
+                index = load_ivf_index(index_dir, embeddings_file, candidates=candidates)
+                name = f"IVF{n_lists}" + (f"-PQ{pq_subvectors}" if pq_subvectors else "")
+                print(f"{n_rows:>9} flags | {name:>28} | built in {build_time:.1f}s")
+                for n_probe in N_PROBES:
+                    index.n_probe = n_probe
+                    index.search(queries[:1], TOP_K)
+                    start = time.perf_counter()
+                    results = [index.search(query[None], TOP_K)[0] for query in queries]
+                    elapsed = (time.perf_counter() - start) / N_QUERIES
+                    found = sum(
+                        len(set(indices.tolist()) & exact)
+                        for (indices, _), exact in zip(results, expected)
+                    )
+                    print(
+                        f"{n_rows:>9} flags | {f'{name}, {n_probe} probes':>28}"
+                        f" | {index.nbytes / 2**20:8.1f} MB | {1000 * elapsed:7.2f} ms/query"
+                        f" | recall@{TOP_K} {found / (TOP_K * N_QUERIES):.3f}"
+                    )
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,90 @@
+"""
+Benchmark: the parallel block-wise exact scan against the current exact
+scan (one matrix product over all flags, then top-k), on random 512-dim
+catalogs. Reports latency per query and the extra memory a query needs at
+its peak (by tracemalloc), which should stay flat for the block scan.
+
+BLAS gets 1 thread, as main.py does for this index, so the scan threads are
+all the parallelism there is and the speedup over 1 thread is the scaling.
+Scaling needs more than one core to show; thread counts go up to the CPU
+budget. Sizes can be given on the command line, e.g.
+    python backend/tests/speed_test_parallel_scan.py 100000 1000000
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.cpu_budget import configure_blas_threads, cpu_budget
+
+# Before numpy gets imported
+configure_blas_threads(1)
+
+import numpy as np  # noqa: E402
+
+from backend.src.flag_index import (  # noqa: E402
+    ParallelExactIndex,
+    normalize_rows,
+    top_k_indices,
+)
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+DIM = 512
+N_QUERIES = 20
+TOP_K = 8
+
+
+def measure(search, queries):
+    """(seconds per query, peak extra bytes per query)"""
+    search(queries[0][None])
+    start = time.perf_counter()
+    for query in queries:
+        search(query[None])
+    elapsed = (time.perf_counter() - start) / len(queries)
+
+    tracemalloc.start()
+    search(queries[0][None])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    budget = cpu_budget().cpus
+    thread_counts = sorted({1, 2, budget, *(2**i for i in range(budget.bit_length()))})
+    print(f"CPU budget {budget}, BLAS threads 1")
+    for n_rows in sizes:
+        matrix = normalize_rows(rng.standard_normal((n_rows, DIM), dtype=np.float32))
+        queries = normalize_rows(rng.standard_normal((N_QUERIES, DIM), dtype=np.float32))
+
+        def current(query_rows, matrix=matrix):
+            scores = matrix @ query_rows[0]
+            best = top_k_indices(scores, TOP_K)
+            return [(best, scores[best])]
+
+        elapsed, peak = measure(current, queries)
+        print(
+            f"{n_rows:>9} flags | {'current (full scores)':>24} | {1000 * elapsed:7.2f} ms/query"
+            f" | peak {peak / 2**10:8.1f} KB extra"
+        )
+        one_thread = None
+        for threads in thread_counts:
+            index = ParallelExactIndex(matrix, threads=threads)
+            elapsed, peak = measure(
+                lambda query_rows, index=index: index.search(query_rows, TOP_K), queries
+            )
+            one_thread = one_thread or elapsed
+            print(
+                f"{n_rows:>9} flags | {f'block scan, {threads} threads':>24}"
+                f" | {1000 * elapsed:7.2f} ms/query | peak {peak / 2**10:8.1f} KB extra"
+                f" | {one_thread / elapsed:4.2f}x 1 thread"
+            )
+        del matrix
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
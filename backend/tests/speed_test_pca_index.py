@@ -0,0 +1,97 @@
+"""
+Benchmark for the PCA first-pass index against the exact scan: memory,
+latency per query and recall@8 for a few (dims, candidates) settings.
+
+The synthetic embeddings have a power-law spectrum, like CLIP's: a few
+directions carry most of the variance. Sizes can be given on the command
+line, e.g.
+    python backend/tests/speed_test_pca_index.py 10000 100000
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_index import normalize_rows, top_k_indices
+from backend.src.pca_index import fit_pca, load_pca_index, save_pca_index
+
+DEFAULT_SIZES = [10_000, 100_000]
+DIM = 512
+# Standard deviation along the i-th direction goes like i ** -SPECTRUM_DECAY
+SPECTRUM_DECAY = 0.75
+QUERY_NOISE = 0.5
+N_QUERIES = 50
+TOP_K = 8
+FITTED_DIMS = 128
+SETTINGS = [(16, 64), (32, 64), (64, 64), (64, 256), (128, 64)]
+
+
+def synthetic_embeddings(n_rows, rng, chunk_rows=100_000):
+    """Random points with a power-law spectrum, in a random orientation"""
+    scales = np.arange(1, DIM + 1, dtype=np.float32) ** -SPECTRUM_DECAY
+    rotation, _ = np.linalg.qr(rng.standard_normal((DIM, DIM)))
+    rotation = rotation.astype(np.float32)
+    embeddings = np.empty((n_rows, DIM), dtype=np.float32)
+    for start in range(0, n_rows, chunk_rows):
+        n = min(chunk_rows, n_rows - start)
+        embeddings[start : start + n] = (
+            rng.standard_normal((n, DIM), dtype=np.float32) * scales
+        ) @ rotation
+    return embeddings
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    for n_rows in sizes:
+        embeddings = synthetic_embeddings(n_rows, rng)
+        queries = embeddings[rng.integers(n_rows, size=N_QUERIES)]
+        queries = normalize_rows(
+            queries + QUERY_NOISE * np.abs(queries).mean() * rng.standard_normal(queries.shape)
+        )
+
+        exact_matrix = normalize_rows(embeddings)
+        start = time.perf_counter()
+        expected = [set(top_k_indices(exact_matrix @ query, TOP_K).tolist()) for query in queries]
+        exact_time = (time.perf_counter() - start) / N_QUERIES
+        print(
+            f"{n_rows:>9} flags | {'exact':>26} | {exact_matrix.nbytes / 2**20:8.1f} MB"
+            f" | {1000 * exact_time:7.2f} ms/query | recall@{TOP_K} 1.000"
+        )
+        del exact_matrix
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            embeddings_file = Path(tmp_dir) / "embeddings.npy"
+            np.save(embeddings_file, embeddings)
+            start = time.perf_counter()
+            arrays = fit_pca(np.load(embeddings_file, mmap_mode="r"), FITTED_DIMS)
+            print(f"{n_rows:>9} flags | fitted in {time.perf_counter() - start:.1f}s")
+            save_pca_index(arrays, Path(tmp_dir) / "pca", embeddings_file)
+            del arrays
+
+            for dims, candidates in SETTINGS:
+                index = load_pca_index(
+                    Path(tmp_dir) / "pca", embeddings_file, dims=dims, candidates=candidates
+                )
+                index.search(queries[:1], TOP_K)
+                start = time.perf_counter()
+                results = [index.search(query[None], TOP_K)[0] for query in queries]
+                elapsed = (time.perf_counter() - start) / N_QUERIES
+                found = sum(
+                    len(set(indices.tolist()) & exact)
+                    for (indices, _), exact in zip(results, expected)
+                )
+                name = f"PCA-{dims}, {candidates} candidates"
+                print(
+                    f"{n_rows:>9} flags | {name:>26} | {index.nbytes / 2**20:8.1f} MB"
+                    f" | {1000 * elapsed:7.2f} ms/query"
+                    f" | recall@{TOP_K} {found / (TOP_K * N_QUERIES):.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,57 @@
+"""
+Benchmark: building a query's response body from its best flags and scores,
+the old way (a FlagList of scored Flag copies, serialized by pydantic) against
+splicing the pre-serialized flag fragments (FlagMetadata.response_json).
+No model involved, just the step after scoring.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import FlagList, flaglist_from_json
+from backend.src.flag_metadata import FlagMetadata
+from backend.src.flag_searcher import FLAGS_FILE
+
+N_RUNS = 2000
+
+
+def main():
+    flags = flaglist_from_json(FLAGS_FILE).flags
+    start = time.perf_counter()
+    metadata = FlagMetadata.from_flags(flags)
+    print(
+        f"Pre-serializing {len(flags)} flags: {1000 * (time.perf_counter() - start):.1f} ms,"
+        f" {metadata.nbytes / 2**10:.0f} KB"
+    )
+
+    rng = np.random.default_rng(0)
+    for top_k in (8, 50, 200):
+        indices = rng.permutation(len(flags))[:top_k]
+        scores = rng.uniform(-1, 1, top_k).astype(np.float32)
+
+        def pydantic_models(indices=indices, scores=scores):
+            scored = [
+                flags[i].model_copy(update={"score": score})
+                for i, score in zip(indices, scores.tolist())
+            ]
+            return FlagList(flags=scored).model_dump_json().encode()
+
+        def fragments(indices=indices, scores=scores):
+            return metadata.response_json(indices, scores)
+
+        assert pydantic_models() == fragments()
+        for name, build in (("pydantic models", pydantic_models), ("fragments", fragments)):
+            start = time.perf_counter()
+            for _ in range(N_RUNS):
+                build()
+            elapsed = (time.perf_counter() - start) / N_RUNS
+            print(f"top_k {top_k:>3} | {name:>15} | {1e6 * elapsed:8.1f} us/response")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark for the tokenizer's length buckets: p50 and p99 latency for short
+and long queries, with the buckets (16/32/77) and with plain
+pad-to-the-longest.
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from tqdm import trange
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_searcher import FlagSearcher
+from backend.src.minimal_tokenizer import LENGTH_BUCKETS, MinimalCLIPTokenizer
+
+WORDS = ["red", "white", "blue", "green", "stripes", "star", "cross", "circle", "eagle", "moon"]
+N_QUERIES = 200
+
+
+def random_query(n_words):
+    if n_words is None:
+        # Mostly short queries with the odd long one, like real traffic
+        n_words = random.choice([3, 5, 8, 40])
+    return " ".join(random.choice(WORDS) for _ in range(n_words))
+
+
+def latencies(flag_searcher, n_words, batch_size=1):
+    times = []
+    for _ in trange(N_QUERIES, leave=False):
+        texts = [random_query(n_words) for _ in range(batch_size)]
+        start = time.perf_counter()
+        flag_searcher.query_batch(texts)
+        times.append(time.perf_counter() - start)
+    return np.percentile(times, 50), np.percentile(times, 99)
+
+
+# No embedding cache, every query really runs through ONNX
+flag_searcher = FlagSearcher(top_k=8, embedding_cache_bytes=0)
+tokenizers = {
+    f"buckets {LENGTH_BUCKETS}": MinimalCLIPTokenizer(length_buckets=LENGTH_BUCKETS),
+    "pad to longest": MinimalCLIPTokenizer(length_buckets=None),
+}
+workloads = {
+    "short (4 words)": (4, 1),
+    "long (200 words, truncated)": (200, 1),
+    "mixed batch of 16": (None, 16),
+}
+
+for tokenizer_name, tokenizer in tokenizers.items():
+    flag_searcher._tokenizer = tokenizer
+    for workload_name, (n_words, batch_size) in workloads.items():
+        p50, p99 = latencies(flag_searcher, n_words, batch_size)
+        print(f"{tokenizer_name:>24} | {workload_name:<28} | p50 {p50:.2e}s | p99 {p99:.2e}s")
@@ -0,0 +1,81 @@
+"""
+Benchmark: one ONNX session with a thread per core, against a pool of
+sessions with one thread each, under many concurrent batch-1 queries
+(and a few big batches, where the single session should do better).
+
+Reports throughput and p50/p99 latency for each.
+"""
+
+import os
+import random
+import string
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_searcher import FlagSearcher
+from backend.src.onnx_session import SessionConfig
+
+N_QUERIES = 400
+CONCURRENCY = 2 * (os.cpu_count() or 1)
+BIG_BATCH = 64
+N_BIG_BATCHES = 10
+
+
+def random_text():
+    # Random text, so the embedding cache doesn't help
+    return "".join(random.choice(string.ascii_lowercase + " ") for _ in range(20))
+
+
+def run_concurrent(flag_searcher, jobs):
+    def timed(job):
+        start = time.perf_counter()
+        job(flag_searcher)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        start = time.perf_counter()
+        latencies = list(executor.map(timed, jobs))
+        elapsed = time.perf_counter() - start
+    return len(jobs) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def small_jobs():
+    return [
+        lambda searcher, text=random_text(): searcher.query(text, is_image=False)
+        for _ in range(N_QUERIES)
+    ]
+
+
+def big_jobs():
+    return [
+        lambda searcher, texts=[random_text() for _ in range(BIG_BATCH)]: searcher.query_batch(
+            texts
+        )
+        for _ in range(N_BIG_BATCHES)
+    ]
+
+
+cpu_count = os.cpu_count() or 1
+searchers = {
+    f"1 session x {cpu_count} threads": FlagSearcher(
+        top_k=8, embedding_cache_bytes=0, session_config=SessionConfig(intra_op_threads=cpu_count)
+    ),
+    f"{cpu_count} sessions x 1 thread": FlagSearcher(
+        top_k=8, embedding_cache_bytes=0, session_pool_size=0
+    ),
+}
+print(f"{CONCURRENCY} concurrent clients")
+for jobs_name, make_jobs in (("batch-1 queries", small_jobs), ("64-query batches", big_jobs)):
+    for searcher_name, searcher in searchers.items():
+        run_concurrent(searcher, make_jobs()[:CONCURRENCY])  # warmup
+        throughput, p50, p99 = run_concurrent(searcher, make_jobs())
+        print(
+            f"{jobs_name:>16} | {searcher_name:>22} | {throughput:8.1f} requests/s"
+            f" | p50 {1000 * p50:7.2f}ms | p99 {1000 * p99:7.2f}ms"
+        )
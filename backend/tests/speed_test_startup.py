@@ -0,0 +1,123 @@
+"""
+Benchmark: how long loading a flag catalog takes, parsing flags.json into
+Flag objects and normalizing the embeddings (what FlagSearcher does by
+default) against opening a flag bundle (FLAG_BUNDLE). Also the time for a
+first query's exact scan plus building its top 8 Flags, and the memory each
+way allocates (by tracemalloc; the bundle's memory-mapped pages don't count,
+they're shared page cache).
+
+Runs on the national flags, on the commons_plus_national metadata with random
+embeddings (its own embeddings aren't in the repo), and on that metadata
+repeated up to bigger catalogs. Files are warm in the page cache, a cold
+start reads more from disk for flags.json but not for the bundle, which is
+only read where it's used. Sizes can be given on the command line, e.g.
+    python backend/tests/speed_test_startup.py 100000 1000000
+"""
+
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import FlagList, flaglist_from_json
+from backend.src.flag_bundle import FlagBundle, write_bundle
+from backend.src.flag_index import normalize_rows, top_k_indices
+from backend.src.flag_searcher import FLAGS_FILE
+
+COMMONS_FLAGS_FILE = Path("backend/data/commons_plus_national/flags.json")
+DEFAULT_SIZES = [100_000]
+DIM = 512
+N_RUNS = 3
+
+
+def measure(load):
+    """(best seconds to load, extra bytes at the peak), plus what load returned"""
+    times = []
+    for _ in range(N_RUNS):
+        start = time.perf_counter()
+        loaded = load()
+        times.append(time.perf_counter() - start)
+        del loaded
+    tracemalloc.start()
+    loaded = load()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak, loaded
+
+
+def first_query(embeddings, make_flag, query):
+    """Seconds for one exact scan plus building its top 8 Flags"""
+    start = time.perf_counter()
+    scores = embeddings @ query
+    flags = [make_flag(i, float(scores[i])) for i in top_k_indices(scores, 8)]
+    assert len(flags) == 8
+    return time.perf_counter() - start
+
+
+def compare(name, flags_file, out_dir):
+    def from_json():
+        flag_list = flaglist_from_json(flags_file)
+        return flag_list, normalize_rows(np.load(flag_list.embeddings_filename))
+
+    flag_list = flaglist_from_json(flags_file)
+    write_bundle(flag_list, np.load(flag_list.embeddings_filename, mmap_mode="r"), out_dir)
+    query = normalize_rows(np.random.default_rng(1).standard_normal((1, DIM)))[0]
+
+    json_s, json_peak, (flag_list, embeddings) = measure(from_json)
+    json_query_s = first_query(
+        embeddings,
+        lambda i, score: flag_list.flags[i].model_copy(update={"score": score}),
+        query,
+    )
+    bundle_s, bundle_peak, bundle = measure(lambda: FlagBundle(out_dir))
+    bundle_query_s = first_query(bundle.embeddings, bundle.flag, query)
+
+    print(f"{name}, {len(flag_list.flags)} flags:")
+    for label, load_s, peak, query_s in (
+        ("flags.json", json_s, json_peak, json_query_s),
+        ("bundle", bundle_s, bundle_peak, bundle_query_s),
+    ):
+        print(
+            f"  {label:>10} | load {1000 * load_s:9.2f} ms | peak {peak / 2**20:8.2f} MB"
+            f" | first query {1000 * query_s:7.2f} ms"
+        )
+
+
+def synthetic_catalog(directory, n_flags):
+    """commons_plus_national's flags repeated to `n_flags`, with random embeddings"""
+    flags = flaglist_from_json(COMMONS_FLAGS_FILE).flags
+    embeddings_filename = directory / f"embeddings_{n_flags}.npy"
+    embeddings = np.lib.format.open_memmap(
+        embeddings_filename, mode="w+", dtype=np.float32, shape=(n_flags, DIM)
+    )
+    rng = np.random.default_rng(0)
+    for start in range(0, n_flags, 65536):
+        rows = min(65536, n_flags - start)
+        embeddings[start : start + rows] = rng.standard_normal((rows, DIM), dtype=np.float32)
+    embeddings.flush()
+    flag_list = FlagList(
+        flags=[flags[i % len(flags)] for i in range(n_flags)],
+        embeddings_filename=str(embeddings_filename),
+    )
+    flags_file = directory / f"flags_{n_flags}.json"
+    flag_list.to_json(flags_file)
+    return flags_file
+
+
+def main(sizes):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        compare("national_flags", FLAGS_FILE, tmp / "national")
+        n_commons = len(flaglist_from_json(COMMONS_FLAGS_FILE).flags)
+        for n_flags in [n_commons, *sizes]:
+            flags_file = synthetic_catalog(tmp, n_flags)
+            compare("commons_plus_national metadata", flags_file, tmp / f"bundle_{n_flags}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,150 @@
+"""
+Benchmark: memory per worker with `uvicorn --workers N`, where every worker
+loads its own copy of everything, against the pre-fork server
+(backend/src/prefork.py), where the flags, embeddings and index are loaded
+once and forked workers share them copy-on-write.
+
+Starts each server at 1, 2, 4 and 8 workers, waits for all workers to be warm,
+sends a few queries, then reads /proc/<pid>/smaps_rollup for every process:
+  PSS      memory split fairly between the processes that share it, so the PSS
+           of all the processes adds up to what the deployment really uses
+  private  memory only that one process has (USS)
+Every worker gets CPU_BUDGET = CPUs / workers either way. Linux only.
+
+    python backend/tests/speed_test_worker_memory.py [worker counts...]
+
+FLAG_BUNDLE and the other settings in the environment are passed on to the servers.
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.cpu_budget import cpu_budget
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DEFAULT_WORKER_COUNTS = [1, 2, 4, 8]
+N_QUERIES = 50
+STARTUP_TIMEOUT_S = 300
+
+PREFORK = """
+from backend import main
+main.serve(main.app, {workers}, port={port}, preload=main.load_shared)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def command(mode, workers, port):
+    if mode == "uvicorn --workers":
+        return [
+            sys.executable,
+            *("-m", "uvicorn", "backend.main:app", "--port", str(port)),
+            *("--workers", str(workers)),
+        ]
+    return [sys.executable, "-c", PREFORK.format(workers=workers, port=port)]
+
+
+def descendants(pid):
+    """`pid` and every process under it"""
+    children = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    found, todo = [], [pid]
+    while todo:
+        found.append(todo.pop())
+        todo.extend(children.get(found[-1], []))
+    return found
+
+
+def memory_kb(pid):
+    """(PSS, private) of one process, in KB"""
+    values = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value = line.split(":")
+        values[name] = int(value.split()[0])
+    return values["Pss"], values["Private_Clean"] + values["Private_Dirty"]
+
+
+def query(port, text):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/",
+        data=json.dumps({"text_query": text}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        response.read()
+
+
+def measure(mode, workers):
+    """(total PSS, PSS per worker, private per worker), in MB"""
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(PROJECT_ROOT),
+        "PYTHONUNBUFFERED": "1",
+        "CPU_BUDGET": str(max(1, cpu_budget().cpus // workers)),
+        "QUERY_CACHE_PATH": "",
+    }
+    env.pop("WORKERS", None)
+    with tempfile.TemporaryFile("w+") as log:
+        server = subprocess.Popen(
+            command(mode, workers, port), cwd=PROJECT_ROOT, env=env, stdout=log, stderr=log
+        )
+        try:
+            # Every worker prints "Ready:" once it's warm
+            deadline = time.time() + STARTUP_TIMEOUT_S
+            while True:
+                log.seek(0)
+                output = log.read()
+                if output.count("Ready:") >= workers:
+                    break
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError(f"{mode} with {workers} workers didn't start:\n{output}")
+                time.sleep(0.2)
+            for i in range(N_QUERIES):
+                query(port, f"flag number {i}")
+
+            processes = descendants(server.pid)
+            worker_pids = [pid for pid in processes if f"Started server process [{pid}]" in output]
+            memory = {pid: memory_kb(pid) for pid in processes}
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(60)
+
+    total_pss = sum(pss for pss, _ in memory.values())
+    worker_pss = sum(memory[pid][0] for pid in worker_pids) / len(worker_pids)
+    worker_private = sum(memory[pid][1] for pid in worker_pids) / len(worker_pids)
+    return total_pss / 1024, worker_pss / 1024, worker_private / 1024
+
+
+def main(worker_counts):
+    print(f"{'mode':>17} | workers | total PSS | PSS/worker | private/worker")
+    for workers in worker_counts:
+        for mode in ("uvicorn --workers", "prefork"):
+            total, per_worker, private = measure(mode, workers)
+            print(
+                f"{mode:>17} | {workers:>7} | {total:6.0f} MB | {per_worker:7.0f} MB"
+                f" | {private:11.0f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main([int(workers) for workers in sys.argv[1:]] or DEFAULT_WORKER_COUNTS)
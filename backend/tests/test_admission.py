@@ -0,0 +1,119 @@
+"""
+Admission control: a full queue turns requests away with a 503 right away,
+and a request whose client disconnects is cancelled.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.admission import AdmissionControl, ClientDisconnectedError, OverloadedError
+
+
+def test_queue_is_bounded():
+    admission = AdmissionControl(max_queue=2)
+    with admission.admit(), admission.admit():
+        assert admission.depth == 2
+        with pytest.raises(OverloadedError), admission.admit():
+            pass
+    # Places free up as requests finish
+    with admission.admit():
+        pass
+
+    assert admission.to_dict() == {
+        "max_queue": 2,
+        "depth": 0,
+        "max_depth": 2,
+        "admitted": 3,
+        "rejected": 1,
+        "disconnected": 0,
+    }
+    with pytest.raises(ValueError):
+        AdmissionControl(max_queue=0)
+
+
+def _receive(disconnect):
+    """An ASGI receive that reports a disconnect once `disconnect` is set"""
+
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    return receive
+
+
+def test_disconnect_cancels_the_work():
+    admission = AdmissionControl(max_queue=1)
+    state = {}
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def scenario():
+        disconnect = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.05, disconnect.set)
+        with pytest.raises(ClientDisconnectedError):
+            await admission.until_disconnect(_receive(disconnect), work())
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert state == {"cancelled": True}
+    assert admission.disconnected == 1
+
+
+def test_connected_client_gets_the_result():
+    admission = AdmissionControl(max_queue=1)
+
+    async def work():
+        await asyncio.sleep(0.01)
+        return "maple leaf"
+
+    async def failing():
+        raise RuntimeError("model broke")
+
+    async def scenario():
+        receive = _receive(asyncio.Event())
+        assert await admission.until_disconnect(receive, work()) == "maple leaf"
+        with pytest.raises(RuntimeError):
+            await admission.until_disconnect(receive, failing())
+
+    asyncio.run(scenario())
+    assert admission.disconnected == 0
+
+
+def test_overloaded_endpoint():
+    """A full queue gets a 503 with Retry-After, and it's counted in /metrics"""
+    from fastapi.testclient import TestClient
+
+    from backend import main
+
+    main.ensure_loaded()
+    client = TestClient(main.app)
+    main.admission.depth = main.admission.max_queue
+    try:
+        response = client.post("/", json={"text_query": "never asked before, so not cached"})
+        batch = client.post("/batch", json={"text_queries": ["green with a star"]})
+    finally:
+        main.admission.depth = 0
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert batch.status_code == 503
+    assert client.get("/metrics").json()["admission"]["rejected"] >= 2
+    assert client.post("/", json={"text_query": "green with a star"}).status_code == 200
+
+
+if __name__ == "__main__":
+    test_queue_is_bounded()
+    test_disconnect_cancels_the_work()
+    test_connected_client_gets_the_result()
+    test_overloaded_endpoint()
+    print("🎉 All tests passed!")
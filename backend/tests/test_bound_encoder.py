@@ -0,0 +1,87 @@
+"""
+Test that encoding through IOBinding with preallocated buffers gives the same
+embeddings as plain session.run, and that every thread gets its own buffers.
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_searcher import FlagSearcher
+
+TEXTS = [
+    "red white and blue stripes",
+    "green with a star",
+    "a red dragon on white " * 3,  # longer bucket
+    "stripes " * 100,  # truncated to the longest bucket
+]
+
+
+@pytest.fixture(scope="module")
+def bound_searcher():
+    return FlagSearcher(top_k=8, embedding_cache_bytes=0, io_binding=True)
+
+
+@pytest.fixture(scope="module")
+def plain_searcher():
+    return FlagSearcher(top_k=8, embedding_cache_bytes=0, io_binding=False)
+
+
+def test_matches_session_run(bound_searcher, plain_searcher):
+    bound = np.array(bound_searcher._encode_text(TEXTS))
+    plain = plain_searcher._encode_text(TEXTS)
+    assert bound.shape == plain.shape
+    np.testing.assert_allclose(bound, plain, atol=1e-5)
+    np.testing.assert_allclose(np.linalg.norm(bound, axis=-1), 1.0, atol=1e-5)
+
+    for text in TEXTS:
+        np.testing.assert_allclose(
+            bound_searcher._encode_text(text), plain_searcher._encode_text(text), atol=1e-5
+        )
+
+
+def test_buffers_are_reused(bound_searcher):
+    first = bound_searcher._encode_text(TEXTS[:2])
+    second = bound_searcher._encode_text(TEXTS[2:])
+    assert np.shares_memory(first, second)
+
+
+def test_threads_get_their_own_buffers(bound_searcher):
+    results = {}
+
+    def encode(name):
+        results[name] = bound_searcher._encode_text(TEXTS)
+
+    threads = [threading.Thread(target=encode, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not np.shares_memory(results["a"], results["b"])
+    np.testing.assert_allclose(results["a"], results["b"], atol=1e-6)
+
+
+def test_more_texts_than_buffer_rows(bound_searcher, plain_searcher):
+    texts = [f"flag number {i} with {i % 5} stars" for i in range(150)]
+    bound = bound_searcher._encode_text(texts)
+    plain = plain_searcher._encode_text(texts)
+    assert bound.shape == (150, plain.shape[1])
+    np.testing.assert_allclose(bound, plain, atol=1e-5)
+
+
+def test_query_results_match(bound_searcher, plain_searcher):
+    for text in TEXTS:
+        bound = bound_searcher.query(text, is_image=False)
+        plain = plain_searcher.query(text, is_image=False)
+        assert [flag.name for flag in bound.flags] == [flag.name for flag in plain.flags]
+
+
+if __name__ == "__main__":
+    # The searchers are pytest fixtures
+    sys.exit(pytest.main([__file__]))
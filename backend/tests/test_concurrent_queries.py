@@ -0,0 +1,155 @@
+"""
+Stress test: fire a lot of overlapping queries and make sure every response
+gets its own scores, instead of whatever the last query wrote.
+"""
+
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_searcher import FlagSearcher
+
+QUERIES = [
+    "red white and blue stripes",
+    "green with a star",
+    "maple leaf",
+    "yellow cross on blue",
+    "black eagle",
+    "red circle on white",
+]
+
+
+def _summary(flag_list):
+    return [(flag.name, round(flag.score, 5)) for flag in flag_list.flags]
+
+
+def test_overlapping_queries():
+    """Threads hammering one FlagSearcher each get the sequential answer"""
+    searcher = FlagSearcher(top_k=5)
+    expected = {query: _summary(searcher.query(query, is_image=False)) for query in QUERIES}
+    stored_json = searcher.query_batch_json(QUERIES)
+
+    queries = QUERIES * 20
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda q: searcher.query(q, is_image=False), queries))
+
+    for query, result in zip(queries, results):
+        assert _summary(result) == expected[query], f"Wrong scores for '{query}'"
+
+    # The shared pre-serialized flags are never written to
+    assert searcher.query_batch_json(QUERIES) == stored_json
+
+
+def test_overlapping_requests():
+    """Concurrent requests to the endpoint each get the right scores"""
+    from backend import main
+
+    main.ensure_loaded()
+    flag_searcher = main.flag_searcher
+    expected = {query: _summary(flag_searcher.query(query, is_image=False)) for query in QUERIES}
+
+    async def fire_all():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            queries = QUERIES * 10
+            responses = await asyncio.gather(
+                *(client.post("/", json={"text_query": query}) for query in queries)
+            )
+        return queries, responses
+
+    queries, responses = asyncio.run(fire_all())
+    for query, response in zip(queries, responses):
+        assert response.status_code == 200
+        flags = response.json()["flags"]
+        summary = [(flag["name"], round(flag["score"], 5)) for flag in flags]
+        assert summary == expected[query], f"Wrong scores for '{query}'"
+
+
+def test_batch_endpoint():
+    """POST /batch returns one FlagList per description, in order"""
+    from backend import main
+
+    main.ensure_loaded()
+
+    async def post_batch():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/batch", json={"text_queries": QUERIES, "top_k": 3})
+
+    response = asyncio.run(post_batch())
+    assert response.status_code == 200
+    results = response.json()
+    assert len(results) == len(QUERIES)
+    for query, result in zip(QUERIES, results):
+        expected = _summary(main.flag_searcher.query_batch([query], top_k=3)[0])
+        summary = [(flag["name"], round(flag["score"], 5)) for flag in result["flags"]]
+        assert summary == expected, f"Wrong scores for '{query}'"
+
+
+def test_batch_endpoint_rejects_bad_top_k():
+    """A top_k that isn't a sane count gets a 422, not a 500"""
+    from backend import main
+
+    main.ensure_loaded()
+
+    async def post_batch(top_k):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/batch", json={"text_queries": QUERIES, "top_k": top_k})
+
+    for top_k in ("3", 2.5, True, 0, -1, main.flag_searcher.n_flags + 1):
+        assert asyncio.run(post_batch(top_k)).status_code == 422, top_k
+    assert asyncio.run(post_batch(main.flag_searcher.n_flags)).status_code == 200
+
+
+def test_batch_endpoint_rejects_bad_text_queries():
+    """text_queries has to be a list of strings, anything else is a 422"""
+    from backend import main
+
+    main.ensure_loaded()
+
+    async def post_batch(body):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/batch", json=body)
+
+    for body in ({"text_queries": "abc"}, {"text_queries": [1, 2]}, {}, ["abc"]):
+        assert asyncio.run(post_batch(body)).status_code == 422, body
+
+
+def test_repeated_request_served_from_response_cache():
+    """The second identical request is the exact same bytes, straight from the cache"""
+    from backend import main
+
+    main.ensure_loaded()
+    response_cache = main.response_cache
+
+    async def post_twice():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.post("/", json={"text_query": "a flag with a dragon"})
+            second = await client.post("/", json={"text_query": "A flag  with a DRAGON"})
+        return first, second
+
+    hits_before = response_cache.hits
+    first, second = asyncio.run(post_twice())
+
+    assert first.status_code == second.status_code == 200
+    assert first.headers["content-type"] == "application/json"
+    assert first.content == second.content
+    assert response_cache.hits == hits_before + 1
+
+
+if __name__ == "__main__":
+    test_overlapping_queries()
+    test_overlapping_requests()
+    test_batch_endpoint()
+    test_batch_endpoint_rejects_bad_top_k()
+    test_batch_endpoint_rejects_bad_text_queries()
+    test_repeated_request_served_from_response_cache()
+    print("🎉 All tests passed!")
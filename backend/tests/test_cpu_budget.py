@@ -0,0 +1,116 @@
+"""
+Test that the CPU budget comes from the cgroup quota and affinity mask, not
+the host's core count, and that the thread settings follow it.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.cpu_budget import (
+    BLAS_THREAD_ENV_VARS,
+    affinity_cpu_count,
+    cgroup_cpu_limit,
+    configure_blas_threads,
+    cpu_budget,
+)
+from backend.src.onnx_session import SessionConfig, build_session_options
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+def test_cgroup_v2(tmp_path):
+    proc = write(tmp_path / "proc_cgroup", "0::/\n")
+    root = tmp_path / "cgroup"
+    write(root / "cpu.max", "150000 100000\n")
+    assert cgroup_cpu_limit(root, proc) == 1.5
+
+    write(root / "cpu.max", "max 100000\n")
+    assert cgroup_cpu_limit(root, proc) is None
+
+
+def test_cgroup_v2_nested_takes_smallest(tmp_path):
+    proc = write(tmp_path / "proc_cgroup", "0::/kubepods/pod1/container\n")
+    root = tmp_path / "cgroup"
+    write(root / "kubepods" / "cpu.max", "400000 100000\n")
+    write(root / "kubepods" / "pod1" / "cpu.max", "200000 100000\n")
+    write(root / "kubepods" / "pod1" / "container" / "cpu.max", "max 100000\n")
+    assert cgroup_cpu_limit(root, proc) == 2.0
+
+
+def test_cgroup_v1(tmp_path):
+    proc = write(tmp_path / "proc_cgroup", "3:cpu,cpuacct:/docker/abc\n1:memory:/docker/abc\n")
+    root = tmp_path / "cgroup"
+    # Inside the container, the namespace root is the container's own cgroup
+    write(root / "cpu,cpuacct" / "cpu.cfs_quota_us", "50000\n")
+    write(root / "cpu,cpuacct" / "cpu.cfs_period_us", "100000\n")
+    assert cgroup_cpu_limit(root, proc) == 0.5
+
+    write(root / "cpu,cpuacct" / "cpu.cfs_quota_us", "-1\n")
+    assert cgroup_cpu_limit(root, proc) is None
+
+
+def test_no_cgroups(tmp_path):
+    assert cgroup_cpu_limit(tmp_path / "missing", tmp_path / "missing_proc") is None
+
+
+def test_budget_is_smaller_of_quota_and_affinity(tmp_path, monkeypatch):
+    monkeypatch.delenv("CPU_BUDGET", raising=False)
+    monkeypatch.setattr("backend.src.cpu_budget.affinity_cpu_count", lambda: 16)
+    proc = write(tmp_path / "proc_cgroup", "0::/\n")
+    root = tmp_path / "cgroup"
+
+    write(root / "cpu.max", "250000 100000\n")
+    budget = cpu_budget(root, proc)
+    assert (budget.cpus, budget.source, budget.cgroup_limit) == (3, "cgroup", 2.5)
+
+    write(root / "cpu.max", "3200000 100000\n")
+    budget = cpu_budget(root, proc)
+    assert (budget.cpus, budget.source) == (16, "affinity")
+
+    write(root / "cpu.max", "10000 100000\n")
+    assert cpu_budget(root, proc).cpus == 1
+
+    monkeypatch.setenv("CPU_BUDGET", "5")
+    budget = cpu_budget(root, proc)
+    assert (budget.cpus, budget.source) == (5, "env")
+
+
+def test_affinity_cpu_count():
+    assert 1 <= affinity_cpu_count() <= (os.cpu_count() or 1)
+
+
+def test_configure_blas_threads_keeps_overrides(monkeypatch):
+    for name in BLAS_THREAD_ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("MKL_NUM_THREADS", "7")
+
+    threads = configure_blas_threads(2)
+    assert threads["OMP_NUM_THREADS"] == "2"
+    assert threads["OPENBLAS_NUM_THREADS"] == "2"
+    assert threads["MKL_NUM_THREADS"] == "7"
+
+
+def test_session_threads_default_to_budget(monkeypatch):
+    monkeypatch.setenv("CPU_BUDGET", "3")
+    options = build_session_options(SessionConfig())
+    assert options.intra_op_num_threads == 3
+    # Inter-op threads multiply the intra-op ones, so they're 1 unless asked for
+    assert options.inter_op_num_threads == 1
+    assert build_session_options(SessionConfig(inter_op_threads=0)).inter_op_num_threads == 3
+
+    options = build_session_options(SessionConfig(intra_op_threads=1))
+    assert options.intra_op_num_threads == 1
+
+
+if __name__ == "__main__":
+    # These need pytest's tmp_path and monkeypatch fixtures
+    import pytest
+
+    sys.exit(pytest.main([__file__]))
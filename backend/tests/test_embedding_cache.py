@@ -0,0 +1,165 @@
+"""
+Test the LRU cache that sits in front of the text encoder.
+"""
+
+import multiprocessing
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.embedding_cache import DiskEmbeddingCache, EmbeddingCache, normalize_query
+
+
+def _embedding(value):
+    return np.full(512, value, dtype=np.float32)
+
+
+def test_normalize_query():
+    """Whitespace and case don't make a new key"""
+    assert normalize_query("  Red White\tand   BLUE\nstripes ") == "red white and blue stripes"
+    assert normalize_query("green with a star") == normalize_query("Green  with a Star")
+
+
+def test_hits_and_misses():
+    cache = EmbeddingCache(max_bytes=1024 * 1024)
+
+    assert cache.get("maple leaf") is None
+    cache.put("maple leaf", _embedding(1.0))
+    np.testing.assert_array_equal(cache.get("maple leaf"), _embedding(1.0))
+
+    stats = cache.to_dict()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_cached_embeddings_are_read_only():
+    cache = EmbeddingCache(max_bytes=1024 * 1024)
+    cache.put("maple leaf", _embedding(1.0))
+    with pytest.raises(ValueError):
+        cache.get("maple leaf")[0] = 5.0
+
+
+def test_eviction_respects_memory_bound():
+    """Least recently used entries go first, and the byte count never goes over"""
+    one_entry = EmbeddingCache._entry_bytes("query 0", _embedding(0.0))
+    cache = EmbeddingCache(max_bytes=3 * one_entry)
+
+    for i in range(3):
+        cache.put(f"query {i}", _embedding(i))
+    # Touch query 0 so query 1 is now the oldest
+    assert cache.get("query 0") is not None
+    cache.put("query 3", _embedding(3))
+
+    assert cache.get("query 1") is None
+    assert cache.get("query 0") is not None
+    assert cache.stats.evictions == 1
+    assert len(cache) == 3
+    assert cache.current_bytes <= cache.max_bytes
+
+
+def test_disabled_cache():
+    cache = EmbeddingCache(max_bytes=0)
+    cache.put("maple leaf", _embedding(1.0))
+    assert cache.get("maple leaf") is None
+    assert len(cache) == 0
+
+
+def test_disk_cache_survives_reopening(tmp_path):
+    """A new cache on the same file (a restart, or another worker) sees the old entries"""
+    path = tmp_path / "cache.sqlite"
+    cache = DiskEmbeddingCache(path, model_fingerprint="model-a")
+    cache.put_many(["maple leaf", "green with a star"], [_embedding(1.0), _embedding(2.0)])
+
+    reopened = DiskEmbeddingCache(path, model_fingerprint="model-a")
+    results = reopened.get_many(["green with a star", "not cached", "maple leaf"])
+
+    np.testing.assert_array_equal(results[0], _embedding(2.0))
+    assert results[1] is None
+    np.testing.assert_array_equal(results[2], _embedding(1.0))
+    assert reopened.stats.hits == 2
+    assert reopened.stats.misses == 1
+
+
+def test_disk_cache_invalidated_by_new_model(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    old_model = DiskEmbeddingCache(path, model_fingerprint="model-a")
+    old_model.put_many(["maple leaf"], [_embedding(1.0)])
+
+    new_model = DiskEmbeddingCache(path, model_fingerprint="model-b")
+    assert new_model.get_many(["maple leaf"]) == [None]
+    # Opening it doesn't wipe the other model's entries, a process still running it
+    # (say the int8 variant next to fp32) keeps its hits
+    np.testing.assert_array_equal(old_model.get_many(["maple leaf"])[0], _embedding(1.0))
+    assert len(new_model) == 1
+
+
+def test_disk_cache_eviction(tmp_path):
+    """Past max_entries, the least recently used entries get deleted"""
+    cache = DiskEmbeddingCache(tmp_path / "cache.sqlite", model_fingerprint="m", max_entries=10)
+    cache.TRIM_EVERY = 1
+    for i in range(15):
+        cache.put_many([f"query {i}"], [_embedding(i)])
+
+    assert len(cache) == 10
+    assert cache.get_many(["query 0"]) == [None]
+    assert cache.get_many(["query 14"])[0] is not None
+    assert cache.stats.evictions == 5
+
+
+def _write_entries(path, worker):
+    cache = DiskEmbeddingCache(path, model_fingerprint="m")
+    for i in range(50):
+        cache.put_many([f"worker {worker} query {i}"], [_embedding(worker)])
+
+
+def test_disk_cache_shared_between_processes(tmp_path):
+    """Several processes can write at once, and all of it is readable afterwards"""
+    path = tmp_path / "cache.sqlite"
+    DiskEmbeddingCache(path, model_fingerprint="m")
+
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_write_entries, args=(path, w)) for w in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    cache = DiskEmbeddingCache(path, model_fingerprint="m")
+    assert len(cache) == 200
+    np.testing.assert_array_equal(cache.get_many(["worker 3 query 49"])[0], _embedding(3))
+
+
+def _use_forked_cache(cache, parent_connection):
+    # The parent's connection came along with the fork, it mustn't be used here
+    assert cache._connection() is not parent_connection
+    cache.put_many(["from the worker"], [_embedding(1)])
+    assert cache.get_many(["from the parent"])[0] is not None
+
+
+def test_disk_cache_after_fork(tmp_path):
+    """A forked worker opens its own connection instead of sharing the parent's"""
+    cache = DiskEmbeddingCache(tmp_path / "cache.sqlite", model_fingerprint="m")
+    cache.put_many(["from the parent"], [_embedding(0)])
+
+    context = multiprocessing.get_context("fork")
+    process = context.Process(target=_use_forked_cache, args=(cache, cache._connection()))
+    process.start()
+    process.join(timeout=60)
+    assert process.exitcode == 0
+
+    np.testing.assert_array_equal(cache.get_many(["from the worker"])[0], _embedding(1))
+
+
+if __name__ == "__main__":
+    test_normalize_query()
+    test_hits_and_misses()
+    test_cached_embeddings_are_read_only()
+    test_eviction_respects_memory_bound()
+    test_disabled_cache()
+    print("🎉 All tests passed!")
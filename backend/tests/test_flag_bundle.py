@@ -0,0 +1,125 @@
+"""
+Test that a flag bundle round-trips the flags and embeddings, memory-mapped,
+and that stale or mismatched bundles are refused.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import FlagList, flaglist_from_json
+from backend.src.flag_bundle import MANIFEST_NAME, FlagBundle, write_bundle
+from backend.src.flag_index import IndexConfig, normalize_rows
+from backend.src.flag_searcher import FLAGS_FILE, FlagSearcher
+
+TOP_K = 8
+
+
+def build(directory):
+    flag_list = flaglist_from_json(FLAGS_FILE)
+    embeddings = np.load(flag_list.embeddings_filename, mmap_mode="r")
+    write_bundle(flag_list, embeddings, directory, sources={"flags": FLAGS_FILE})
+    return flag_list, embeddings
+
+
+def test_round_trip(tmp_path):
+    flag_list, embeddings = build(tmp_path)
+    bundle = FlagBundle(tmp_path)
+
+    assert len(bundle) == len(flag_list.flags)
+    assert isinstance(bundle.embeddings, np.memmap)
+    np.testing.assert_allclose(bundle.embeddings, normalize_rows(embeddings), atol=1e-6)
+    assert isinstance(bundle.metadata.fragments.data, np.memmap)
+    for i, flag in enumerate(flag_list.flags):
+        assert bundle.metadata.flag(i, score=0.5) == flag.model_copy(update={"score": 0.5})
+    scores = np.linspace(-1, 1, len(flag_list.flags))
+    indices = np.arange(len(flag_list.flags))
+    expected = FlagList(
+        flags=[
+            flag.model_copy(update={"score": score}) for flag, score in zip(flag_list.flags, scores)
+        ]
+    )
+    assert bundle.metadata.response_json(indices, scores) == expected.model_dump_json().encode()
+
+
+def test_non_ascii_and_empty_values(tmp_path):
+    flag_list = flaglist_from_json(FLAGS_FILE)
+    flag_list.flags = flag_list.flags[:3]
+    flag_list.flags[0] = flag_list.flags[0].model_copy(update={"name": "Côte d'Ivoire 🇨🇮"})
+    flag_list.flags[1] = flag_list.flags[1].model_copy(update={"wikipedia_page": ""})
+    write_bundle(flag_list, np.ones((3, 4), dtype=np.float32), tmp_path)
+
+    metadata = FlagBundle(tmp_path).metadata
+    assert metadata.value("name", 0) == "Côte d'Ivoire 🇨🇮"
+    assert metadata.value("wikipedia_page", 1) == ""
+    assert metadata.flag(2) == flag_list.flags[2].model_copy(update={"score": 0.0})
+
+
+def test_mismatches_are_refused(tmp_path):
+    flag_list = flaglist_from_json(FLAGS_FILE)
+    with pytest.raises(ValueError, match="embedding rows"):
+        write_bundle(flag_list, np.ones((3, 4), dtype=np.float32), tmp_path)
+    with pytest.raises(FileNotFoundError, match="build_flag_bundle"):
+        FlagBundle(tmp_path)
+
+    build(tmp_path)
+    manifest_path = tmp_path / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text())
+    manifest["version"] += 1
+    manifest_path.write_text(json.dumps(manifest))
+    with pytest.raises(ValueError, match="version"):
+        FlagBundle(tmp_path)
+
+
+def test_changed_source_is_refused(tmp_path):
+    flags_file = tmp_path / "flags.json"
+    flags_file.write_text(FLAGS_FILE.read_text())
+    flag_list = flaglist_from_json(flags_file)
+    embeddings = np.load(flag_list.embeddings_filename, mmap_mode="r")
+    bundle_dir = tmp_path / "bundle"
+    write_bundle(flag_list, embeddings, bundle_dir, sources={"flags": flags_file})
+    assert len(FlagBundle(bundle_dir)) == len(flag_list.flags)
+
+    flags_file.write_text(flags_file.read_text() + "\n")
+    with pytest.raises(ValueError, match="different"):
+        FlagBundle(bundle_dir)
+
+    # Without the source around, there's nothing to check against
+    flags_file.unlink()
+    assert len(FlagBundle(bundle_dir)) == len(flag_list.flags)
+
+
+def test_flag_searcher_from_bundle(tmp_path):
+    build(tmp_path)
+    from_json = FlagSearcher(top_k=TOP_K)
+    queries = ["red white and blue stripes", "green with a star"]
+    for index_config in (None, IndexConfig(kind="int8")):
+        from_bundle = FlagSearcher(top_k=TOP_K, bundle_dir=tmp_path, index_config=index_config)
+        assert from_bundle.dataset_files == FlagBundle(tmp_path).files
+        assert from_bundle.query_batch_json(queries) == [
+            result.model_dump_json().encode() for result in from_bundle.query_batch(queries)
+        ]
+        for json_result, bundle_result in zip(
+            from_json.query_batch(queries), from_bundle.query_batch(queries)
+        ):
+            assert [flag.name for flag in bundle_result.flags] == [
+                flag.name for flag in json_result.flags
+            ]
+            np.testing.assert_allclose(
+                [flag.score for flag in bundle_result.flags],
+                [flag.score for flag in json_result.flags],
+                atol=1e-5,
+            )
+
+    with pytest.raises(ValueError, match="bundle"):
+        FlagSearcher(top_k=TOP_K, bundle_dir=tmp_path, index_config=IndexConfig(kind="ivf"))
+
+
+if __name__ == "__main__":
+    # These need pytest's tmp_path fixture
+    sys.exit(pytest.main([__file__]))
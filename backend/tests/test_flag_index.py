@@ -0,0 +1,75 @@
+"""
+Test that the compact int8 / float16 indexes find nearly the same flags as
+the exact scan, with exact scores after re-ranking.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_index import CompactIndex, IndexConfig, normalize_rows
+from backend.src.flag_searcher import FlagSearcher
+from backend.tests.index_helpers import TOP_K, clustered_embeddings, recall_at_k
+
+
+def test_recall_at_8():
+    embeddings = clustered_embeddings(5000)
+    rng = np.random.default_rng(1)
+    queries = normalize_rows(
+        embeddings[rng.integers(5000, size=50)] + rng.standard_normal((50, 512))
+    )
+
+    for dtype, expected_ratio in (("int8", 4), ("float16", 2)):
+        index = CompactIndex(embeddings, dtype=dtype, candidates=64)
+        recall = recall_at_k(index, embeddings, queries)
+        print(f"{dtype}: recall@{TOP_K} {recall:.3f}, {index.nbytes / embeddings.nbytes:.2f}x size")
+        assert recall >= 0.98
+        assert index.nbytes < embeddings.nbytes / expected_ratio * 1.05
+
+
+def test_reranked_scores_are_exact():
+    embeddings = clustered_embeddings(1000, dim=64)
+    queries = normalize_rows(embeddings[:5])
+    index = CompactIndex(embeddings, dtype="int8", candidates=32)
+
+    for query, (indices, scores) in zip(queries, index.search(queries, TOP_K)):
+        np.testing.assert_allclose(scores, normalize_rows(embeddings)[indices] @ query, rtol=1e-5)
+        assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_int8_scan_close_to_exact():
+    embeddings = clustered_embeddings(500, dim=64)
+    queries = normalize_rows(embeddings[:10])
+    approximate = CompactIndex(embeddings, dtype="int8").approximate_scores(queries)
+    np.testing.assert_allclose(approximate, queries @ normalize_rows(embeddings).T, atol=0.02)
+
+
+def test_flag_searcher_with_compact_index():
+    exact = FlagSearcher(top_k=TOP_K)
+    compact = FlagSearcher(top_k=TOP_K, index_config=IndexConfig(kind="int8", candidates=32))
+    queries = ["red white and blue stripes", "green with a star", "a maple leaf"]
+
+    for exact_result, compact_result in zip(
+        exact.query_batch(queries), compact.query_batch(queries)
+    ):
+        assert [flag.name for flag in compact_result.flags] == [
+            flag.name for flag in exact_result.flags
+        ]
+        np.testing.assert_allclose(
+            [flag.score for flag in compact_result.flags],
+            [flag.score for flag in exact_result.flags],
+            atol=1e-5,
+        )
+    single = compact.query(queries[0], is_image=False)
+    assert len(single.flags) == TOP_K
+
+
+if __name__ == "__main__":
+    test_recall_at_8()
+    test_reranked_scores_are_exact()
+    test_int8_scan_close_to_exact()
+    test_flag_searcher_with_compact_index()
+    print("🎉 All tests passed!")
@@ -0,0 +1,77 @@
+"""
+Test that responses spliced from the pre-serialized flag JSON are byte for
+byte what FlagList.model_dump_json() gives.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import FlagList, flaglist_from_json
+from backend.src.flag_metadata import FlagMetadata
+from backend.src.flag_searcher import FLAGS_FILE, FlagSearcher
+
+
+def expected_json(flags, indices, scores):
+    """What the endpoint used to send: a FlagList of scored copies, serialized by pydantic"""
+    scores = np.asarray(scores).tolist()
+    return (
+        FlagList(
+            flags=[
+                flags[i].model_copy(update={"score": score}) for i, score in zip(indices, scores)
+            ]
+        )
+        .model_dump_json()
+        .encode()
+    )
+
+
+def test_response_json_is_byte_compatible():
+    flags = flaglist_from_json(FLAGS_FILE).flags
+    metadata = FlagMetadata.from_flags(flags)
+    assert len(metadata) == len(flags)
+
+    rng = np.random.default_rng(0)
+    for k in (0, 1, 8, len(flags)):
+        indices = rng.permutation(len(flags))[:k]
+        scores = rng.uniform(-1, 1, k).astype(np.float32)
+        assert metadata.response_json(indices, scores) == expected_json(flags, indices, scores)
+
+    # Scores that serialize unusually
+    scores = [1e-7, -0.0, 1.0, 1e20, float("nan"), float("inf"), -3.25]
+    indices = list(range(len(scores)))
+    assert metadata.response_json(indices, scores) == expected_json(flags, indices, scores)
+
+
+def test_escaping():
+    flags = flaglist_from_json(FLAGS_FILE).flags[:3]
+    flags[0] = flags[0].model_copy(update={"name": 'Côte d\'Ivoire "🇨🇮" \\ \n'})
+    flags[1] = flags[1].model_copy(update={"wikipedia_page": ""})
+    metadata = FlagMetadata.from_flags(flags)
+
+    assert metadata.value("name", 0) == flags[0].name
+    assert metadata.flag(1, 0.25) == flags[1].model_copy(update={"score": 0.25})
+    assert metadata.response_json([2, 0, 1], [0.5, 0.25, 0.125]) == expected_json(
+        flags, [2, 0, 1], [0.5, 0.25, 0.125]
+    )
+
+
+def test_query_batch_json_matches_query_batch():
+    searcher = FlagSearcher(top_k=8)
+    queries = ["red white and blue stripes", "green with a star", "maple leaf"]
+    for top_k in (None, 1, 20):
+        assert searcher.query_batch_json(queries, top_k=top_k) == [
+            result.model_dump_json().encode()
+            for result in searcher.query_batch(queries, top_k=top_k)
+        ]
+    assert searcher.query_batch_json([]) == []
+
+
+if __name__ == "__main__":
+    test_response_json_is_byte_compatible()
+    test_escaping()
+    test_query_batch_json_matches_query_batch()
+    print("🎉 All tests passed!")
@@ -3,10 +3,15 @@ Test script to verify that the flag searcher produces consistent embeddings.
 """
 
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pytest
+
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
+from backend.src import flag_searcher as flag_searcher_module
 from backend.src.flag_searcher import FlagSearcher
 
 
@@ -29,5 +34,113 @@ def test_flag_searcher():
         print(f"{i + 1}. {flag.name} (score: {flag.score:.4f})")
 
 
+def test_query_batch_matches_query():
+    """A padded batch gives the same flags and scores as one query at a time"""
+    # No cache, so the single queries really go through ONNX on their own
+    searcher = FlagSearcher(top_k=5, embedding_cache_bytes=0)
+    test_queries = ["american flag", "red and white stripes", "a green flag with a yellow star"]
+
+    batch_results = searcher.query_batch(test_queries)
+
+    assert len(batch_results) == len(test_queries)
+    for test_query, batch_result in zip(test_queries, batch_results):
+        single_result = searcher.query(test_query, is_image=False)
+        assert [flag.name for flag in batch_result.flags] == [
+            flag.name for flag in single_result.flags
+        ]
+        for batch_flag, single_flag in zip(batch_result.flags, single_result.flags):
+            assert abs(batch_flag.score - single_flag.score) < 1e-4
+
+
+def test_query_batch_tiles(monkeypatch):
+    """Scoring in small tiles with a custom top_k gives the same answer as one big tile"""
+    searcher = FlagSearcher(top_k=5)
+    test_queries = [f"flag number {i} with some stripes" for i in range(7)]
+    expected = searcher.query_batch(test_queries, top_k=3)
+
+    monkeypatch.setattr(flag_searcher_module, "SCORE_TILE_ROWS", 2)
+    tiled = searcher.query_batch(test_queries, top_k=3)
+
+    assert [len(result.flags) for result in tiled] == [3] * len(test_queries)
+    assert [[flag.name for flag in result.flags] for result in tiled] == [
+        [flag.name for flag in result.flags] for result in expected
+    ]
+    assert searcher.query_batch([]) == []
+
+
+def test_repeated_query_hits_cache():
+    """The same description, give or take case and whitespace, is only encoded once"""
+    searcher = FlagSearcher(top_k=5)
+
+    first = searcher.query("Red and white  stripes", is_image=False)
+    second = searcher.query("red and white stripes ", is_image=False)
+
+    assert searcher.embedding_cache.stats.misses == 1
+    assert searcher.embedding_cache.stats.hits == 1
+    assert [(flag.name, flag.score) for flag in first.flags] == [
+        (flag.name, flag.score) for flag in second.flags
+    ]
+
+
+def test_disk_cache_across_restarts(tmp_path):
+    """A fresh FlagSearcher on the same disk cache doesn't re-encode old queries"""
+    cache_path = tmp_path / "query_embeddings.sqlite"
+    first = FlagSearcher(top_k=5, disk_cache_path=cache_path)
+    before = first.query("american flag", is_image=False)
+
+    restarted = FlagSearcher(top_k=5, disk_cache_path=cache_path)
+    after = restarted.query("American  Flag", is_image=False)
+
+    assert restarted.disk_cache.stats.hits == 1
+    assert [flag.name for flag in before.flags] == [flag.name for flag in after.flags]
+
+
+def test_warmup_covers_buckets_and_skips_caches(tmp_path):
+    searcher = FlagSearcher(top_k=5, disk_cache_path=tmp_path / "query_embeddings.sqlite")
+    timings = searcher.warmup(batch_sizes=(1, 4))
+
+    assert set(timings) == {
+        f"{length}x{batch_size}"
+        for length in searcher._tokenizer.length_buckets
+        for batch_size in (1, 4)
+    }
+    assert len(searcher.embedding_cache) == 0
+    assert len(searcher.disk_cache) == 0
+
+
+def test_warmup_runs_on_every_executor_thread():
+    """IOBinding buffers are per thread, so each query thread gets its own warmup"""
+    searcher = FlagSearcher(top_k=5)
+    threads = set()
+    warmup = searcher.warmup
+
+    def recording_warmup(batch_sizes):
+        threads.add(threading.get_ident())
+        return warmup(batch_sizes)
+
+    searcher.warmup = recording_warmup
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        timings = searcher.warmup_threads(executor, 3, batch_sizes=(1,))
+
+    assert len(threads) == 3
+    assert set(timings) == {f"{length}x1" for length in searcher._tokenizer.length_buckets}
+
+
+def test_sessions_started_later():
+    """Without start_sessions, only the read-only data is loaded until start_sessions()"""
+    searcher = FlagSearcher(top_k=5, start_sessions=False)
+    assert searcher.thread_config is None
+
+    searcher.start_sessions()
+    assert searcher.thread_config["sessions"] == 1
+    assert len(searcher.query("red white blue", is_image=False).flags) == 5
+    with pytest.raises(RuntimeError):
+        searcher.start_sessions()
+
+
 if __name__ == "__main__":
     test_flag_searcher()
+    test_query_batch_matches_query()
+    test_repeated_query_hits_cache()
+    test_warmup_runs_on_every_executor_thread()
+    test_sessions_started_later()
@@ -0,0 +1,62 @@
+"""
+The server's imports stay fast and free of data-preparation packages, see
+backend/scripts/import_time_report.py for the full breakdown.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.import_time import (
+    DATA_PREP_MODULES,
+    format_report,
+    measure_imports,
+    serving_imports,
+    total_ms,
+)
+
+# About 500 ms on a single slow core, most of it FastAPI building its OpenAPI models.
+# IMPORT_TIME_BUDGET_MS raises it for slower machines.
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "1500"))
+# Import times are noisy, the best of a few runs has to fit in the budget
+N_TRIES = 3
+
+
+def test_serving_imports_are_read_from_main():
+    modules = serving_imports()
+    assert "fastapi" in modules
+    assert "backend.src.flag_searcher" in modules
+
+
+def test_no_data_prep_imports():
+    timings = measure_imports(serving_imports())
+    imported = {timing.name.split(".")[0] for timing in timings}
+    assert not imported & set(DATA_PREP_MODULES)
+    assert "backend.common.flag_download" not in {timing.name for timing in timings}
+    # The download helpers still work for the data-mining scripts, which do need requests
+    download_imports = measure_imports(["backend.common.flag_download"])
+    assert "requests" in {timing.name for timing in download_imports}
+
+
+def test_import_time_budget():
+    best_ms, report = None, ""
+    for _ in range(N_TRIES):
+        timings = measure_imports(serving_imports())
+        if best_ms is None or total_ms(timings) < best_ms:
+            best_ms, report = total_ms(timings), format_report(timings, top=10)
+        if best_ms <= IMPORT_TIME_BUDGET_MS:
+            break
+    print(report)
+    assert best_ms <= IMPORT_TIME_BUDGET_MS, (
+        f"Serving imports take {best_ms:.0f} ms, over the {IMPORT_TIME_BUDGET_MS:.0f} ms budget:\n"
+        f"{report}"
+    )
+
+
+if __name__ == "__main__":
+    test_serving_imports_are_read_from_main()
+    test_no_data_prep_imports()
+    test_import_time_budget()
+    print("🎉 All tests passed!")
@@ -0,0 +1,106 @@
+"""
+Test the IVF index: k-means clustering, recall against the exact scan (with
+and without product quantization), and saving and loading it.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import flaglist_from_json
+from backend.src.flag_index import IndexConfig, normalize_rows
+from backend.src.flag_searcher import FLAGS_FILE, FlagSearcher
+from backend.src.ivf_index import (
+    IVFIndex,
+    build_ivf_index,
+    kmeans,
+    load_ivf_index,
+    save_ivf_index,
+)
+from backend.tests.index_helpers import TOP_K, clustered_embeddings, recall_at_k
+
+# Small, well separated clusters, so a few probed lists hold the true neighbours
+CLUSTERS = {"dim": 64, "n_clusters": 20, "spread": 3.0}
+
+
+def test_kmeans_finds_separated_clusters():
+    rng = np.random.default_rng(0)
+    centers = np.array([[10.0, 0.0], [0.0, 10.0], [-10.0, -10.0]])
+    points = centers[np.repeat(np.arange(3), 50)] + rng.standard_normal((150, 2))
+    found = kmeans(points, 3, seed=1)
+    for center in centers:
+        assert np.min(np.linalg.norm(found - center, axis=-1)) < 1.0
+
+
+def test_probing_every_list_is_exact():
+    embeddings = clustered_embeddings(2000, **CLUSTERS)
+    queries = normalize_rows(embeddings[:20] + np.random.default_rng(1).standard_normal((20, 64)))
+    arrays = build_ivf_index(embeddings, n_lists=16)
+    assert arrays["offsets"][-1] == len(embeddings)
+    assert sorted(arrays["ids"].tolist()) == list(range(len(embeddings)))
+
+    index = IVFIndex(arrays, embeddings, n_probe=16)
+    assert recall_at_k(index, embeddings, queries) == 1.0
+    index.n_probe = 4
+    assert recall_at_k(index, embeddings, queries) > 0.6
+
+
+def test_pq_recall():
+    embeddings = clustered_embeddings(3000, **CLUSTERS)
+    queries = normalize_rows(embeddings[:20] + np.random.default_rng(2).standard_normal((20, 64)))
+    arrays = build_ivf_index(embeddings, n_lists=16, pq_subvectors=16)
+    assert arrays["codes"].shape == (3000, 16)
+    assert "vectors" not in arrays
+
+    index = IVFIndex(arrays, embeddings, n_probe=16, candidates=100)
+    recall = recall_at_k(index, embeddings, queries)
+    print(f"IVF-PQ recall@{TOP_K}: {recall:.3f}")
+    assert recall >= 0.9
+    assert index.nbytes < embeddings.nbytes / 4
+
+    # Re-ranked scores are the exact ones
+    indices, scores = index.search(queries[:1], TOP_K)[0]
+    np.testing.assert_allclose(scores, normalize_rows(embeddings)[indices] @ queries[0], rtol=1e-5)
+
+
+def test_save_and_load(tmp_path):
+    embeddings = clustered_embeddings(500, **CLUSTERS)
+    embeddings_file = tmp_path / "embeddings.npy"
+    np.save(embeddings_file, embeddings)
+    save_ivf_index(build_ivf_index(embeddings, n_lists=8), tmp_path / "ivf", embeddings_file)
+
+    index = load_ivf_index(tmp_path / "ivf", embeddings_file, n_probe=8)
+    queries = normalize_rows(embeddings[:5])
+    assert recall_at_k(index, embeddings, queries) == 1.0
+
+    # A different embeddings file means the index is stale
+    np.save(embeddings_file, embeddings[::-1])
+    with pytest.raises(ValueError, match="different"):
+        load_ivf_index(tmp_path / "ivf", embeddings_file)
+    with pytest.raises(FileNotFoundError):
+        load_ivf_index(tmp_path / "missing", embeddings_file)
+
+
+def test_flag_searcher_with_ivf(tmp_path):
+    embeddings_file = flaglist_from_json(FLAGS_FILE).embeddings_filename
+    embeddings = np.load(embeddings_file)
+    save_ivf_index(build_ivf_index(embeddings, n_lists=4), tmp_path, embeddings_file)
+
+    exact = FlagSearcher(top_k=TOP_K)
+    ivf = FlagSearcher(
+        top_k=TOP_K, index_config=IndexConfig(kind="ivf", n_probe=4, index_dir=tmp_path)
+    )
+    queries = ["red white and blue stripes", "green with a star"]
+    for exact_result, ivf_result in zip(exact.query_batch(queries), ivf.query_batch(queries)):
+        assert [flag.name for flag in ivf_result.flags] == [
+            flag.name for flag in exact_result.flags
+        ]
+
+
+if __name__ == "__main__":
+    # Some of these need pytest's tmp_path fixture
+    sys.exit(pytest.main([__file__]))
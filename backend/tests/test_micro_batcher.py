@@ -0,0 +1,127 @@
+"""
+Test that the micro-batcher groups overlapping queries into batches and
+hands every caller back its own result.
+"""
+
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.micro_batcher import MicroBatcher
+
+
+class EchoSearcher:
+    """Stands in for FlagSearcher: returns each query upper-cased, records batch sizes"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def query_batch(self, text_queries):
+        self.batches.append(list(text_queries))
+        time.sleep(self.delay)
+        return [text.upper() for text in text_queries]
+
+
+def _run_queries(batcher, texts):
+    async def fire_all():
+        return await asyncio.gather(*(batcher.query(text) for text in texts))
+
+    return asyncio.run(fire_all())
+
+
+def test_batches_overlapping_queries():
+    """A burst of queries gets grouped, each caller gets its own answer"""
+    searcher = EchoSearcher()
+    texts = [f"query {i}" for i in range(40)]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        batcher = MicroBatcher(searcher, executor, max_batch_size=8, max_wait_ms=20)
+        results = _run_queries(batcher, texts)
+
+    assert results == [text.upper() for text in texts]
+    assert all(len(batch) <= 8 for batch in searcher.batches)
+    assert len(searcher.batches) < len(texts)
+
+    stats = batcher.stats.to_dict()
+    assert stats["requests"] == len(texts)
+    assert stats["batches"] == len(searcher.batches)
+    assert stats["max_wait_ms"] >= 0
+
+
+def test_single_query_waits_at_most_the_window():
+    """A lone query is sent off once the window closes"""
+    searcher = EchoSearcher()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        batcher = MicroBatcher(searcher, executor, max_batch_size=8, max_wait_ms=5)
+        start = time.perf_counter()
+        assert _run_queries(batcher, ["lonely"]) == ["LONELY"]
+        elapsed = time.perf_counter() - start
+
+    assert searcher.batches == [["lonely"]]
+    assert elapsed < 1.0
+
+
+def test_errors_reach_every_caller():
+    """If the batch fails, everybody in it sees the exception"""
+
+    class BrokenSearcher:
+        def query_batch(self, text_queries):
+            raise RuntimeError("ONNX fell over")
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        batcher = MicroBatcher(BrokenSearcher(), executor, max_batch_size=4, max_wait_ms=5)
+
+        async def fire_all():
+            return await asyncio.gather(
+                *(batcher.query(text) for text in ["a", "b", "c"]), return_exceptions=True
+            )
+
+        results = asyncio.run(fire_all())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_queries_left_waiting_for_a_slot_are_dropped():
+    """With one batch at a time, a caller that leaves while queued never reaches the searcher"""
+    searcher = EchoSearcher(delay=0.1)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        batcher = MicroBatcher(
+            searcher, executor, max_batch_size=1, max_wait_ms=0, max_concurrent_batches=1
+        )
+
+        async def scenario():
+            first = asyncio.ensure_future(batcher.query("first"))
+            second = asyncio.ensure_future(batcher.query("second"))
+            await asyncio.sleep(0.02)
+            assert batcher.stats.waiting_batches == 1
+            second.cancel()
+            return await first
+
+        assert asyncio.run(scenario()) == "FIRST"
+
+    assert searcher.batches == [["first"]]
+    assert batcher.stats.to_dict()["dropped"] == 1
+
+
+def test_bad_settings():
+    with pytest.raises(ValueError):
+        MicroBatcher(EchoSearcher(), None, max_batch_size=0)
+    with pytest.raises(ValueError):
+        MicroBatcher(EchoSearcher(), None, max_wait_ms=-1)
+    with pytest.raises(ValueError):
+        MicroBatcher(EchoSearcher(), None, max_concurrent_batches=0)
+
+
+if __name__ == "__main__":
+    test_batches_overlapping_queries()
+    test_single_query_waits_at_most_the_window()
+    test_errors_reach_every_caller()
+    test_queries_left_waiting_for_a_slot_are_dropped()
+    test_bad_settings()
+    print("🎉 All tests passed!")
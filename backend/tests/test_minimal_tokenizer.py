@@ -0,0 +1,79 @@
+"""
+Test the tokenizer's truncation and length buckets.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.minimal_tokenizer import (
+    MAX_LENGTH,
+    PAD_TOKEN_ID,
+    MinimalCLIPTokenizer,
+    bucket_length,
+)
+
+START_TOKEN_ID = 49406
+LONG_TEXT = "a flag with red white and blue stripes and a big yellow star " * 20
+
+
+def test_bucket_length():
+    assert bucket_length(5) == 16
+    assert bucket_length(16) == 16
+    assert bucket_length(17) == 32
+    assert bucket_length(77) == 77
+    assert bucket_length(20, length_buckets=()) == 20
+    with pytest.raises(ValueError):
+        bucket_length(78)
+
+
+def test_long_text_truncated():
+    """Long descriptions are cut to 77 tokens and still end with end-of-text"""
+    tokenizer = MinimalCLIPTokenizer()
+    inputs = tokenizer(LONG_TEXT)
+
+    assert inputs["input_ids"].shape == (1, MAX_LENGTH)
+    assert inputs["input_ids"][0, 0] == START_TOKEN_ID
+    assert inputs["input_ids"][0, -1] == PAD_TOKEN_ID
+    assert inputs["attention_mask"].sum() == MAX_LENGTH
+
+
+def test_short_text_padded_to_bucket():
+    tokenizer = MinimalCLIPTokenizer()
+    inputs = tokenizer("maple leaf")
+
+    assert inputs["input_ids"].shape == (1, 16)
+    n_tokens = int(inputs["attention_mask"].sum())
+    assert inputs["input_ids"][0, n_tokens - 1] == PAD_TOKEN_ID  # end-of-text
+    assert (inputs["input_ids"][0, n_tokens:] == PAD_TOKEN_ID).all()
+    assert (inputs["attention_mask"][0, n_tokens:] == 0).all()
+
+
+def test_batch_grouped_by_bucket():
+    tokenizer = MinimalCLIPTokenizer()
+    texts = ["maple leaf", LONG_TEXT, "green with a star", " ".join(["stripes"] * 20)]
+
+    batches = tokenizer.tokenize_by_bucket(texts)
+
+    shapes = {tuple(rows): inputs["input_ids"].shape for rows, inputs in batches}
+    assert shapes == {(0, 2): (2, 16), (1,): (1, 77), (3,): (1, 32)}
+    # Every row shows up exactly once
+    assert sorted(row for rows, _ in batches for row in rows) == list(range(len(texts)))
+
+
+def test_no_buckets():
+    """Without buckets everything is padded to the longest text, in one batch"""
+    tokenizer = MinimalCLIPTokenizer(length_buckets=None)
+    batches = tokenizer.tokenize_by_bucket(["maple leaf", "green with a star"])
+
+    assert len(batches) == 1
+    rows, inputs = batches[0]
+    assert rows == [0, 1]
+    assert inputs["input_ids"].shape == (2, 6)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
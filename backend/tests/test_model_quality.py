@@ -0,0 +1,71 @@
+"""
+Test the accuracy gate for text encoder variants.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_searcher import normalize_rows
+from backend.src.model_quality import (
+    compare_embeddings,
+    evaluate,
+    require_passing_report,
+    save_report,
+)
+
+
+@pytest.fixture
+def embeddings():
+    rng = np.random.default_rng(0)
+    reference = normalize_rows(rng.standard_normal((20, 64)))
+    flag_embeddings = normalize_rows(rng.standard_normal((200, 64)))
+    return reference, flag_embeddings, rng
+
+
+def test_identical_models(embeddings):
+    reference, flag_embeddings, _ = embeddings
+    mean_cosine, min_cosine, overlap = compare_embeddings(
+        reference, reference, flag_embeddings, top_k=8
+    )
+    assert mean_cosine == pytest.approx(1.0)
+    assert min_cosine == pytest.approx(1.0)
+    assert overlap == 1.0
+
+
+def test_small_noise_passes_big_noise_fails(embeddings):
+    reference, flag_embeddings, rng = embeddings
+
+    close = normalize_rows(reference + 0.01 * rng.standard_normal(reference.shape))
+    report = evaluate(reference, close, flag_embeddings, 8, "close", "fp32")
+    assert report.passed
+
+    far = normalize_rows(reference + 1.0 * rng.standard_normal(reference.shape))
+    report = evaluate(reference, far, flag_embeddings, 8, "far", "fp32")
+    assert not report.passed
+
+
+def test_require_passing_report(embeddings, tmp_path):
+    reference, flag_embeddings, rng = embeddings
+    model_path = tmp_path / "clip-text-encoder-int8.onnx"
+
+    with pytest.raises(ValueError, match="No quality report"):
+        require_passing_report(model_path, "abc")
+
+    save_report(evaluate(reference, reference, flag_embeddings, 8, "abc", "fp32"), model_path)
+    assert require_passing_report(model_path, "abc").passed
+    with pytest.raises(ValueError, match="different model file"):
+        require_passing_report(model_path, "a-newer-model")
+
+    far = normalize_rows(rng.standard_normal(reference.shape))
+    save_report(evaluate(reference, far, flag_embeddings, 8, "abc", "fp32"), model_path)
+    with pytest.raises(ValueError, match="failed the quality check"):
+        require_passing_report(model_path, "abc")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
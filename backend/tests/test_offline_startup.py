@@ -0,0 +1,51 @@
+"""
+Test that the backend boots and answers a query with no network at all,
+and without ever importing transformers.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+# Runs in a fresh interpreter: cut off the network and transformers, then start the app.
+OFFLINE_BOOT = """
+import socket
+import sys
+
+def no_network(*args, **kwargs):
+    raise OSError("Network access during startup!")
+
+socket.socket.connect = no_network
+socket.create_connection = no_network
+socket.getaddrinfo = no_network
+sys.modules["transformers"] = None
+
+from backend import main
+
+main.ensure_loaded()
+flag_searcher = main.flag_searcher
+flags = flag_searcher.query("red white blue", is_image=False)
+assert len(flags.flags) == flag_searcher.top_k
+assert "huggingface_hub" not in sys.modules
+print("booted offline")
+"""
+
+
+def test_boots_offline():
+    result = subprocess.run(
+        [sys.executable, "-c", OFFLINE_BOOT],
+        cwd=PROJECT_ROOT,
+        env={"PYTHONPATH": str(PROJECT_ROOT), "HF_HUB_OFFLINE": "1", "QUERY_CACHE_PATH": ""},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "booted offline" in result.stdout
+
+
+if __name__ == "__main__":
+    test_boots_offline()
+    print("🎉 All tests passed!")
@@ -0,0 +1,90 @@
+"""
+Test the ONNX Runtime session setup: options from the config, and the
+optimized model cache.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_searcher import MODEL_PATH
+from backend.src.onnx_session import (
+    SessionConfig,
+    build_session_options,
+    cpu_fingerprint,
+    create_session,
+    optimized_model_path,
+)
+
+
+def _run(session):
+    input_ids = np.array([[49406, 736, 1579, 537, 1746, 49407]], dtype=np.int64)
+    return session.run(None, {"input_ids": input_ids, "attention_mask": np.ones_like(input_ids)})[0]
+
+
+def test_session_options():
+    config = SessionConfig(
+        graph_optimization_level="extended",
+        intra_op_threads=2,
+        inter_op_threads=1,
+        enable_cpu_mem_arena=False,
+        execution_mode="parallel",
+    )
+    options = build_session_options(config)
+
+    assert options.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    assert options.intra_op_num_threads == 2
+    assert options.inter_op_num_threads == 1
+    assert not options.enable_cpu_mem_arena
+    assert options.execution_mode == ort.ExecutionMode.ORT_PARALLEL
+
+
+def test_optimized_model_cache(tmp_path):
+    """The first session saves the optimized graph, the second loads it and agrees"""
+    config = SessionConfig(optimized_model_dir=tmp_path)
+    cached_path = optimized_model_path(MODEL_PATH, config)
+    assert not cached_path.exists()
+
+    cold = create_session(MODEL_PATH, config)
+    assert cached_path.is_file()
+    # No temporary files left lying around
+    assert list(tmp_path.iterdir()) == [cached_path]
+
+    warm = create_session(MODEL_PATH, config)
+    np.testing.assert_allclose(_run(cold), _run(warm), rtol=1e-4, atol=1e-5)
+
+
+def test_cache_name_follows_settings(tmp_path):
+    basic = optimized_model_path(
+        MODEL_PATH, SessionConfig(optimized_model_dir=tmp_path, graph_optimization_level="basic")
+    )
+    full = optimized_model_path(MODEL_PATH, SessionConfig(optimized_model_dir=tmp_path))
+    assert basic != full
+
+
+def test_cache_name_follows_cpu(tmp_path):
+    """An optimized graph from another kind of CPU isn't picked up"""
+    config = SessionConfig(optimized_model_dir=tmp_path)
+    assert cpu_fingerprint() in optimized_model_path(MODEL_PATH, config).name
+
+    cpuinfo = tmp_path / "cpuinfo"
+    fingerprints = set()
+    for flags in ("sse4_2 avx2", "sse4_2 avx2 avx512f"):
+        cpuinfo.write_text(f"processor\t: 0\nmodel name\t: Some CPU\nflags\t\t: {flags}\n")
+        fingerprints.add(cpu_fingerprint(cpuinfo))
+    assert len(fingerprints) == 2
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    test_session_options()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_optimized_model_cache(Path(tmp_dir))
+        test_cache_name_follows_settings(Path(tmp_dir))
+        test_cache_name_follows_cpu(Path(tmp_dir))
+    print("🎉 All tests passed!")
@@ -0,0 +1,74 @@
+"""
+Test that the parallel block scan finds exactly what the full scan does, and
+that its threads stay within the CPU budget.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_index import IndexConfig, ParallelExactIndex, normalize_rows, top_k_indices
+from backend.src.flag_searcher import FlagSearcher
+
+TOP_K = 8
+
+
+def test_matches_full_scan():
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((5003, 64)).astype(np.float32) * 3
+    queries = normalize_rows(rng.standard_normal((7, 64)))
+    exact_scores = queries @ normalize_rows(embeddings).T
+
+    for threads, block_rows in ((1, 1024), (3, 500), (4, 7), (8, 5003)):
+        index = ParallelExactIndex(embeddings, threads=threads, block_rows=block_rows)
+        for (indices, scores), expected in zip(index.search(queries, TOP_K), exact_scores):
+            np.testing.assert_array_equal(indices, top_k_indices(expected, TOP_K))
+            np.testing.assert_allclose(scores, expected[indices], rtol=1e-5)
+
+
+def test_fewer_rows_than_k():
+    embeddings = np.random.default_rng(1).standard_normal((5, 16)).astype(np.float32)
+    index = ParallelExactIndex(embeddings, threads=2, block_rows=2)
+    indices, scores = index.search(normalize_rows(embeddings[:1]), TOP_K)[0]
+    assert sorted(indices.tolist()) == list(range(5))
+    assert indices[0] == 0
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_flag_searcher_with_parallel_scan():
+    exact = FlagSearcher(top_k=TOP_K)
+    parallel = FlagSearcher(top_k=TOP_K, index_config=IndexConfig(kind="parallel", scan_threads=3))
+    queries = ["red white and blue stripes", "green with a star", "a maple leaf"]
+    for exact_result, parallel_result in zip(
+        exact.query_batch(queries), parallel.query_batch(queries)
+    ):
+        assert [flag.name for flag in parallel_result.flags] == [
+            flag.name for flag in exact_result.flags
+        ]
+        np.testing.assert_allclose(
+            [flag.score for flag in parallel_result.flags],
+            [flag.score for flag in exact_result.flags],
+            atol=1e-5,
+        )
+
+
+def test_default_threads_fit_the_budget(monkeypatch):
+    """Scan threads x BLAS threads stays within the CPU budget"""
+    embeddings = np.ones((10, 4), dtype=np.float32)
+    monkeypatch.setenv("CPU_BUDGET", "4")
+    monkeypatch.setenv("OMP_NUM_THREADS", "2")
+    assert ParallelExactIndex(embeddings).threads == 2
+    monkeypatch.setenv("OMP_NUM_THREADS", "1")
+    assert ParallelExactIndex(embeddings).threads == 4
+    # An explicit count is kept
+    assert ParallelExactIndex(embeddings, threads=3).threads == 3
+
+
+if __name__ == "__main__":
+    test_matches_full_scan()
+    test_fewer_rows_than_k()
+    test_flag_searcher_with_parallel_scan()
+    print("🎉 All tests passed!")
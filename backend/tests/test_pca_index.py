@@ -0,0 +1,100 @@
+"""
+Test the PCA index: the fitted components match numpy's SVD, recall holds
+up with fewer dims, and it saves and loads.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.common.flag_data import flaglist_from_json
+from backend.src.flag_index import IndexConfig, normalize_rows
+from backend.src.flag_searcher import FLAGS_FILE, FlagSearcher
+from backend.src.pca_index import PCAIndex, fit_pca, load_pca_index, save_pca_index
+from backend.tests.index_helpers import TOP_K, recall_at_k
+
+
+def low_rank_embeddings(n_rows, dim=128, rank=16, seed=0):
+    """Embeddings that mostly vary along `rank` directions, plus a little noise"""
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((rank, dim))
+    points = rng.standard_normal((n_rows, rank)) @ basis + 0.1 * rng.standard_normal((n_rows, dim))
+    return (points + 2.0).astype(np.float32)
+
+
+def test_fit_pca_matches_numpy_svd():
+    embeddings = low_rank_embeddings(500)
+    arrays = fit_pca(embeddings, 16)
+    assert arrays["components"].shape == (16, 128)
+    assert arrays["reduced"].shape == (500, 16)
+    assert float(arrays["explained_variance"]) > 0.95
+
+    normalized = normalize_rows(embeddings).astype(np.float64)
+    centered = normalized - normalized.mean(axis=0)
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    # Same subspace as the top singular vectors (signs can differ)
+    overlap = np.abs(arrays["components"] @ vt[:16].T)
+    np.testing.assert_allclose(np.linalg.svd(overlap)[1], 1.0, atol=1e-3)
+
+
+def test_recall_and_fewer_dims():
+    embeddings = low_rank_embeddings(3000)
+    rng = np.random.default_rng(1)
+    queries = normalize_rows(embeddings[:30] + 0.5 * rng.standard_normal((30, 128)))
+    arrays = fit_pca(embeddings, 32)
+
+    index = PCAIndex(arrays, embeddings, candidates=64)
+    recall = recall_at_k(index, embeddings, queries)
+    print(f"PCA-32 recall@{TOP_K}: {recall:.3f}")
+    assert recall >= 0.95
+    assert index.nbytes < embeddings.nbytes / 3
+
+    fewer = PCAIndex(arrays, embeddings, dims=16, candidates=64)
+    assert fewer.dims == 16
+    assert recall_at_k(fewer, embeddings, queries) >= 0.9
+
+    with pytest.raises(ValueError):
+        PCAIndex(arrays, embeddings, dims=64)
+
+    # Re-ranked scores are the exact ones
+    indices, scores = index.search(queries[:1], TOP_K)[0]
+    np.testing.assert_allclose(scores, normalize_rows(embeddings)[indices] @ queries[0], rtol=1e-5)
+
+
+def test_save_and_load(tmp_path):
+    embeddings = low_rank_embeddings(300)
+    embeddings_file = tmp_path / "embeddings.npy"
+    np.save(embeddings_file, embeddings)
+    save_pca_index(fit_pca(embeddings, 16), tmp_path / "pca", embeddings_file)
+
+    index = load_pca_index(tmp_path / "pca", embeddings_file, dims=8, candidates=300)
+    assert recall_at_k(index, embeddings, normalize_rows(embeddings[:5])) == 1.0
+
+    np.save(embeddings_file, embeddings[::-1])
+    with pytest.raises(ValueError, match="different"):
+        load_pca_index(tmp_path / "pca", embeddings_file)
+
+
+def test_flag_searcher_with_pca(tmp_path):
+    embeddings_file = flaglist_from_json(FLAGS_FILE).embeddings_filename
+    save_pca_index(fit_pca(np.load(embeddings_file), 32), tmp_path, embeddings_file)
+
+    exact = FlagSearcher(top_k=TOP_K)
+    pca = FlagSearcher(
+        top_k=TOP_K,
+        index_config=IndexConfig(kind="pca", pca_dims=32, candidates=205, index_dir=tmp_path),
+    )
+    queries = ["red white and blue stripes", "green with a star"]
+    for exact_result, pca_result in zip(exact.query_batch(queries), pca.query_batch(queries)):
+        assert [flag.name for flag in pca_result.flags] == [
+            flag.name for flag in exact_result.flags
+        ]
+
+
+if __name__ == "__main__":
+    # Some of these need pytest's tmp_path fixture
+    sys.exit(pytest.main([__file__]))
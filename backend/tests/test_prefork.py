@@ -0,0 +1,99 @@
+"""
+The pre-fork server: the parent loads the flags once, forks its workers,
+which all answer queries, and SIGTERM stops the lot.
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.cpu_budget import CpuBudget, worker_cpu_budget
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+WORKERS = 2
+
+SERVER = """
+from backend import main
+main.serve(main.app, {workers}, host="127.0.0.1", port={port}, preload=main.load_shared)
+"""
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid):
+    return [
+        int(stat.parent.name)
+        for stat in Path("/proc").glob("[0-9]*/stat")
+        if stat.read_text().rsplit(")", 1)[1].split()[1] == str(pid)
+    ]
+
+
+def _ready(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready") as response:
+            return response.status == 200
+    except (urllib.error.URLError, ConnectionError):
+        return False
+
+
+def test_prefork_serves_and_stops():
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVER.format(workers=WORKERS, port=port)],
+        cwd=PROJECT_ROOT,
+        env={**os.environ, "PYTHONPATH": str(PROJECT_ROOT), "QUERY_CACHE_PATH": ""},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    try:
+        deadline = time.time() + 120
+        while not _ready(port):
+            assert server.poll() is None and time.time() < deadline, server.stdout.read()
+            time.sleep(0.1)
+        assert len(_children(server.pid)) == WORKERS
+
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}/",
+            data=json.dumps({"text_query": "red white blue"}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        for _ in range(10):
+            with urllib.request.urlopen(request) as response:
+                assert len(json.loads(response.read())["flags"]) == 8
+    finally:
+        server.send_signal(signal.SIGTERM)
+        output = server.communicate(timeout=60)[0]
+
+    assert server.returncode == 0, output
+    assert output.count("Application startup complete") == WORKERS
+
+
+def test_worker_cpu_budget(monkeypatch):
+    # Set through monkeypatch, so what worker_cpu_budget exports gets undone afterwards
+    monkeypatch.setenv("CPU_BUDGET", "")
+    budget = CpuBudget(cpus=8, source="cgroup", cgroup_limit=8.0, affinity_cpus=16)
+
+    share = worker_cpu_budget(budget, 3)
+    assert share.cpus == 2
+    assert share.source == "cgroup/3"
+    assert os.environ["CPU_BUDGET"] == "2"
+    assert worker_cpu_budget(budget, 16).cpus == 1
+
+
+if __name__ == "__main__":
+    test_prefork_serves_and_stops()
+    print("🎉 All tests passed!")
@@ -0,0 +1,118 @@
+"""
+Startup runs in the background from the lifespan hook: /health and /ready
+report loading, warming and ready (or failed), and queries get a 503 until
+the server is warm.
+"""
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.readiness import Readiness
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+# Runs in a fresh interpreter, so the app really starts from scratch. load() is held
+# back until the test has looked at the "loading" state.
+LIFECYCLE = """
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from backend import main
+
+release = threading.Event()
+real_load = main.load
+
+def held_load():
+    release.wait(60)
+    if FAIL:
+        raise OSError("no model here")
+    real_load()
+
+main.load = held_load
+
+with TestClient(main.app) as client:
+    health = client.get("/health")
+    assert health.status_code == 200 and health.json()["status"] == "loading", health.text
+    assert client.get("/ready").status_code == 503
+    query = client.post("/", json={"text_query": "red white blue"})
+    assert query.status_code == 503 and query.headers["retry-after"] == "1", query.text
+    assert client.get("/metrics").json()["readiness"]["status"] == "loading"
+    release.set()
+
+    deadline = time.time() + 120
+    while client.get("/health").json()["status"] in ("loading", "warming"):
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+    if FAIL:
+        health = client.get("/health")
+        assert health.status_code == 503 and "no model here" in health.json()["error"]
+        assert client.get("/ready").status_code == 503
+    else:
+        ready = client.get("/ready")
+        assert ready.status_code == 200, ready.text
+        body = ready.json()
+        assert set(body["timings_s"]) == {"loading", "warming"}
+        assert {"16x1", "77x1"} <= set(body["warmup_s"])
+        assert client.post("/", json={"text_query": "red white blue"}).status_code == 200
+print("lifecycle ok")
+"""
+
+
+def run_lifecycle(fail):
+    return subprocess.run(
+        [sys.executable, "-c", f"FAIL = {fail}\n" + LIFECYCLE],
+        cwd=PROJECT_ROOT,
+        env={"PYTHONPATH": str(PROJECT_ROOT), "QUERY_CACHE_PATH": ""},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_lifecycle(fail):
+    result = run_lifecycle(fail)
+    assert result.returncode == 0, result.stderr
+    assert "lifecycle ok" in result.stdout
+
+
+def test_phases_and_timings():
+    readiness = Readiness()
+    assert readiness.to_dict()["status"] == "loading"
+    assert not readiness.ready
+
+    time.sleep(0.01)
+    readiness.advance("warming")
+    readiness.advance("ready", warmup_s={"16x1": 0.1})
+    body = readiness.to_dict()
+    assert readiness.ready
+    assert body["status"] == "ready"
+    assert body["timings_s"]["loading"] >= 0.01
+    assert body["warmup_s"] == {"16x1": 0.1}
+    assert body["error"] is None
+
+    with pytest.raises(ValueError):
+        readiness.advance("done")
+
+
+def test_failure():
+    readiness = Readiness()
+    readiness.fail(FileNotFoundError("model.onnx"))
+    body = readiness.to_dict()
+    assert body["status"] == "failed"
+    assert body["error"] == "FileNotFoundError: model.onnx"
+    assert "loading" in body["timings_s"]
+
+
+if __name__ == "__main__":
+    # Uses pytest's parametrize
+    sys.exit(pytest.main([__file__]))
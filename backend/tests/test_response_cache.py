@@ -0,0 +1,106 @@
+"""
+Test the whole-response cache: hits, TTL, size limit, and dropping
+everything when the dataset files change.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src import response_cache as response_cache_module
+from backend.src.response_cache import ResponseCache
+
+
+@pytest.fixture
+def dataset_files(tmp_path):
+    flags_file = tmp_path / "flags.json"
+    flags_file.write_text('{"flags": []}')
+    embeddings_file = tmp_path / "embeddings.npy"
+    embeddings_file.write_bytes(b"not really numpy")
+    return [flags_file, embeddings_file]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(response_cache_module.time, "monotonic", fake_clock)
+    return fake_clock
+
+
+def test_hits_and_misses(dataset_files, clock):
+    cache = ResponseCache(dataset_files)
+
+    assert cache.get("maple leaf", 8) is None
+    cache.put("maple leaf", 8, b'{"flags":[]}')
+    assert cache.get("maple leaf", 8) == b'{"flags":[]}'
+    # A different top_k is a different response
+    assert cache.get("maple leaf", 3) is None
+
+    stats = cache.to_dict()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_ttl(dataset_files, clock):
+    cache = ResponseCache(dataset_files, ttl_s=60)
+    cache.put("maple leaf", 8, b"{}")
+
+    clock.now += 59
+    assert cache.get("maple leaf", 8) == b"{}"
+    clock.now += 2
+    assert cache.get("maple leaf", 8) is None
+    assert cache.expirations == 1
+    assert len(cache) == 0
+
+
+def test_size_limit(dataset_files, clock):
+    cache = ResponseCache(dataset_files, max_entries=2)
+    cache.put("a", 8, b"a")
+    cache.put("b", 8, b"b")
+    assert cache.get("a", 8) == b"a"
+    cache.put("c", 8, b"c")
+
+    assert cache.get("b", 8) is None
+    assert cache.get("a", 8) == b"a"
+    assert cache.evictions == 1
+
+
+def test_invalidated_when_dataset_changes(dataset_files, clock):
+    cache = ResponseCache(dataset_files, check_interval_s=1.0)
+    cache.put("maple leaf", 8, b"old")
+    old_version = cache.version
+
+    flags_file = dataset_files[0]
+    flags_file.write_text('{"flags": [], "embeddings_filename": "new.npy"}')
+    stat = flags_file.stat()
+    os.utime(flags_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    # Still within the check interval, so the old entry is served
+    assert cache.get("maple leaf", 8) == b"old"
+
+    clock.now += 2
+    assert cache.get("maple leaf", 8) is None
+    assert cache.version != old_version
+    assert cache.invalidations == 1
+
+
+def test_disabled(dataset_files, clock):
+    cache = ResponseCache(dataset_files, max_entries=0)
+    cache.put("maple leaf", 8, b"{}")
+    assert cache.get("maple leaf", 8) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
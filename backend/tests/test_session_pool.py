@@ -0,0 +1,97 @@
+"""
+Test that the session pool hands each encoder to one caller at a time, and
+that a pooled FlagSearcher gives the same results as a single session.
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_searcher import FlagSearcher
+from backend.src.onnx_session import SessionConfig
+from backend.src.session_pool import SessionPool, default_pool_size, pool_session_config
+
+
+def test_default_pool_size():
+    assert default_pool_size(1, cpu_count=8) == 8
+    assert default_pool_size(2, cpu_count=8) == 4
+    assert default_pool_size(3, cpu_count=8) == 2
+    assert default_pool_size(4, cpu_count=2) == 1
+    assert default_pool_size(0, cpu_count=4) == 4
+
+
+def test_pool_session_config():
+    assert pool_session_config(SessionConfig()).intra_op_threads == 1
+    assert pool_session_config(SessionConfig(intra_op_threads=2)).intra_op_threads == 2
+
+
+def test_one_lease_per_item():
+    pool = SessionPool(["a", "b"])
+    in_use = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def work(_):
+        with pool.lease() as item:
+            with lock:
+                overlaps.append(item in in_use)
+                in_use.append(item)
+            time.sleep(0.01)
+            with lock:
+                in_use.remove(item)
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(work, range(12)))
+
+    assert not any(overlaps)
+    stats = pool.to_dict()
+    assert stats["leases"] == 12
+    assert stats["waited"] > 0
+    assert stats["idle"] == 2
+
+
+def test_lease_returned_after_exception():
+    pool = SessionPool(["a"])
+    try:
+        with pool.lease():
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    with pool.lease() as item:
+        assert item == "a"
+
+
+def test_pooled_searcher_matches_single_session():
+    single = FlagSearcher(top_k=8, embedding_cache_bytes=0)
+    pooled = FlagSearcher(top_k=8, embedding_cache_bytes=0, session_pool_size=2)
+    assert single.session_pool is None
+    assert pooled.session_pool.size == 2
+
+    texts = [f"a flag with {i} red stripes" for i in range(20)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda text: pooled.query(text, is_image=False), texts))
+
+    for text, result in zip(texts, results):
+        expected = single.query(text, is_image=False)
+        assert [flag.name for flag in result.flags] == [flag.name for flag in expected.flags]
+        np.testing.assert_allclose(
+            [flag.score for flag in result.flags],
+            [flag.score for flag in expected.flags],
+            atol=1e-5,
+        )
+    assert pooled.session_pool.to_dict()["leases"] == len(texts)
+
+
+if __name__ == "__main__":
+    test_default_pool_size()
+    test_pool_session_config()
+    test_one_lease_per_item()
+    test_lease_returned_after_exception()
+    test_pooled_searcher_matches_single_session()
+    print("🎉 All tests passed!")
@@ -0,0 +1,142 @@
+"""
+Test that identical in-flight requests share one computation.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.single_flight import SingleFlight
+
+
+class SlowSearch:
+    """Counts how many times it actually ran"""
+
+    def __init__(self):
+        self.runs = 0
+
+    async def __call__(self, text):
+        self.runs += 1
+        await asyncio.sleep(0.05)
+        return text.upper()
+
+
+def test_identical_requests_collapse():
+    single_flight = SingleFlight()
+    search = SlowSearch()
+
+    async def fire_all():
+        return await asyncio.gather(
+            *(single_flight.run("maple leaf", lambda: search("maple leaf")) for _ in range(10))
+        )
+
+    results = asyncio.run(fire_all())
+
+    assert results == ["MAPLE LEAF"] * 10
+    assert search.runs == 1
+    assert single_flight.collapsed == 9
+    assert len(single_flight) == 0
+
+
+def test_different_keys_run_separately():
+    single_flight = SingleFlight()
+    search = SlowSearch()
+
+    async def fire_all():
+        return await asyncio.gather(
+            single_flight.run("a", lambda: search("a")),
+            single_flight.run("b", lambda: search("b")),
+            single_flight.run("a", lambda: search("a")),
+        )
+
+    assert asyncio.run(fire_all()) == ["A", "B", "A"]
+    assert search.runs == 2
+    assert single_flight.to_dict() == {
+        "calls": 2,
+        "collapsed": 1,
+        "abandoned": 0,
+        "in_flight": 0,
+    }
+
+
+def test_finished_key_runs_again():
+    """Only in-flight work is shared, a later request computes afresh"""
+    single_flight = SingleFlight()
+    search = SlowSearch()
+
+    async def one_after_another():
+        await single_flight.run("a", lambda: search("a"))
+        await single_flight.run("a", lambda: search("a"))
+
+    asyncio.run(one_after_another())
+    assert search.runs == 2
+
+
+def test_errors_reach_every_waiter():
+    single_flight = SingleFlight()
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("ONNX fell over")
+
+    async def fire_all():
+        return await asyncio.gather(
+            *(single_flight.run("a", broken) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(fire_all())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_first_caller_leaving_does_not_cancel_the_rest():
+    single_flight = SingleFlight()
+    search = SlowSearch()
+
+    async def scenario():
+        leader = asyncio.ensure_future(single_flight.run("a", lambda: search("a")))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.run("a", lambda: search("a")))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == "A"
+    assert search.runs == 1
+
+
+def test_last_caller_leaving_cancels_the_work():
+    single_flight = SingleFlight()
+    search = SlowSearch()
+    finished = []
+
+    async def slow(text):
+        result = await search(text)
+        finished.append(result)
+        return result
+
+    async def scenario():
+        callers = [
+            asyncio.ensure_future(single_flight.run("a", lambda: slow("a"))) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.1)
+        # A new caller starts fresh instead of getting the cancelled work
+        return await single_flight.run("a", lambda: slow("a"))
+
+    assert asyncio.run(scenario()) == "A"
+    assert finished == ["A"]
+    assert single_flight.abandoned == 1
+    assert len(single_flight) == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,56 @@
+"""
+Test that the precomputed search matrix and partial top-k selection give
+the same answer as the plain cosine similarity + full argsort.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from backend.src.flag_searcher import cosine_similarity, normalize_rows, top_k_indices
+
+
+def test_normalize_rows():
+    """Rows come back unit length, float32 and contiguous"""
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((50, 16)) * 10
+
+    normalized = normalize_rows(matrix)
+
+    assert normalized.dtype == np.float32
+    assert normalized.flags["C_CONTIGUOUS"]
+    np.testing.assert_allclose(np.linalg.norm(normalized, axis=-1), 1.0, rtol=1e-5)
+
+
+def test_top_k_matches_argsort():
+    """Partial selection gives the same ranking as a full argsort"""
+    rng = np.random.default_rng(1)
+    images = rng.standard_normal((500, 32))
+    query = rng.standard_normal((1, 32))
+
+    expected_scores = cosine_similarity(query, images)
+    expected = expected_scores.argsort()[0][::-1][:8]
+
+    scores = normalize_rows(images) @ normalize_rows(query)[0]
+    result = top_k_indices(scores, 8)
+
+    np.testing.assert_array_equal(result, expected)
+    np.testing.assert_allclose(scores[result], expected_scores[0, expected], rtol=1e-5)
+
+
+def test_top_k_edge_cases():
+    """k larger than the number of scores, and k of zero"""
+    scores = np.array([0.1, 0.9, 0.5], dtype=np.float32)
+
+    np.testing.assert_array_equal(top_k_indices(scores, 10), [1, 2, 0])
+    assert len(top_k_indices(scores, 0)) == 0
+
+
+if __name__ == "__main__":
+    test_normalize_rows()
+    test_top_k_matches_argsort()
+    test_top_k_edge_cases()
+    print("🎉 All tests passed!")